@@ -0,0 +1,226 @@
+"""
+Módulo de Almacenamiento de Patrones
+Backends intercambiables para los patrones calibrados por arma y perfil:
+- AlmacenJSON: el armas_config.json de siempre (releer + escribir bajo un bloqueo de archivo,
+  con un temporal único + os.replace). Sirve para pocas estaciones y pocos tiradores
+- AlmacenSQLite: una fila por (arma, tirador, perfil), carga perezosa y escrituras incrementales,
+  seguro para varias estaciones que comparten el archivo y para miles de tiradores
+Con `tirador` los patrones son propios de esa persona; sin él, los comunes del arma.
+
+Uso (importación única del JSON existente):
+    python almacenamiento.py importar armas_config.json patrones.db
+"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+ARCHIVO_CONFIG = "armas_config.json"
+PERFILES = ("PERFIL_DERECHO", "PERFIL_IZQUIERDO")
+
+
+@contextmanager
+def _bloqueo_archivo(ruta):
+    """Bloqueo exclusivo entre procesos sobre `ruta`.lock (flock en POSIX, msvcrt en Windows)"""
+    with open(f"{ruta}.lock", 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class AlmacenJSON:
+    """
+    Todos los patrones en un único JSON: {"armas": {arma: perfiles}, "tiradores": {tirador: {arma: perfiles}}}.
+    Antes de escribir se relee el archivo (bajo bloqueo) para no pisar lo que guardó otra estación
+    """
+    def __init__(self, ruta=ARCHIVO_CONFIG):
+        self.ruta = ruta
+        self.config = self._leer()
+
+    def _leer(self):
+        if os.path.exists(self.ruta):
+            try:
+                with open(self.ruta, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError):
+                return {"armas": {}}
+        return {"armas": {}}
+
+    def _armas(self, config, tirador):
+        if tirador is None:
+            return config.setdefault("armas", {})
+        return config.setdefault("tiradores", {}).setdefault(tirador, {})
+
+    def _escribir(self, modificar, tirador=None):
+        # Releer -> modificar solo lo nuestro -> reemplazo atómico, todo bajo el bloqueo
+        with _bloqueo_archivo(self.ruta):
+            self.config = self._leer()
+            modificar(self._armas(self.config, tirador))
+            carpeta = os.path.dirname(os.path.abspath(self.ruta))
+            descriptor, temporal = tempfile.mkstemp(dir=carpeta, prefix=os.path.basename(self.ruta), suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                    json.dump(self.config, f, indent=2, ensure_ascii=False)
+                os.replace(temporal, self.ruta)
+            except BaseException:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+                raise
+
+    def listar_armas(self):
+        return list(self.config.get("armas", {}).keys())
+
+    def cargar_arma(self, nombre, tirador=None):
+        if tirador is None:
+            return self.config.get("armas", {}).get(nombre)
+        return self.config.get("tiradores", {}).get(tirador, {}).get(nombre)
+
+    def guardar_arma(self, nombre, perfiles, tirador=None):
+        self._escribir(lambda armas: armas.__setitem__(nombre, {p: dict(d) for p, d in perfiles.items()}), tirador)
+
+    def guardar_perfil(self, nombre, perfil, datos, tirador=None):
+        self._escribir(lambda armas: armas.setdefault(nombre, {}).__setitem__(perfil, dict(datos)), tirador)
+
+    def cerrar(self):
+        pass
+
+
+class AlmacenSQLite:
+    """
+    Una fila por (arma, tirador, perfil); tirador '' son los patrones comunes del arma.
+    Solo se lee lo que se selecciona y solo se escribe lo que cambió
+    """
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        # La calibración puede finalizar en el hilo de inferencia (modo pipeline)
+        self._con = sqlite3.connect(ruta, timeout=10.0, check_same_thread=False)
+        with self._con:
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute("""CREATE TABLE IF NOT EXISTS armas (
+                id INTEGER PRIMARY KEY, nombre TEXT NOT NULL UNIQUE, creado REAL NOT NULL)""")
+            columnas = [fila[1] for fila in self._con.execute("PRAGMA table_info(patrones)")]
+            if columnas and "tirador" not in columnas:
+                # Bases de antes de los patrones por tirador: lo guardado pasa a ser el patrón común
+                self._con.execute("ALTER TABLE patrones RENAME TO patrones_anterior")
+            self._con.execute("""CREATE TABLE IF NOT EXISTS patrones (
+                arma_id INTEGER NOT NULL REFERENCES armas(id), tirador TEXT NOT NULL DEFAULT '',
+                perfil TEXT NOT NULL, datos TEXT NOT NULL, actualizado REAL NOT NULL,
+                PRIMARY KEY (arma_id, tirador, perfil))""")
+            if columnas and "tirador" not in columnas:
+                self._con.execute("""INSERT INTO patrones (arma_id, tirador, perfil, datos, actualizado)
+                                     SELECT arma_id, '', perfil, datos, actualizado FROM patrones_anterior""")
+                self._con.execute("DROP TABLE patrones_anterior")
+            self._con.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)")
+
+    def _id_arma(self, nombre):
+        self._con.execute("INSERT OR IGNORE INTO armas (nombre, creado) VALUES (?, ?)", (nombre, time.time()))
+        return self._con.execute("SELECT id FROM armas WHERE nombre = ?", (nombre,)).fetchone()[0]
+
+    def _guardar(self, arma_id, perfil, datos, tirador=None):
+        self._con.execute(
+            """INSERT INTO patrones (arma_id, tirador, perfil, datos, actualizado) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(arma_id, tirador, perfil) DO UPDATE SET datos = excluded.datos,
+               actualizado = excluded.actualizado""",
+            (arma_id, tirador or "", perfil, json.dumps(datos, ensure_ascii=False), time.time()))
+
+    def listar_armas(self):
+        with self._lock:
+            return [fila[0] for fila in self._con.execute("SELECT nombre FROM armas ORDER BY id")]
+
+    def cargar_arma(self, nombre, tirador=None):
+        with self._lock:
+            filas = self._con.execute(
+                """SELECT p.perfil, p.datos FROM patrones p JOIN armas a ON a.id = p.arma_id
+                   WHERE a.nombre = ? AND p.tirador = ?""", (nombre, tirador or "")).fetchall()
+        if not filas:
+            return None
+        return {perfil: json.loads(datos) for perfil, datos in filas}
+
+    def guardar_arma(self, nombre, perfiles, tirador=None):
+        with self._lock, self._con:
+            arma_id = self._id_arma(nombre)
+            for perfil, datos in perfiles.items():
+                self._guardar(arma_id, perfil, datos, tirador)
+
+    def guardar_perfil(self, nombre, perfil, datos, tirador=None):
+        with self._lock, self._con:
+            self._guardar(self._id_arma(nombre), perfil, datos, tirador)
+
+    def importar_json(self, ruta_json=ARCHIVO_CONFIG, forzar=False):
+        """Importa un armas_config.json una sola vez (no pisa armas que ya existan). Devuelve cuántas importó"""
+        clave = f"importado:{os.path.abspath(ruta_json)}"
+        with self._lock:
+            ya_importado = self._con.execute("SELECT 1 FROM meta WHERE clave = ?", (clave,)).fetchone()
+        if (ya_importado and not forzar) or not os.path.exists(ruta_json):
+            return 0
+
+        config = AlmacenJSON(ruta_json).config
+        armas = config.get("armas", {})
+        importadas = 0
+        with self._lock, self._con:
+            existentes = set(fila[0] for fila in self._con.execute("SELECT nombre FROM armas"))
+            for nombre, perfiles in armas.items():
+                if nombre in existentes: continue
+                arma_id = self._id_arma(nombre)
+                for perfil, datos in perfiles.items():
+                    self._guardar(arma_id, perfil, datos)
+                importadas += 1
+            for tirador, armas_tirador in config.get("tiradores", {}).items():
+                for nombre, perfiles in armas_tirador.items():
+                    if nombre in existentes: continue
+                    arma_id = self._id_arma(nombre)
+                    for perfil, datos in perfiles.items():
+                        self._guardar(arma_id, perfil, datos, tirador)
+            self._con.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", (clave, str(time.time())))
+        return importadas
+
+    def cerrar(self):
+        with self._lock:
+            self._con.close()
+
+
+def crear_almacen(ruta=ARCHIVO_CONFIG):
+    """Elige el backend por extensión: .db/.sqlite -> SQLite (importando el JSON la primera vez), si no JSON"""
+    if ruta.endswith((".db", ".sqlite", ".sqlite3")):
+        almacen = AlmacenSQLite(ruta)
+        importadas = almacen.importar_json(ARCHIVO_CONFIG)
+        if importadas:
+            print(f"Importadas {importadas} armas de {ARCHIVO_CONFIG} a {ruta}")
+        return almacen
+    return AlmacenJSON(ruta)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Herramientas del almacén de patrones")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    importar = sub.add_parser("importar", help="Importa un armas_config.json a una base SQLite")
+    importar.add_argument("json")
+    importar.add_argument("db")
+    importar.add_argument("--forzar", action="store_true", help="Reimportar aunque ya se haya hecho")
+    args = parser.parse_args()
+
+    if args.comando == "importar":
+        almacen = AlmacenSQLite(args.db)
+        print(f"Importadas {almacen.importar_json(args.json, forzar=args.forzar)} armas a {args.db}")
+        almacen.cerrar()
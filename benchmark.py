@@ -0,0 +1,424 @@
+"""
+Benchmarks del Pipeline Biométrico
+Mide throughput y latencia (p50/p99) de cada etapa sin cámara ni GPU, con
+keypoints sintéticos (o grabados) y un video de prueba, y guarda el resultado
+en JSON para comparar entre commits.
+
+Uso:
+    python benchmark.py --salida bench_base.json
+    python benchmark.py --salida bench_nuevo.json --comparar bench_base.json
+    python benchmark.py --keypoints sesion.npz --video prueba.mp4 --modelo yolo26n-pose.pt
+    python benchmark.py --modelo yolo26n-pose.onnx --tam-entrada 480 --hilos 4
+    python benchmark.py --verificar 200000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+
+import cv2
+import numpy as np
+
+from calculos import (ANGULOS, ANGULOS_OPCIONALES, ANGULOS_PRINCIPALES, detectar_orientacion, extraer_angulos,
+                      extraer_angulos_lote, angulos_a_dict, evaluar_postura, evaluar_postura_lote, estados_a_colores,
+                      PatronesCompilados, SuavizadorTemporal)
+from calibracion import GestorCalbracion
+from inferencia import crear_backend
+import ui
+
+# Esqueleto base de perfil derecho (COCO), en píxeles de un frame 640x480
+_ESQUELETO_BASE = {
+    0: (300, 100), 5: (310, 150), 6: (320, 150), 7: (360, 200), 8: (380, 190), 9: (420, 180), 10: (450, 170),
+    11: (300, 300), 12: (305, 300), 13: (310, 380), 14: (315, 380), 15: (300, 460), 16: (305, 460),
+}
+
+PATRON_REFERENCIA = {
+    "calibrado": True, "brazo": 130, "brazo_std": 3.0, "torso": 166, "torso_std": 2.5,
+    "codo_hombro_cadera": 61, "codo_hombro_cadera_std": 2.0, "brazo_soporte": 117, "brazo_soporte_std": 4.0,
+    "rodilla": 165, "rodilla_std": 3.5, "cabeza": 152, "cabeza_std": 3.5,
+}
+
+
+def generar_keypoints(n, semilla=0):
+    """Secuencia sintética (n,17,2)/(n,17) de un tirador de perfil con balanceo lento y jitter"""
+    rng = np.random.default_rng(semilla)
+    base = np.zeros((17, 2), np.float32)
+    for i, punto in _ESQUELETO_BASE.items():
+        base[i] = punto
+    t = np.arange(n, dtype=np.float32)[:, None, None]
+    kps = base[None] + 6 * np.sin(t / 20.0) + rng.normal(0, 2, (n, 17, 2)).astype(np.float32)
+    confs = np.clip(rng.normal(0.85, 0.08, (n, 17)), 0, 1).astype(np.float32)
+    # El lado lejano a la cámara se ve peor (es lo que usa detectar_orientacion)
+    confs[:, [5, 7, 11]] *= 0.6
+    return kps.astype(np.float32), confs
+
+
+def cargar_keypoints(ruta):
+    """Carga keypoints grabados de un .npz con arrays 'kp' (N,17,2) y 'conf' (N,17)"""
+    datos = np.load(ruta)
+    return datos["kp"].astype(np.float32), datos["conf"].astype(np.float32)
+
+
+def generar_video(ruta, kps, tam=(640, 480), fps=30):
+    """Video de prueba: el esqueleto de la secuencia dibujado sobre fondo gris"""
+    escritor = cv2.VideoWriter(ruta, cv2.VideoWriter_fourcc(*"MJPG"), fps, tam)
+    for kp in kps:
+        frame = np.full((tam[1], tam[0], 3), 90, np.uint8)
+        for x, y in kp.astype(int):
+            cv2.circle(frame, (int(x), int(y)), 6, (230, 230, 230), -1)
+        escritor.write(frame)
+    escritor.release()
+    return ruta
+
+
+def medir(funcion, iteraciones, calentamiento=10, preparar=None, items=1):
+    """Ejecuta `funcion` y devuelve throughput (items/s) y latencias por llamada en microsegundos"""
+    for i in range(calentamiento):
+        if preparar: preparar(i)
+        funcion(i)
+    tiempos = np.empty(iteraciones, dtype=np.float64)
+    for i in range(iteraciones):
+        if preparar: preparar(i)
+        inicio = time.perf_counter_ns()
+        funcion(i)
+        tiempos[i] = time.perf_counter_ns() - inicio
+    tiempos /= 1000.0
+    total_s = tiempos.sum() / 1e6
+    return {
+        "iteraciones": iteraciones,
+        "throughput_s": round(iteraciones * items / total_s, 1) if total_s > 0 else None,
+        "media_us": round(float(tiempos.mean()), 2),
+        "p50_us": round(float(np.percentile(tiempos, 50)), 2),
+        "p99_us": round(float(np.percentile(tiempos, 99)), 2),
+    }
+
+
+def bench_calculos(kps, confs, iteraciones):
+    n = len(kps)
+    orientaciones = [detectar_orientacion(kp, conf) for kp, conf in zip(kps, confs)]
+    angulos = [extraer_angulos(kps[i], orientaciones[i], confs[i]) for i in range(n)]
+    resultados = {}
+
+    resultados["detectar_orientacion"] = medir(lambda i: detectar_orientacion(kps[i % n], confs[i % n]), iteraciones)
+    resultados["extraer_angulos"] = medir(
+        lambda i: extraer_angulos(kps[i % n], orientaciones[i % n], confs[i % n]), iteraciones)
+    lote = min(n, 256)
+    resultados[f"extraer_angulos_lote[{lote}]"] = medir(
+        lambda i: extraer_angulos_lote(kps[:lote], confs[:lote], orientaciones[:lote]),
+        max(10, iteraciones // 50), items=lote)
+    resultados["evaluar_postura"] = medir(lambda i: evaluar_postura(angulos[i % n], PATRON_REFERENCIA), iteraciones)
+    compilados = PatronesCompilados([PATRON_REFERENCIA])
+    resultados["evaluar_postura[compilado]"] = medir(lambda i: compilados.evaluar(angulos[i % n]), iteraciones)
+    # N frames x M patrones (p. ej. todas las armas del catálogo) en una sola llamada
+    filas = extraer_angulos_lote(kps[:lote], confs[:lote], orientaciones[:lote])
+    catalogo = PatronesCompilados([PATRON_REFERENCIA] * 16)
+    resultados[f"evaluar_postura_lote[{lote}x16]"] = medir(
+        lambda i: evaluar_postura_lote(filas, catalogo), max(10, iteraciones // 50), items=lote * 16)
+
+    for modo in SuavizadorTemporal.MODOS:
+        for ventana in (5, 30) if modo == "promedio" else (5,):
+            suavizador = SuavizadorTemporal(ventana=ventana, modo=modo)
+
+            def paso(i, s=suavizador):
+                s.actualizar(kps[i % n], confs[i % n], i / 30.0)
+                s.obtener_suavizado()
+            resultados[f"suavizador[{modo},{ventana}]"] = medir(paso, iteraciones)
+    return resultados, orientaciones, angulos
+
+
+def bench_calibracion(orientaciones, angulos, iteraciones):
+    gestor = GestorCalbracion()
+    gestor.arma_actual = None  # no escribir en disco durante el benchmark
+    # 5 s de calibración a 30 FPS
+    muestras = [a for a, o in zip(angulos, orientaciones) if o == "PERFIL_DERECHO"][:150]
+    muestras = (muestras * (150 // max(1, len(muestras)) + 1))[:150]
+
+    def preparar(i):
+        gestor.iniciar_calibracion("PERFIL_DERECHO")
+        for m in muestras:
+            gestor.agregar_muestra(m)
+    return {"finalizar_calibracion[150]": medir(lambda i: gestor.finalizar_calibracion(),
+                                                max(10, iteraciones // 20), preparar=preparar)}
+
+
+def bench_ui(kps, iteraciones):
+    resultados = {}
+    colores = evaluar_postura(extraer_angulos(kps[0], "PERFIL_DERECHO", np.ones(17)), PATRON_REFERENCIA)
+    patrones = {"PERFIL_DERECHO": {"calibrado": True}, "PERFIL_IZQUIERDO": {"calibrado": False}}
+    for alto, ancho in ((480, 640), (1080, 1920)):
+        frame = np.zeros((alto, ancho, 3), np.uint8)
+        tam = f"{ancho}x{alto}"
+        resultados[f"frame.copy[{tam}]"] = medir(lambda i: frame.copy(), iteraciones)
+        resultados[f"ui.dibujar_hud[{tam}]"] = medir(
+            lambda i: ui.dibujar_hud(frame, "PERFIL_DERECHO", patrones, "pistola"), iteraciones)
+        resultados[f"ui.dibujar_boton_nuevo_patron[{tam}]"] = medir(
+            lambda i: ui.dibujar_boton_nuevo_patron(frame, True), iteraciones)
+        resultados[f"ui.dibujar_cuerpo[{tam}]"] = medir(
+            lambda i: ui.dibujar_cuerpo(frame, kps[i % len(kps)], "PERFIL_DERECHO", colores), iteraciones)
+        resultados[f"ui.dibujar_score[{tam}]"] = medir(lambda i: ui.dibujar_score(frame, 87), iteraciones)
+        capa = ui.CapaHUD()
+
+        def hud_cacheado(i):
+            salida = capa.preparar(frame)
+            capa.hud(salida, "PERFIL_DERECHO", patrones, "pistola")
+            capa.boton_nuevo_patron(salida, True)
+            capa.score(salida, 87)
+        resultados[f"ui.capa_hud[{tam}]"] = medir(hud_cacheado, iteraciones)
+
+    # Menú con miles de armas: filtrar por prefijo (escribir + borrar) y redibujar
+    menu = ui.MenuArmas("benchmark", [f"arma_{i:05d}" for i in range(5000)])
+
+    def filtrar(i):
+        for letra in f"arma_{i % 5000:05d}"[:7]:
+            menu.agregar_letra(letra)
+        menu.dibujar()
+        menu.limpiar_filtro()
+    resultados["ui.menu_filtrar[5000]"] = medir(filtrar, iteraciones)
+    resultados["ui.menu_dibujar[5000]"] = medir(lambda i: (menu._desplazar(1), menu.dibujar()), iteraciones)
+    return resultados
+
+
+def bench_procesar_frame(kps, confs, ruta_video, modelo_path, iteraciones, tam_entrada=640, hilos=None):
+    """procesar_frame de punta a punta sobre el video de prueba (con el modelo real si se indica)"""
+    try:
+        from poses import MotorBiometrico
+    except ImportError as e:
+        return {"procesar_frame": {"omitido": f"no se pudo importar poses: {e}"}}
+
+    cap = cv2.VideoCapture(ruta_video)
+    frames = []
+    while len(frames) < len(kps):
+        exito, frame = cap.read()
+        if not exito: break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        return {"procesar_frame": {"omitido": f"no se pudo leer {ruta_video}"}}
+
+    resultados = {}
+    motor = MotorBiometrico(modelo_path=None, fuente=None, mostrar=False)
+    motor.gestor.patrones["PERFIL_DERECHO"] = dict(PATRON_REFERENCIA)
+    cajas = np.array([[250.0, 80.0, 470.0, 470.0]], np.float32)
+    # Sin modelo: se reproducen los keypoints de la secuencia para medir todo menos la inferencia
+    indice = [0]
+    motor.inferir = lambda frame: (kps[indice[0] % len(kps)][None], confs[indice[0] % len(kps)][None], cajas)
+
+    def paso(i):
+        indice[0] = i
+        motor.procesar_frame(frames[i % len(frames)])
+    resultados["procesar_frame[sin_modelo]"] = medir(paso, iteraciones)
+
+    # Keyframes cada 5 frames: el resto se propaga con flujo óptico sobre el video de prueba
+    motor_kf = MotorBiometrico(modelo_path=None, fuente=None, mostrar=False, intervalo_keyframe=5)
+    motor_kf.gestor.patrones["PERFIL_DERECHO"] = dict(PATRON_REFERENCIA)
+    motor_kf.inferir_modelo = motor.inferir
+
+    def paso_kf(i):
+        indice[0] = i
+        motor_kf.procesar_frame(frames[i % len(frames)])
+    resultados["procesar_frame[sin_modelo,keyframe5]"] = medir(paso_kf, iteraciones)
+    resultados["procesar_frame[sin_modelo,keyframe5]"]["proporcion_inferencias"] = round(
+        motor_kf.propagador.proporcion_inferencias(), 3)
+
+    # Postura quieta (jitter < 1 px): con umbral de reuso se saltean orientación, ángulos y score
+    rng = np.random.default_rng(0)
+    quietos = kps[0][None] + rng.normal(0, 0.3, (64,) + kps[0].shape)
+    for nombre, umbral in (("quieto", 0.0), ("quieto,reuso1px", 1.0)):
+        motor_q = MotorBiometrico(modelo_path=None, fuente=None, mostrar=False, orientacion_estable=bool(umbral),
+                                  umbral_reuso=umbral)
+        motor_q.gestor.patrones["PERFIL_DERECHO"] = dict(PATRON_REFERENCIA)
+        motor_q.inferir = lambda frame: (quietos[indice[0] % len(quietos)][None], confs[0][None], cajas)
+
+        def paso_q(i, motor_q=motor_q):
+            indice[0] = i
+            motor_q.procesar_frame(frames[i % len(frames)])
+        resultados[f"procesar_frame[sin_modelo,{nombre}]"] = medir(paso_q, iteraciones)
+        contadores = motor_q.evaluador.contadores
+        if contadores["frames"]:
+            resultados[f"procesar_frame[sin_modelo,{nombre}]"]["proporcion_reusada"] = round(
+                contadores["angulos_reusados"] / contadores["frames"], 3)
+
+    if modelo_path:
+        nombre = f"{os.path.basename(modelo_path)},{tam_entrada}"
+        # Arranque en frío: carga del modelo + primer frame, que es lo que ahorra el calentamiento
+        resultados[f"inferencia.arranque[{nombre}]"] = medir(
+            lambda i: crear_backend(modelo_path, tam_entrada, hilos).inferir(frames[0]), 1, calentamiento=0)
+        motor_ia = MotorBiometrico(modelo_path=modelo_path, fuente=None, mostrar=False, tam_entrada=tam_entrada,
+                                   hilos=hilos)
+        motor_ia.gestor.patrones["PERFIL_DERECHO"] = dict(PATRON_REFERENCIA)
+        resultados[f"inferencia[{nombre}]"] = medir(
+            lambda i: motor_ia.modelo.inferir(frames[i % len(frames)]), max(10, iteraciones // 100), calentamiento=3)
+        resultados["procesar_frame[modelo]"] = medir(
+            lambda i: motor_ia.procesar_frame(frames[i % len(frames)]), max(10, iteraciones // 100), calentamiento=3)
+    return resultados
+
+
+# --- Verificación: las versiones en lote deben dar exactamente lo mismo que las escalares ---
+
+ORIENTACIONES_VERIFICACION = np.array(["PERFIL_DERECHO", "PERFIL_IZQUIERDO", "DESCONOCIDO"])
+# Confianzas justo en los umbrales (0.15 y 0.3, también escalados por factor_umbral) y alrededor
+CONFIANZAS_BORDE = np.array([0.0, 0.1, 0.105, 0.1275, 0.15, 0.2, 0.21, 0.255, 0.3, 0.30001, 0.5, 1.0], np.float32)
+FACTORES_UMBRAL = (1.0, 0.85, 0.7)
+
+
+def _keypoints_aleatorios(n, rng):
+    """Esqueletos al azar: continuos, en píxeles enteros y con puntos repetidos (ángulos degenerados)"""
+    kps = rng.uniform(0, 640, (n, 17, 2)).astype(np.float32)
+    enteros = rng.random(n) < 0.3
+    kps[enteros] = np.round(kps[enteros])
+    filas, columnas = np.nonzero(rng.random((n, 17)) < 0.05)
+    kps[filas, columnas] = kps[filas, rng.integers(0, 17, len(filas))]
+    confs = rng.random((n, 17)).astype(np.float32)
+    borde = rng.random((n, 17)) < 0.5
+    confs[borde] = rng.choice(CONFIANZAS_BORDE, borde.sum())
+    return kps, confs
+
+
+def verificar_angulos(n, rng, bloque=5000):
+    """extraer_angulos_lote (con y sin confianzas, cada factor_umbral) contra extraer_angulos. Devuelve diferencias"""
+    diferencias = []
+    for inicio in range(0, n, bloque):
+        m = min(bloque, n - inicio)
+        kps, confs = _keypoints_aleatorios(m, rng)
+        orientaciones = rng.choice(ORIENTACIONES_VERIFICACION, m)
+        for factor in FACTORES_UMBRAL:
+            for conf_lote in (confs, None):
+                lote = extraer_angulos_lote(kps, conf_lote, orientaciones, factor)
+                for i in range(m):
+                    esperado = extraer_angulos(kps[i], orientaciones[i], None if conf_lote is None else confs[i], factor)
+                    obtenido = angulos_a_dict(lote[i])
+                    if obtenido != esperado:
+                        diferencias.append(("extraer_angulos_lote", str(orientaciones[i]), factor, esperado, obtenido))
+    return diferencias
+
+
+def _patron_aleatorio(rng):
+    """Patrón con desvíos nulos, chicos o ausentes y opcionales sin calibrar"""
+    patron = {"calibrado": bool(rng.random() < 0.8)}
+    for key in ANGULOS:
+        opcional = key in ANGULOS_OPCIONALES
+        patron[key] = None if opcional and rng.random() < 0.3 else int(rng.integers(0, 181))
+        patron[f"{key}_std"] = rng.choice([None, 0, 0.5, round(float(rng.uniform(0, 10)), 1)])
+        if patron[key] is None:
+            patron[f"{key}_std"] = None
+    return patron
+
+
+def verificar_puntajes(n, rng, patrones_por_bloque=8, bloque=2000):
+    """PatronesCompilados.evaluar y evaluar_postura_lote contra evaluar_postura (N frames x M patrones)"""
+    diferencias = []
+    for inicio in range(0, n, bloque):
+        m = min(bloque, n - inicio)
+        patrones = [_patron_aleatorio(rng) for _ in range(patrones_por_bloque)]
+        compilados = PatronesCompilados(patrones)
+        filas = []
+        for _ in range(m):
+            angulos = {key: int(rng.integers(0, 181)) for key in ANGULOS_PRINCIPALES}
+            angulos.update({key: None if rng.random() < 0.3 else int(rng.integers(0, 181)) for key in ANGULOS_OPCIONALES})
+            filas.append(angulos)
+        matriz = np.array([[np.nan if a[key] is None else a[key] for key in ANGULOS] for a in filas])
+        scores, estados = evaluar_postura_lote(matriz, compilados)
+        for i, angulos in enumerate(filas):
+            for j, patron in enumerate(patrones):
+                esperado = evaluar_postura(angulos, patron)
+                compilado = compilados.evaluar(angulos, j)
+                # Mismo contenido y mismo orden de claves que la versión escalar
+                if list(compilado.items()) != list(esperado.items()):
+                    diferencias.append(("PatronesCompilados.evaluar", angulos, patron, esperado, compilado))
+                lote = estados_a_colores(estados[i, j], scores[i, j])
+                if lote != esperado:
+                    diferencias.append(("evaluar_postura_lote", angulos, patron, esperado, lote))
+    return diferencias
+
+
+def verificar(n, semilla=0):
+    rng = np.random.default_rng(semilla)
+    diferencias = verificar_angulos(n, rng) + verificar_puntajes(n, rng)
+    for nombre, *detalle in diferencias[:10]:
+        print(f"[ERROR] {nombre}: {detalle}")
+    print(f"Verificación de {n} casos: {len(diferencias)} diferencias")
+    return not diferencias
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def ejecutar(args):
+    if args.keypoints:
+        kps, confs = cargar_keypoints(args.keypoints)
+    else:
+        kps, confs = generar_keypoints(args.frames)
+
+    resultados = {}
+    parcial, orientaciones, angulos = bench_calculos(kps, confs, args.iteraciones)
+    resultados.update(parcial)
+    resultados.update(bench_calibracion(orientaciones, angulos, args.iteraciones))
+    resultados.update(bench_ui(kps, args.iteraciones))
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta_video = args.video or generar_video(os.path.join(carpeta, "prueba.avi"), kps[:120])
+        resultados.update(bench_procesar_frame(kps, confs, ruta_video, args.modelo, args.iteraciones,
+                                                 args.tam_entrada, args.hilos))
+
+    return {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _commit_actual(),
+        "plataforma": platform.platform(),
+        "procesador": platform.processor() or platform.machine(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "fixture": args.keypoints or f"sintetico[{args.frames}]",
+        "resultados": resultados,
+    }
+
+
+def imprimir(informe, base=None):
+    print(f"{'etapa':45s} {'throughput/s':>14s} {'p50 us':>10s} {'p99 us':>10s}" + ("   vs base p50" if base else ""))
+    for nombre, r in informe["resultados"].items():
+        if "omitido" in r:
+            print(f"{nombre:45s} omitido: {r['omitido']}")
+            continue
+        linea = f"{nombre:45s} {r['throughput_s']:>14,.0f} {r['p50_us']:>10.1f} {r['p99_us']:>10.1f}"
+        anterior = (base or {}).get("resultados", {}).get(nombre)
+        if anterior and anterior.get("p50_us"):
+            linea += f"   x{r['p50_us'] / anterior['p50_us']:.2f}"
+        print(linea)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline biométrico (sin cámara ni GPU)")
+    parser.add_argument("--salida", default="bench_resultados.json", help="Archivo JSON de resultados")
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--iteraciones", type=int, default=2000)
+    parser.add_argument("--frames", type=int, default=600, help="Largo de la secuencia sintética")
+    parser.add_argument("--keypoints", default=None, help=".npz grabado con arrays 'kp' y 'conf'")
+    parser.add_argument("--video", default=None, help="Video de prueba (por defecto se genera uno sintético)")
+    parser.add_argument("--modelo", default=None, help="Modelo (.pt u .onnx) para medir procesar_frame con inferencia real")
+    parser.add_argument("--tam-entrada", type=int, default=640, help="Lado de la imagen que ve el modelo")
+    parser.add_argument("--hilos", type=int, default=None, help="Hilos de CPU para la inferencia")
+    parser.add_argument("--verificar", type=int, nargs="?", const=20000, default=None, metavar="N",
+                        help="En vez de medir, compara las funciones en lote con las escalares sobre N casos al azar")
+    args = parser.parse_args()
+
+    if args.verificar:
+        sys.exit(0 if verificar(args.verificar) else 1)
+
+    informe = ejecutar(args)
+    base = None
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+    imprimir(informe, base)
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {args.salida}")
@@ -3,8 +3,8 @@ Módulo de Operaciones Matemáticas y Cálculos
 Contiene todas las funciones de cálculo de ángulos y detección de orientación
 """
 import math
+import time
 import numpy as np
-from collections import deque
 
 # Índices COCO
 NARIZ = 0
@@ -15,24 +15,130 @@ CAD_I, CAD_D = 11, 12
 ROD_I, ROD_D = 13, 14
 TOB_I, TOB_D = 15, 16
 
+class FiltroOneEuro:
+    """
+    Filtro One-Euro (Casiez et al. 2012) vectorizado sobre todos los keypoints.
+    En reposo filtra fuerte (corte = min_cutoff) y con movimiento rápido sube el corte
+    (min_cutoff + beta * velocidad) para no arrastrar lag. Con beta=0 es un filtro exponencial.
+    """
+    def __init__(self, min_cutoff=1.0, beta=0.05, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.limpiar()
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def actualizar(self, kp, conf, t):
+        if self._kp is None or self._kp.shape != kp.shape:
+            self._kp = kp.astype(np.float64)
+            self._conf = conf.astype(np.float64)
+            self._dkp = np.zeros_like(self._kp)
+            self._t = t
+            return
+        dt = max(t - self._t, 1e-6)
+        self._t = t
+
+        # Velocidad filtrada (px/s) -> corte adaptativo por coordenada
+        velocidad = (kp - self._kp) / dt
+        self._dkp += self._alpha(self.d_cutoff, dt) * (velocidad - self._dkp)
+        cutoff = self.min_cutoff + self.beta * np.abs(self._dkp)
+        alpha = 1.0 / (1.0 + 1.0 / (2 * math.pi * cutoff * dt))
+        self._kp += alpha * (kp - self._kp)
+        # La confianza no necesita adaptarse: exponencial simple
+        self._conf += self._alpha(self.min_cutoff, dt) * (conf - self._conf)
+
+    def obtener(self):
+        return self._kp, self._conf
+
+    def limpiar(self):
+        self._kp = None
+        self._conf = None
+        self._dkp = None
+        self._t = None
+
+
 class SuavizadorTemporal:
-    """Suaviza keypoints usando promedio de ventana deslizante para eliminar jitter"""
-    def __init__(self, ventana=5):
-        self.buffer_kp = deque(maxlen=ventana)
-        self.buffer_conf = deque(maxlen=ventana)
+    """
+    Suaviza keypoints para eliminar jitter. Modos (por instancia):
+    - "promedio": promedio de ventana deslizante sobre un buffer circular con sumas acumuladas (O(1) por frame)
+    - "one_euro": filtro One-Euro adaptativo, menos lag en movimientos rápidos
+    - "exponencial": One-Euro con beta=0 (corte fijo)
+    """
+    MODOS = ("promedio", "one_euro", "exponencial")
+
+    def __init__(self, ventana=5, modo="promedio", min_cutoff=1.0, beta=0.05):
+        if modo not in self.MODOS:
+            raise ValueError(f"Modo de suavizado desconocido: {modo}")
+        self.ventana = ventana
+        self.modo = modo
+        self.filtro = None
+        if modo != "promedio":
+            self.filtro = FiltroOneEuro(min_cutoff=min_cutoff, beta=beta if modo == "one_euro" else 0.0)
+        self._buffer_kp = None
+        self._dtype = None
+        self.limpiar()
+
+    def _reservar(self, kp, conf):
+        self._buffer_kp = np.zeros((self.ventana,) + kp.shape, dtype=np.float64)
+        self._buffer_conf = np.zeros((self.ventana,) + conf.shape, dtype=np.float64)
+        self._suma_kp = np.zeros(kp.shape, dtype=np.float64)
+        self._suma_conf = np.zeros(conf.shape, dtype=np.float64)
+        self._dtype = np.result_type(kp.dtype, conf.dtype)
+        self._n = 0
+        self._pos = 0
+
+    def actualizar(self, kp, conf, t=None):
+        if self.filtro is not None:
+            self._dtype = np.result_type(kp.dtype, conf.dtype)
+            self.filtro.actualizar(kp, conf, time.perf_counter() if t is None else t)
+            return
+
+        if self._buffer_kp is None or self._buffer_kp.shape[1:] != kp.shape:
+            self._reservar(kp, conf)
+
+        # Sale el más viejo de la suma, entra el nuevo: todo in-place, sin reservar memoria
+        slot = self._pos
+        if self._n == self.ventana:
+            self._suma_kp -= self._buffer_kp[slot]
+            self._suma_conf -= self._buffer_conf[slot]
+        else:
+            self._n += 1
+        self._buffer_kp[slot] = kp
+        self._buffer_conf[slot] = conf
+        self._suma_kp += self._buffer_kp[slot]
+        self._suma_conf += self._buffer_conf[slot]
+        self._pos = (slot + 1) % self.ventana
 
-    def actualizar(self, kp, conf):
-        self.buffer_kp.append(kp.copy())
-        self.buffer_conf.append(conf.copy())
+        # Recalcular las sumas cada tanto para que no se acumule error de redondeo
+        self._actualizaciones += 1
+        if self._actualizaciones % (64 * self.ventana) == 0:
+            np.sum(self._buffer_kp[:self._n], axis=0, out=self._suma_kp)
+            np.sum(self._buffer_conf[:self._n], axis=0, out=self._suma_conf)
 
     def obtener_suavizado(self):
-        if not self.buffer_kp:
+        if self.filtro is not None:
+            kp, conf = self.filtro.obtener()
+            if kp is None:
+                return None, None
+            return kp.astype(self._dtype), conf.astype(self._dtype)
+        if not self._n:
             return None, None
-        return np.mean(self.buffer_kp, axis=0), np.mean(self.buffer_conf, axis=0)
+        # Copias nuevas en el dtype de entrada (como np.mean), así el llamador puede guardarlas
+        return (self._suma_kp / self._n).astype(self._dtype), (self._suma_conf / self._n).astype(self._dtype)
 
     def limpiar(self):
-        self.buffer_kp.clear()
-        self.buffer_conf.clear()
+        self._n = 0
+        self._pos = 0
+        self._actualizaciones = 0
+        if self._buffer_kp is not None:
+            self._suma_kp.fill(0)
+            self._suma_conf.fill(0)
+        if self.filtro is not None:
+            self.filtro.limpiar()
 
 def calcular_angulo(p1, p2, p3):
     rad = math.atan2(p3[1] - p2[1], p3[0] - p2[0]) - math.atan2(p1[1] - p2[1], p1[0] - p2[0])
@@ -75,10 +181,45 @@ def detectar_orientacion(kp, conf):
             else: return "PERFIL_IZQUIERDO"
         return "DESCONOCIDO"
 
+
+class SeguidorOrientacion:
+    """
+    Orientación con memoria para que no parpadee. Cada frame vota (detectar_orientacion)
+    y la evidencia acumulada de cada perfil decae un factor por frame:
+    - se entra a un perfil cuando su evidencia llega a `entrada`
+    - se cambia de perfil solo si el nuevo supera al actual por `margen` (histéresis)
+    - se vuelve a DESCONOCIDO cuando la evidencia del actual cae por debajo de `salida`
+    """
+    PERFILES = ("PERFIL_DERECHO", "PERFIL_IZQUIERDO")
+
+    def __init__(self, decaimiento=0.8, entrada=2.0, salida=1.0, margen=0.5):
+        self.decaimiento = decaimiento
+        self.entrada = entrada
+        self.salida = salida
+        self.margen = margen
+        self.limpiar()
+
+    def limpiar(self):
+        self.evidencia = dict.fromkeys(self.PERFILES, 0.0)
+        self.orientacion = "DESCONOCIDO"
+
+    def actualizar(self, voto):
+        for perfil in self.PERFILES:
+            self.evidencia[perfil] = self.evidencia[perfil] * self.decaimiento + (perfil == voto)
+        otro = max(self.PERFILES, key=self.evidencia.get)
+        actual = self.evidencia.get(self.orientacion, 0.0)
+        if self.orientacion != "DESCONOCIDO" and actual < self.salida:
+            self.orientacion = "DESCONOCIDO"
+            actual = 0.0
+        if otro != self.orientacion and self.evidencia[otro] >= self.entrada and self.evidencia[otro] > actual + self.margen:
+            self.orientacion = otro
+        return self.orientacion
+
+
 def _keypoints_confiables(conf, indices, umbral=0.3):
     return all(conf[i] >= umbral for i in indices)
 
-def extraer_angulos(kp, orientacion, conf=None):
+def extraer_angulos(kp, orientacion, conf=None, factor_umbral=1.0):
     resultado = {
         "brazo": 0, "torso": 0, "codo_hombro_cadera": 0,
         "brazo_soporte": None, "rodilla": None, "cabeza": None
@@ -99,13 +240,13 @@ def extraer_angulos(kp, orientacion, conf=None):
     resultado["torso"] = calcular_angulo(kp[dom_h], kp[dom_cad], kp[dom_rod])
     resultado["codo_hombro_cadera"] = calcular_angulo(kp[dom_c], kp[dom_h], kp[dom_cad])
 
-    if conf is not None and _keypoints_confiables(conf, [sop_h, sop_c, sop_m], umbral=0.15):
+    if conf is not None and _keypoints_confiables(conf, [sop_h, sop_c, sop_m], umbral=0.15 * factor_umbral):
         resultado["brazo_soporte"] = calcular_angulo(kp[sop_h], kp[sop_c], kp[sop_m])
         
-    if conf is not None and _keypoints_confiables(conf, [dom_cad, dom_rod, dom_tob]):
+    if conf is not None and _keypoints_confiables(conf, [dom_cad, dom_rod, dom_tob], umbral=0.3 * factor_umbral):
         resultado["rodilla"] = calcular_angulo(kp[dom_cad], kp[dom_rod], kp[dom_tob])
         
-    if conf is not None and _keypoints_confiables(conf, [NARIZ, dom_h, dom_cad]):
+    if conf is not None and _keypoints_confiables(conf, [NARIZ, dom_h, dom_cad], umbral=0.3 * factor_umbral):
         resultado["cabeza"] = calcular_angulo(kp[NARIZ], kp[dom_h], kp[dom_cad])
 
     return resultado
@@ -140,4 +281,180 @@ def evaluar_postura(angulos, patron):
     total_peso = sum(p for _, p in scores) if scores else 1
     colores["score"] = int(sum(s * p for s, p in scores) / total_peso * 100) if scores else 0
 
-    return colores
\ No newline at end of file
+    return colores
+
+# --- API vectorizada (lotes de esqueletos) ---
+
+ANGULOS = ANGULOS_PRINCIPALES + ANGULOS_OPCIONALES
+DTYPE_ANGULOS = np.dtype([(key, np.float64) for key in ANGULOS])
+
+# Articulaciones por perfil: (dom_h, dom_c, dom_m, dom_cad, dom_rod, dom_tob, sop_h, sop_c, sop_m)
+_ARTICULACIONES_PERFIL = {
+    "PERFIL_DERECHO": (H_D, C_D, M_D, CAD_D, ROD_D, TOB_D, H_I, C_I, M_I),
+    "PERFIL_IZQUIERDO": (H_I, C_I, M_I, CAD_I, ROD_I, TOB_I, H_D, C_D, M_D),
+}
+
+def calcular_angulo_lote(p1, p2, p3):
+    """Igual que calcular_angulo sobre arrays (..., 2). Devuelve float64 ya truncado a entero"""
+    # Las restas se hacen en el dtype de entrada (como en la versión escalar) y luego se pasa a float64
+    rad = (np.arctan2((p3[..., 1] - p2[..., 1]).astype(np.float64), (p3[..., 0] - p2[..., 0]).astype(np.float64))
+           - np.arctan2((p1[..., 1] - p2[..., 1]).astype(np.float64), (p1[..., 0] - p2[..., 0]).astype(np.float64)))
+    ang = np.abs(rad * 180.0 / math.pi)
+    return np.trunc(np.where(ang > 180.0, 360.0 - ang, ang))
+
+def _confiables_lote(conf, indices, umbral=0.3):
+    return np.all(conf[:, indices] >= umbral, axis=1)
+
+def extraer_angulos_lote(kps, confs, orientaciones, factor_umbral=1.0):
+    """
+    Versión vectorizada de extraer_angulos.
+    kps (N,17,2), confs (N,17) o None, orientaciones: una por fila (o una sola para todas).
+    factor_umbral escala los umbrales de confianza de los ángulos opcionales.
+    Devuelve un array estructurado (N,) con DTYPE_ANGULOS; NaN donde extraer_angulos daría None.
+    """
+    kps = np.asarray(kps)
+    n = len(kps)
+    orientaciones = np.broadcast_to(np.asarray(orientaciones), (n,))
+    confs = None if confs is None else np.asarray(confs)
+
+    resultado = np.zeros(n, dtype=DTYPE_ANGULOS)
+    for key in ANGULOS_OPCIONALES:
+        resultado[key] = np.nan
+
+    for orientacion, (dom_h, dom_c, dom_m, dom_cad, dom_rod, dom_tob, sop_h, sop_c, sop_m) in _ARTICULACIONES_PERFIL.items():
+        filas = np.flatnonzero(orientaciones == orientacion)
+        if not filas.size: continue
+        kp = kps[filas]
+
+        resultado["brazo"][filas] = calcular_angulo_lote(kp[:, dom_h], kp[:, dom_c], kp[:, dom_m])
+        resultado["torso"][filas] = calcular_angulo_lote(kp[:, dom_h], kp[:, dom_cad], kp[:, dom_rod])
+        resultado["codo_hombro_cadera"][filas] = calcular_angulo_lote(kp[:, dom_c], kp[:, dom_h], kp[:, dom_cad])
+
+        if confs is None: continue
+        conf = confs[filas]
+        opcionales = (
+            ("brazo_soporte", (sop_h, sop_c, sop_m), 0.15),
+            ("rodilla", (dom_cad, dom_rod, dom_tob), 0.3),
+            ("cabeza", (NARIZ, dom_h, dom_cad), 0.3),
+        )
+        for key, (a, b, c), umbral in opcionales:
+            validos = _confiables_lote(conf, [a, b, c], umbral * factor_umbral)
+            if validos.any():
+                resultado[key][filas[validos]] = calcular_angulo_lote(kp[validos, a], kp[validos, b], kp[validos, c])
+
+    return resultado
+
+def angulos_a_dict(fila):
+    """Convierte una fila de extraer_angulos_lote al diccionario que devuelve extraer_angulos"""
+    angulos = {key: int(fila[key]) for key in ANGULOS_PRINCIPALES}
+    for key in ANGULOS_OPCIONALES:
+        angulos[key] = None if np.isnan(fila[key]) else int(fila[key])
+    return angulos
+
+# --- Patrones compilados (puntaje en lote) ---
+
+# Estado por articulación en evaluar_postura_lote
+NO_VISIBLE, FUERA, DENTRO, SIN_CALIBRAR = -1, 0, 1, 2
+_COLOR_ESTADO = {FUERA: (0, 0, 255), DENTRO: (0, 255, 0), SIN_CALIBRAR: (0, 255, 255)}
+_ESTADO_COLOR = {color: estado for estado, color in _COLOR_ESTADO.items()}
+
+
+class PatronesCompilados:
+    """
+    Patrones pasados a arrays para puntuar sin recorrer diccionarios:
+    medias (M,6), tolerancias (M,6), validos (M,6) y pesos (6,), en el orden de ANGULOS.
+    Se compilan una vez cuando los patrones se cargan o cambian.
+    """
+    def __init__(self, patrones, nombres=None):
+        self.nombres = list(nombres) if nombres is not None else list(range(len(patrones)))
+        m = len(patrones)
+        self.medias = np.full((m, len(ANGULOS)), np.nan)
+        self.tolerancias = np.zeros((m, len(ANGULOS)))
+        self.validos = np.zeros((m, len(ANGULOS)), bool)
+        self.calibrados = np.array([bool(p.get("calibrado")) for p in patrones], bool)
+        self.pesos = np.array([PESOS_ANGULOS[key] for key in ANGULOS], np.float64)
+        # Versión escalar para un solo frame: (key, media, tolerancia, peso) en el orden de evaluar_postura
+        self._terminos = []
+        for i, patron in enumerate(patrones):
+            terminos = []
+            for k, key in enumerate(ANGULOS):
+                media = patron.get(key)
+                if media is not None:
+                    self.medias[i, k] = media
+                    self.tolerancias[i, k] = _tolerancia_adaptativa(patron.get(f"{key}_std"))
+                    self.validos[i, k] = True
+                terminos.append((key, f"col_{key}", media, self.tolerancias[i, k], PESOS_ANGULOS[key]))
+            self._terminos.append(terminos)
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def indice(self, nombre):
+        return self.nombres.index(nombre)
+
+    def evaluar(self, angulos, fila=0):
+        """Igual que evaluar_postura(angulos, patron) contra el patrón `fila`, sin recalcular tolerancias"""
+        colores = {}
+        suma, total_peso = 0, 0
+        for key, col, media, tol, peso in self._terminos[fila]:
+            angulo = angulos.get(key)
+            if angulo is None: continue
+            if media is None:
+                colores[col] = (0, 255, 255)  # Amarillo (visible pero sin calibrar)
+                continue
+            diff = abs(angulo - media)
+            colores[col] = (0, 255, 0) if diff <= tol else (0, 0, 255)
+            suma += max(0.0, 1.0 - diff / (tol * 2)) * peso
+            total_peso += peso
+        colores["score"] = int(suma / total_peso * 100) if total_peso else 0
+        return colores
+
+
+def _matriz_angulos(angulos):
+    """(N,6) float64 a partir de un array de extraer_angulos_lote (NaN = no visible) o de un (N,6)"""
+    if angulos.dtype.names:
+        return np.stack([angulos[key].astype(np.float64) for key in ANGULOS], axis=1)
+    return np.asarray(angulos, np.float64).reshape(-1, len(ANGULOS))
+
+
+def evaluar_postura_lote(angulos, compilados):
+    """
+    Puntúa N frames contra M patrones en una sola llamada.
+    Devuelve scores (N,M) int, con el mismo valor que evaluar_postura, y estados (N,M,6) int8:
+    DENTRO / FUERA de tolerancia, SIN_CALIBRAR (visible pero sin patrón) o NO_VISIBLE.
+    """
+    a = _matriz_angulos(angulos)[:, None, :]
+    visibles = ~np.isnan(a)
+    usados = visibles & compilados.validos[None]
+    diff = np.abs(a - compilados.medias[None])
+    tol = compilados.tolerancias[None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        parcial = np.maximum(0.0, 1.0 - diff / (tol * 2))
+
+    # Suma articulación por articulación en el orden de evaluar_postura: mismo redondeo, mismo score
+    n, m = a.shape[0], compilados.medias.shape[0]
+    suma = np.zeros((n, m))
+    total_peso = np.zeros((n, m))
+    for k, peso in enumerate(compilados.pesos):
+        suma += np.where(usados[..., k], parcial[..., k] * peso, 0.0)
+        total_peso += np.where(usados[..., k], peso, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = np.where(total_peso > 0, np.trunc(suma / total_peso * 100), 0).astype(np.int64)
+
+    estados = np.full(usados.shape, NO_VISIBLE, np.int8)
+    estados[visibles & ~compilados.validos[None]] = SIN_CALIBRAR
+    estados[usados & (diff <= tol)] = DENTRO
+    estados[usados & ~(diff <= tol)] = FUERA
+    return scores, estados
+
+
+def estados_a_colores(estados, score):
+    """Diccionario de colores (como el de evaluar_postura) a partir de una fila de estados"""
+    colores = {f"col_{key}": _COLOR_ESTADO[int(e)] for key, e in zip(ANGULOS, estados) if e != NO_VISIBLE}
+    colores["score"] = int(score)
+    return colores
+
+
+def colores_a_estados(colores):
+    """Inversa de estados_a_colores: estados (6,) int8 en el orden de ANGULOS"""
+    return np.array([_ESTADO_COLOR.get(tuple(colores.get(f"col_{key}", ())), NO_VISIBLE) for key in ANGULOS], np.int8)
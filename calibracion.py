@@ -2,28 +2,99 @@
 Módulo de Calibración
 Contiene toda la lógica de calibración estadística, almacenamiento de patrones y gestión de estados
 """
+import math
 import time
-import json
-import os
 import numpy as np
 
-ARCHIVO_CONFIG = "armas_config.json"
+from almacenamiento import ARCHIVO_CONFIG, PERFILES, AlmacenJSON
+from calculos import ANGULOS, ANGULOS_OPCIONALES, ANGULOS_PRINCIPALES, PatronesCompilados, evaluar_postura_lote
+
+class EstadisticaOnline:
+    """
+    Media y desviación estándar en O(1) por muestra y memoria constante (Welford).
+    Los ángulos llegan como enteros: mientras sea así también se llevan sumas enteras
+    exactas, con lo que media/std salen idénticas a np.mean/np.std sobre todas las muestras.
+    Con robusta=True se acumula un histograma de 1° para mediana y MAD.
+    """
+    MAX_ANGULO = 360
+
+    def __init__(self, robusta=False):
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self._suma = 0
+        self._suma_cuadrados = 0
+        self._enteros = True
+        self.histograma = np.zeros(self.MAX_ANGULO + 1, dtype=np.int64) if robusta else None
+
+    def agregar(self, valor):
+        self.n += 1
+        delta = valor - self.media
+        self.media += delta / self.n
+        self.m2 += delta * (valor - self.media)
+        if self._enteros and float(valor).is_integer():
+            self._suma += int(valor)
+            self._suma_cuadrados += int(valor) * int(valor)
+        else:
+            self._enteros = False
+        if self.histograma is not None:
+            self.histograma[min(max(int(round(valor)), 0), self.MAX_ANGULO)] += 1
+
+    def obtener_media(self):
+        if not self.n: return 0.0
+        return self._suma / self.n if self._enteros else self.media
+
+    def obtener_std(self):
+        if not self.n: return 0.0
+        if self._enteros:
+            # Varianza exacta en enteros: (n*Σx² - (Σx)²) / n²
+            return math.sqrt((self.n * self._suma_cuadrados - self._suma * self._suma) / (self.n * self.n))
+        return math.sqrt(max(self.m2, 0.0) / self.n)
+
+    def _mediana_ponderada(self, valores, pesos):
+        acumulado = np.cumsum(pesos)
+        total = acumulado[-1]
+        # Igual que np.median: con n par se promedian los dos centrales
+        bajo = valores[np.searchsorted(acumulado, (total + 1) // 2)]
+        alto = valores[np.searchsorted(acumulado, total // 2 + 1)]
+        return (bajo + alto) / 2.0
+
+    def obtener_mediana(self):
+        if self.histograma is None or not self.n: return None
+        return float(self._mediana_ponderada(np.arange(len(self.histograma)), self.histograma))
+
+    def obtener_mad(self):
+        """Mediana de las desviaciones absolutas respecto de la mediana (con resolución de 1°)"""
+        if self.histograma is None or not self.n: return None
+        mediana = self.obtener_mediana()
+        desviaciones = np.abs(np.arange(len(self.histograma)) - mediana)
+        orden = np.argsort(desviaciones, kind="stable")
+        return float(self._mediana_ponderada(desviaciones[orden], self.histograma[orden]))
 
 class GestorCalbracion:
     """Gestor centralizado de calibración y patrones"""
 
-    def __init__(self):
+    def __init__(self, almacen=None, estadisticas_robustas=False, tirador=None):
         self.tiempo_calibracion = 5  # Segundos para calibrar
         self.estado_actual = "EVALUANDO"
         self.tiempo_inicio = 0
         self.arma_actual = None
         self.patrones = self._patrones_vacios()
-        self.config = self._cargar_config()
+        # Backend de patrones (JSON por defecto); las armas se cargan al seleccionarlas
+        self.almacen = almacen or AlmacenJSON(ARCHIVO_CONFIG)
+        # Con un tirador, sus calibraciones se guardan aparte y reemplazan al patrón común del arma
+        self.tirador = tirador
         
-        # Variables para calibración estadística
-        self.muestras = []
+        # Variables para calibración estadística (acumuladas en línea, sin guardar cada muestra)
+        self.estadisticas_robustas = estadisticas_robustas
+        self.estadisticas = {}
+        self.num_muestras = 0
         self.orientacion_calibrando = None
 
+        # Patrones en arrays: los del arma actual y el catálogo de todas las armas por perfil
+        self._compilados = None
+        self._catalogo = {}
+
     def _patrones_vacios(self):
         perfil = {
             "calibrado": False,
@@ -34,25 +105,15 @@ class GestorCalbracion:
         }
         return {"PERFIL_DERECHO": dict(perfil), "PERFIL_IZQUIERDO": dict(perfil)}
 
-    def _cargar_config(self):
-        if os.path.exists(ARCHIVO_CONFIG):
-            try:
-                with open(ARCHIVO_CONFIG, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, IOError):
-                return {"armas": {}}
-        return {"armas": {}}
-
-    def _guardar_config(self):
-        with open(ARCHIVO_CONFIG, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=2, ensure_ascii=False)
-
     def obtener_lista_armas(self):
-        return list(self.config.get("armas", {}).keys())
+        return self.almacen.listar_armas()
 
     def seleccionar_arma(self, nombre):
         self.arma_actual = nombre
-        datos = self.config.get("armas", {}).get(nombre)
+        datos = self.almacen.cargar_arma(nombre)
+        if self.tirador is not None:
+            propios = self.almacen.cargar_arma(nombre, self.tirador) or {}
+            datos = dict(datos or {}, **{p: d for p, d in propios.items() if d.get("calibrado")})
         if datos:
             vacios = self._patrones_vacios()
             self.patrones = {}
@@ -64,8 +125,8 @@ class GestorCalbracion:
             self.patrones = self._patrones_vacios()
 
     def crear_arma(self, nombre):
-        self.config.setdefault("armas", {})[nombre] = self._patrones_vacios()
-        self._guardar_config()
+        self.almacen.guardar_arma(nombre, self._patrones_vacios())
+        self._catalogo = {}
         self.seleccionar_arma(nombre)
 
     def obtener_arma_actual(self):
@@ -74,46 +135,62 @@ class GestorCalbracion:
     def iniciar_calibracion(self, orientacion):
         self.estado_actual = "CONTEO"
         self.tiempo_inicio = time.time()
-        self.muestras = []
+        self.estadisticas = {key: EstadisticaOnline(self.estadisticas_robustas)
+                             for key in ANGULOS_PRINCIPALES + ANGULOS_OPCIONALES}
+        self.num_muestras = 0
         self.orientacion_calibrando = orientacion
 
     def agregar_muestra(self, angulos):
-        self.muestras.append(dict(angulos))
+        self.num_muestras += 1
+        for key in ANGULOS_PRINCIPALES:
+            if angulos.get(key, 0) != 0:
+                self.estadisticas[key].agregar(angulos[key])
+        for key in ANGULOS_OPCIONALES:
+            if angulos.get(key) is not None:
+                self.estadisticas[key].agregar(angulos[key])
+
+    def obtener_num_muestras(self):
+        return self.num_muestras
+
+    def _resumir(self, patron, key, estadistica):
+        patron[key] = int(estadistica.obtener_media())
+        patron[f"{key}_std"] = round(estadistica.obtener_std(), 1)
+        if self.estadisticas_robustas:
+            patron[f"{key}_mediana"] = estadistica.obtener_mediana()
+            patron[f"{key}_mad"] = estadistica.obtener_mad()
 
     def finalizar_calibracion(self):
-        if not self.muestras or not self.orientacion_calibrando:
+        if not self.num_muestras or not self.orientacion_calibrando:
             self.estado_actual = "EVALUANDO"
             return
-        
+
+        # O(1): las estadísticas ya están acumuladas muestra a muestra
         patron = {"calibrado": True}
-        
-        for key in ['brazo', 'torso', 'codo_hombro_cadera']:
-            valores = [m[key] for m in self.muestras if m.get(key, 0) != 0]
-            if valores:
-                patron[key] = int(np.mean(valores))
-                patron[f"{key}_std"] = round(float(np.std(valores)), 1)
+
+        for key in ANGULOS_PRINCIPALES:
+            estadistica = self.estadisticas[key]
+            if estadistica.n:
+                self._resumir(patron, key, estadistica)
             else:
                 patron[key] = 0; patron[f"{key}_std"] = 0
-                
-        for key in ['brazo_soporte', 'rodilla', 'cabeza']:
-            valores = [m[key] for m in self.muestras if m.get(key) is not None]
-            if len(valores) >= len(self.muestras) * 0.3:
-                patron[key] = int(np.mean(valores))
-                patron[f"{key}_std"] = round(float(np.std(valores)), 1)
+
+        for key in ANGULOS_OPCIONALES:
+            estadistica = self.estadisticas[key]
+            if estadistica.n and estadistica.n >= self.num_muestras * 0.3:
+                self._resumir(patron, key, estadistica)
             else:
                 patron[key] = None; patron[f"{key}_std"] = None
-                
+
         self.patrones[self.orientacion_calibrando] = patron
         self.estado_actual = "EVALUANDO"
-        
+
         if self.arma_actual:
-            self.config.setdefault("armas", {})[self.arma_actual] = {
-                "PERFIL_DERECHO": dict(self.patrones["PERFIL_DERECHO"]),
-                "PERFIL_IZQUIERDO": dict(self.patrones["PERFIL_IZQUIERDO"])
-            }
-            self._guardar_config()
-            
-        self.muestras = []
+            # Solo se escribe el perfil recién calibrado (no se pisa lo que otra estación haya guardado)
+            self.almacen.guardar_perfil(self.arma_actual, self.orientacion_calibrando, patron, tirador=self.tirador)
+            self._catalogo = {}
+
+        self.estadisticas = {}
+        self.num_muestras = 0
         self.orientacion_calibrando = None
 
     def obtener_tiempo_restante_calibracion(self):
@@ -129,4 +206,35 @@ class GestorCalbracion:
     def resetear_patrones(self): 
         self.patrones = self._patrones_vacios()
         self.estado_actual = "EVALUANDO"
-    def obtener_todos_los_patrones(self): return self.patrones
\ No newline at end of file
+    def obtener_todos_los_patrones(self): return self.patrones
+
+    def obtener_compilados(self):
+        """Patrones del arma actual compilados; se recompilan cuando se reemplaza algún perfil"""
+        actuales = tuple(self.patrones[perfil] for perfil in PERFILES)
+        if self._compilados is None or any(a is not b for a, b in zip(self._compilados[0], actuales)):
+            self._compilados = (actuales, PatronesCompilados(actuales, PERFILES))
+        return self._compilados[1]
+
+    def evaluar_postura(self, angulos, orientacion):
+        """Colores y score de `angulos` contra el patrón de `orientacion` (como calculos.evaluar_postura)"""
+        compilados = self.obtener_compilados()
+        return compilados.evaluar(angulos, compilados.indice(orientacion))
+
+    def _obtener_catalogo(self, orientacion):
+        if orientacion not in self._catalogo:
+            nombres, patrones = [], []
+            for arma in self.almacen.listar_armas():
+                patron = (self.almacen.cargar_arma(arma) or {}).get(orientacion)
+                if patron and patron.get("calibrado"):
+                    nombres.append(arma); patrones.append(patron)
+            self._catalogo[orientacion] = PatronesCompilados(patrones, nombres)
+        return self._catalogo[orientacion]
+
+    def clasificar_arma(self, angulos, orientacion):
+        """Puntúa la postura contra el patrón de `orientacion` de todas las armas. Devuelve [(arma, score)] de mayor a menor"""
+        catalogo = self._obtener_catalogo(orientacion)
+        if not len(catalogo):
+            return []
+        fila = np.array([[np.nan if angulos.get(key) is None else angulos[key] for key in ANGULOS]])
+        scores, _ = evaluar_postura_lote(fila, catalogo)
+        return sorted(zip(catalogo.nombres, scores[0].tolist()), key=lambda par: -par[1])
@@ -0,0 +1,101 @@
+"""
+Módulo de Control de Resolución
+Ajusta el tamaño de entrada del modelo según un presupuesto de tiempo por inferencia:
+si la mediana reciente se pasa del presupuesto se baja un escalón; si el escalón de
+arriba (estimado con costo ~ tamaño²) entra con holgura, se sube. La histéresis y la
+espera mínima entre cambios evitan que oscile. Con el tamaño también se ajustan los
+umbrales de confianza de los ángulos opcionales (a menor resolución, confianzas más bajas).
+Cada cambio se registra en un CSV para analizarlo después.
+"""
+import os
+import csv
+import time
+from collections import deque
+
+import numpy as np
+
+from inferencia import multiplo_32
+
+TAMANOS = (320, 384, 448, 512, 576, 640)
+COLUMNAS_REGISTRO = ["t", "de", "a", "mediana_ms", "objetivo_ms", "factor_umbral", "motivo"]
+
+
+class ControladorResolucion:
+    """
+    - objetivo_ms: presupuesto por inferencia (1000 / FPS objetivo)
+    - tamanos: escalones de tamaño de entrada permitidos (se redondean a múltiplos de 32, como hace el modelo)
+    - inicial: tamaño de arranque (por defecto el más grande)
+    - ventana: inferencias recientes cuya mediana se compara con el presupuesto
+    - histeresis: baja por encima de objetivo*(1+h); sube solo si el escalón siguiente queda bajo objetivo*(1-h)
+    - espera: inferencias mínimas entre dos cambios (la ventana se vacía al cambiar)
+    - factor_umbral_min: factor de los umbrales de confianza en el tamaño más chico (1.0 en el más grande)
+    - registro: CSV donde se agrega una fila por cambio
+    """
+    def __init__(self, objetivo_ms, tamanos=TAMANOS, inicial=None, ventana=15, histeresis=0.15, espera=30,
+                 factor_umbral_min=0.7, registro=None):
+        self.objetivo_ms = objetivo_ms
+        self.tamanos = sorted({multiplo_32(t) for t in tamanos})
+        self.indice = len(self.tamanos) - 1 if inicial is None else self._indice_cercano(inicial)
+        self.ventana = deque(maxlen=ventana)
+        self.histeresis = histeresis
+        self.espera = max(espera, ventana)
+        self.factor_umbral_min = factor_umbral_min
+        self.registro = registro
+        self._desde_cambio = 0
+        self.cambios = 0
+
+    def _indice_cercano(self, tam):
+        return int(np.argmin([abs(t - tam) for t in self.tamanos]))
+
+    @property
+    def tam_entrada(self):
+        return self.tamanos[self.indice]
+
+    @property
+    def factor_umbral(self):
+        if len(self.tamanos) == 1:
+            return 1.0
+        fraccion = self.indice / (len(self.tamanos) - 1)
+        return self.factor_umbral_min + (1.0 - self.factor_umbral_min) * fraccion
+
+    def registrar(self, ms):
+        """Agrega el tiempo de una inferencia. Devuelve True si cambió el tamaño"""
+        self.ventana.append(ms)
+        self._desde_cambio += 1
+        if self._desde_cambio < self.espera or len(self.ventana) < self.ventana.maxlen:
+            return False
+
+        mediana = float(np.median(self.ventana))
+        if mediana > self.objetivo_ms * (1 + self.histeresis) and self.indice > 0:
+            self._cambiar(self.indice - 1, mediana, "lento")
+            return True
+        if self.indice < len(self.tamanos) - 1:
+            # Costo estimado del escalón de arriba: proporcional a la cantidad de píxeles
+            estimado = mediana * (self.tamanos[self.indice + 1] / self.tam_entrada) ** 2
+            if estimado < self.objetivo_ms * (1 - self.histeresis):
+                self._cambiar(self.indice + 1, mediana, "holgura")
+                return True
+        return False
+
+    def _cambiar(self, indice, mediana, motivo):
+        anterior = self.tam_entrada
+        self.indice = indice
+        self.ventana.clear()
+        self._desde_cambio = 0
+        self.cambios += 1
+        print(f"Resolución de inferencia: {anterior} -> {self.tam_entrada} "
+              f"(mediana {mediana:.1f} ms, objetivo {self.objetivo_ms:.1f} ms)")
+        if self.registro:
+            self._escribir_registro([round(time.time(), 3), anterior, self.tam_entrada, round(mediana, 2),
+                                     round(self.objetivo_ms, 2), round(self.factor_umbral, 3), motivo])
+
+    def _escribir_registro(self, fila):
+        try:
+            nuevo = not os.path.exists(self.registro)
+            with open(self.registro, 'a', newline='', encoding='utf-8') as f:
+                escritor = csv.writer(f)
+                if nuevo:
+                    escritor.writerow(COLUMNAS_REGISTRO)
+                escritor.writerow(fila)
+        except IOError as e:
+            print(f"[ERROR] registro de resolución: {e}")
@@ -0,0 +1,158 @@
+"""
+Evaluación Offline (sin pantalla)
+Evalúa videos grabados contra los patrones de un arma y escribe un CSV por video
+con orientación, ángulos y score de cada frame. Los videos se reparten en un pool
+de procesos, pensado para procesar las grabaciones del día en un servidor CPU.
+
+Uso:
+    python evaluacion_offline.py --arma pistola videos/*.mp4 --salida resultados/
+"""
+import os
+import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from almacenamiento import ARCHIVO_CONFIG, crear_almacen
+from calculos import ANGULOS
+from calibracion import GestorCalbracion
+from evaluador import EvaluadorPostura
+from inferencia import crear_backend
+from poses import inferir_personas
+
+COLUMNAS = ["frame", "tiempo_s", "orientacion"] + ANGULOS + ["score"]
+
+# Estado por proceso: cada trabajador carga el modelo una sola vez
+_modelo = None
+
+
+def _iniciar_trabajador(modelo_path, hilos, tam_entrada=640):
+    global _modelo
+    # Un pool de N procesos con N hilos cada uno satura la CPU: repartimos los núcleos
+    cv2.setNumThreads(hilos)
+    _modelo = crear_backend(modelo_path, tam_entrada, hilos).cargar()
+
+
+def nombres_salida(videos):
+    """
+    Nombre del CSV de cada video: su ruta relativa a la carpeta común, sin extensión y con
+    las barras como '_' (cam1/sesion.mp4 -> cam1_sesion). Lanza ValueError si dos coinciden.
+    """
+    rutas = [os.path.splitext(os.path.abspath(video))[0] for video in videos]
+    base = os.path.commonpath([os.path.dirname(ruta) for ruta in rutas]) if rutas else ""
+    nombres = [os.path.relpath(ruta, base).replace(os.sep, "_") for ruta in rutas]
+    vistos = {}
+    for video, nombre in zip(videos, nombres):
+        if nombre in vistos:
+            raise ValueError(f"{vistos[nombre]} y {video} escribirían el mismo CSV ({nombre}.csv)")
+        vistos[nombre] = video
+    return nombres
+
+
+def evaluar_video(ruta_video, arma, carpeta_salida, ruta_almacen=ARCHIVO_CONFIG, nombre=None):
+    """Evalúa un video completo. Devuelve (ruta_csv, frames, frames_evaluados, score_medio)"""
+    cap = cv2.VideoCapture(ruta_video)
+    if not cap.isOpened():
+        raise IOError(f"no se pudo abrir el video {ruta_video}")
+
+    gestor = GestorCalbracion(crear_almacen(ruta_almacen))
+    gestor.seleccionar_arma(arma)
+    evaluador = EvaluadorPostura(gestor, ventana=5, calibrar=False)
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    nombre = nombre or os.path.splitext(os.path.basename(ruta_video))[0]
+    ruta_csv = os.path.join(carpeta_salida, f"{nombre}.csv")
+
+    frames, evaluados, suma_score = 0, 0, 0
+    with open(ruta_csv, 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(COLUMNAS)
+        while cap.isOpened():
+            exito, frame = cap.read()
+            if not exito: break
+
+            kps, confs, _ = inferir_personas(_modelo, frame)
+            # Tiempo del video (no del reloj) para que los filtros temporales sean reproducibles
+            t = frames / fps
+            if len(kps):
+                resultado = evaluador.analizar(kps[0], confs[0], t)
+            else:
+                resultado = evaluador.analizar(None, None, t)
+
+            angulos = resultado["angulos"] or {}
+            score = resultado["colores"].get("score", 0) if resultado["colores"] is not None else None
+            escritor.writerow(
+                [frames, round(t, 3), resultado["orientacion"]]
+                + ["" if angulos.get(key) is None else angulos[key] for key in ANGULOS]
+                + ["" if score is None else score]
+            )
+            if score is not None:
+                evaluados += 1
+                suma_score += score
+            frames += 1
+
+    cap.release()
+    return ruta_csv, frames, evaluados, (suma_score / evaluados if evaluados else None)
+
+
+def evaluar_videos(videos, arma, carpeta_salida, modelo_path='yolo26n-pose.pt', procesos=None,
+                   ruta_almacen=ARCHIVO_CONFIG, tam_entrada=640):
+    """Reparte los videos en un pool de procesos del tamaño del número de núcleos"""
+    nombres = nombres_salida(videos)
+    os.makedirs(carpeta_salida, exist_ok=True)
+    nucleos = os.cpu_count() or 1
+    procesos = max(1, min(procesos or nucleos, len(videos)))
+    hilos = max(1, nucleos // procesos)
+
+    resultados = []
+    if procesos == 1:
+        _iniciar_trabajador(modelo_path, hilos, tam_entrada)
+        for video, nombre in zip(videos, nombres):
+            try:
+                resultados.append(evaluar_video(video, arma, carpeta_salida, ruta_almacen, nombre))
+            except Exception as e:
+                print(f"[ERROR] {video}: {e}")
+                continue
+            _informar(video, resultados[-1])
+        return resultados
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_trabajador,
+                             initargs=(modelo_path, hilos, tam_entrada)) as pool:
+        futuros = {pool.submit(evaluar_video, video, arma, carpeta_salida, ruta_almacen, nombre): video
+                   for video, nombre in zip(videos, nombres)}
+        for futuro in as_completed(futuros):
+            try:
+                resultados.append(futuro.result())
+            except Exception as e:
+                print(f"[ERROR] {futuros[futuro]}: {e}")
+                continue
+            _informar(futuros[futuro], resultados[-1])
+    return resultados
+
+
+def _informar(video, resultado):
+    ruta_csv, frames, evaluados, score_medio = resultado
+    media = f"{score_medio:.1f}%" if score_medio is not None else "-"
+    print(f"{video}: {frames} frames, {evaluados} evaluados, score medio {media} -> {ruta_csv}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluación offline de videos grabados (sin pantalla)")
+    parser.add_argument("videos", nargs="+", help="Archivos de video a evaluar")
+    parser.add_argument("--arma", required=True, help="Nombre del arma en el almacén de patrones")
+    parser.add_argument("--almacen", default=ARCHIVO_CONFIG, help="Archivo de patrones (.json o .db)")
+    parser.add_argument("--salida", default="resultados", help="Carpeta donde se escriben los CSV")
+    parser.add_argument("--modelo", default='yolo26n-pose.pt', help=".pt (ultralytics) o .onnx (ONNX Runtime en CPU)")
+    parser.add_argument("--tam-entrada", type=int, default=640, help="Lado de la imagen que ve el modelo")
+    parser.add_argument("--procesos", type=int, default=None, help="Tamaño del pool (por defecto, núcleos de la CPU)")
+    args = parser.parse_args()
+
+    if args.arma not in GestorCalbracion(crear_almacen(args.almacen)).obtener_lista_armas():
+        parser.error(f"El arma '{args.arma}' no existe en {args.almacen}")
+    try:
+        nombres_salida(args.videos)
+    except ValueError as e:
+        parser.error(str(e))
+
+    evaluar_videos(args.videos, args.arma, args.salida, args.modelo, args.procesos, args.almacen, args.tam_entrada)
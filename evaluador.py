@@ -0,0 +1,211 @@
+"""
+Módulo de Evaluación por Persona
+Encapsula el estado temporal de una persona (suavizado, orientación) y el flujo
+keypoints -> orientación -> ángulos -> calibración / score
+"""
+import numpy as np
+
+from metricas import METRICAS_NULAS
+from calculos import (detectar_orientacion, extraer_angulos_lote, angulos_a_dict, SuavizadorTemporal,
+                      SeguidorOrientacion)
+
+# Variación de confianza por debajo de la cual un frame "quieto" puede reutilizar el anterior
+UMBRAL_CONF_REUSO = 0.05
+# Frames seguidos sin la persona tras los cuales se olvida su orientación y su referencia de reuso
+MAX_FRAMES_AUSENTE = 15
+
+
+def resultado_vacio(gestor):
+    return {
+        "orientacion": "DESCONOCIDO", "kp": None, "estado": gestor.obtener_estado(),
+        "calibrado": False, "colores": None, "angulos": None, "tiempo_restante": 0, "num_muestras": 0
+    }
+
+
+def crear_contadores():
+    return {"frames": 0, "orientacion_reusada": 0, "angulos_reusados": 0,
+            "puntaje_reusado": 0, "orientacion_filtrada": 0}
+
+
+class EvaluadorPostura:
+    """
+    Evalúa a una persona frame a frame contra los patrones del gestor.
+    - orientacion_estable: la orientación pasa por un SeguidorOrientacion (histéresis, sin parpadeo)
+    - umbral_reuso: si los keypoints suavizados se movieron menos de estos píxeles desde el último
+      cálculo, se reutilizan el voto de orientación, los ángulos y el score/colores (0 = siempre recalcula)
+    - contadores: diccionario compartido para sumar el trabajo reutilizado de varios evaluadores
+    """
+    def __init__(self, gestor, ventana=5, calibrar=True, modo_suavizado="promedio", metricas=METRICAS_NULAS,
+                 orientacion_estable=False, umbral_reuso=0.0, contadores=None):
+        self.gestor = gestor
+        self.metricas = metricas
+        self.suavizador = SuavizadorTemporal(ventana=ventana, modo=modo_suavizado)
+        self.orientacion = "DESCONOCIDO"
+        # Solo el evaluador que calibra aporta muestras al gestor (compartido entre personas)
+        self.calibrar = calibrar
+        # Escala de los umbrales de confianza de los ángulos opcionales (lo ajusta el control de resolución)
+        self.factor_umbral = 1.0
+        self._crudos = (None, None)
+
+        self.seguidor = SeguidorOrientacion() if orientacion_estable else None
+        self.umbral_reuso = umbral_reuso
+        self._quieto = False
+        self._referencia = None  # (kp, conf, voto) del último frame que se calculó completo
+        self._angulos = None  # (orientacion, factor_umbral, angulos)
+        self._colores = None  # (angulos, compilados, colores)
+        self._ausente = 0
+        self.contadores = contadores if contadores is not None else crear_contadores()
+
+    def _sin_cambios(self, kp, conf):
+        if not self.umbral_reuso or self._referencia is None: return False
+        kp_ref, conf_ref, _ = self._referencia
+        if kp_ref.shape != kp.shape: return False
+        movimiento = np.max(np.abs(kp - kp_ref))
+        return movimiento <= self.umbral_reuso and np.max(np.abs(conf - conf_ref)) <= UMBRAL_CONF_REUSO
+
+    def _orientacion(self, kp, conf):
+        """Voto del frame (reutilizado si está quieto) filtrado por el seguidor"""
+        self._quieto = self._sin_cambios(kp, conf)
+        if self._quieto:
+            voto = self._referencia[2]
+            self.contadores["orientacion_reusada"] += 1
+        else:
+            voto = detectar_orientacion(kp, conf)
+            if self.umbral_reuso:
+                self._referencia = (kp, conf, voto)
+                self._angulos = None
+        if self.seguidor is None:
+            return voto
+        orientacion = self.seguidor.actualizar(voto)
+        if orientacion != voto:
+            self.contadores["orientacion_filtrada"] += 1
+        return orientacion
+
+    def angulos_reusables(self, factor_umbral=1.0):
+        """Ángulos del último cálculo si el frame está quieto y nada de lo que los define cambió"""
+        if not self._quieto or self._angulos is None: return None
+        orientacion, factor, angulos = self._angulos
+        if orientacion != self.orientacion or factor != factor_umbral: return None
+        self.contadores["angulos_reusados"] += 1
+        return angulos
+
+    def guardar_angulos(self, angulos, factor_umbral=1.0):
+        if self.umbral_reuso:
+            self._angulos = (self.orientacion, factor_umbral, angulos)
+
+    def preparar(self, kp_raw, conf_raw, t=None):
+        """Suavizado + orientación. Devuelve el resultado parcial, aún sin ángulos"""
+        resultado = resultado_vacio(self.gestor)
+        self._crudos = (kp_raw, conf_raw)
+        if kp_raw is None:
+            self.orientacion = "DESCONOCIDO"
+            self._quieto = False
+            self._ausente += 1
+            if self._ausente > MAX_FRAMES_AUSENTE:
+                self._referencia = None
+                if self.seguidor is not None:
+                    self.seguidor.limpiar()
+            elif self.seguidor is not None:
+                # Una detección perdida solo hace decaer la evidencia, no la borra
+                self.seguidor.actualizar("DESCONOCIDO")
+            return resultado
+        self._ausente = 0
+
+        # Suavizado Temporal para estabilidad visual
+        with self.metricas.etapa("suavizado"):
+            self.suavizador.actualizar(kp_raw, conf_raw, t)
+            kp, conf = self.suavizador.obtener_suavizado()
+
+        self.contadores["frames"] += 1
+        with self.metricas.etapa("orientacion"):
+            self.orientacion = self._orientacion(kp, conf)
+        resultado["orientacion"] = self.orientacion
+        resultado["kp"] = kp
+        resultado["conf"] = conf
+        if self.orientacion != "DESCONOCIDO":
+            resultado["estado"] = self.gestor.obtener_estado()
+        return resultado
+
+    def necesita_crudos(self, resultado):
+        """Durante la calibración también hacen falta los ángulos de los puntos CRUDOS"""
+        return (self.calibrar and resultado["estado"] == "CONTEO"
+                and self.orientacion == self.gestor.orientacion_calibrando)
+
+    def completar(self, resultado, angulos, angulos_raw=None):
+        """Calibración o evaluación a partir de los ángulos ya extraídos"""
+        resultado["angulos"] = angulos
+        if resultado["estado"] == "CONTEO":
+            if not self.calibrar:
+                return resultado
+            if angulos_raw is not None:
+                self.gestor.agregar_muestra(angulos_raw)
+
+            resultado["tiempo_restante"] = self.gestor.obtener_tiempo_restante_calibracion()
+            resultado["num_muestras"] = self.gestor.obtener_num_muestras()
+
+            if self.gestor.calibracion_completada():
+                self.gestor.finalizar_calibracion()
+
+        elif resultado["estado"] == "EVALUANDO":
+            resultado["calibrado"] = self.gestor.esta_calibrado(self.orientacion)
+
+            if resultado["calibrado"]:
+                compilados = self.gestor.obtener_compilados()
+                previos = self._colores
+                if previos is not None and previos[0] is angulos and previos[1] is compilados:
+                    # Mismos ángulos (reutilizados) contra los mismos patrones: mismo score
+                    resultado["colores"] = previos[2]
+                    self.contadores["puntaje_reusado"] += 1
+                else:
+                    with self.metricas.etapa("puntaje"):
+                        resultado["colores"] = self.gestor.evaluar_postura(angulos, self.orientacion)
+                    if self.umbral_reuso:
+                        self._colores = (angulos, compilados, resultado["colores"])
+
+        return resultado
+
+    def analizar(self, kp_raw, conf_raw, t=None):
+        return analizar_lote([self], [kp_raw], [conf_raw], t, self.metricas, self.factor_umbral)[0]
+
+
+def analizar_lote(evaluadores, kps_raw, confs_raw, t=None, metricas=METRICAS_NULAS, factor_umbral=1.0):
+    """
+    Analiza varias personas extrayendo todos los ángulos del frame en una sola
+    llamada vectorizada (suavizados de todos + crudos del que calibra). Las personas
+    quietas reutilizan los ángulos del frame anterior y no entran al lote.
+    """
+    resultados = [ev.preparar(kp, conf, t) for ev, kp, conf in zip(evaluadores, kps_raw, confs_raw)]
+
+    filas_kp, filas_conf, filas_orientacion, destinos = [], [], [], []
+    for ev, resultado in zip(evaluadores, resultados):
+        if resultado["orientacion"] == "DESCONOCIDO":
+            destinos.append(None)
+            continue
+        # Para la calibración recolectamos puntos CRUDOS (para la desviación estandar real)
+        # Para la evaluación usamos puntos SUAVIZADOS (para UI fluida)
+        fila = None
+        previos = ev.angulos_reusables(factor_umbral)
+        if previos is None:
+            fila = len(filas_kp)
+            filas_kp.append(resultado["kp"]); filas_conf.append(resultado["conf"]); filas_orientacion.append(ev.orientacion)
+        fila_raw = None
+        if ev.necesita_crudos(resultado):
+            fila_raw = len(filas_kp)
+            kp_raw, conf_raw = ev._crudos
+            filas_kp.append(kp_raw); filas_conf.append(conf_raw); filas_orientacion.append(ev.orientacion)
+        destinos.append((fila, fila_raw, previos))
+
+    if filas_kp:
+        with metricas.etapa("angulos"):
+            angulos = extraer_angulos_lote(np.stack(filas_kp), np.stack(filas_conf), filas_orientacion, factor_umbral)
+
+    for ev, resultado, destino in zip(evaluadores, resultados, destinos):
+        if destino is None: continue
+        fila, fila_raw, previos = destino
+        angulos_raw = angulos_a_dict(angulos[fila_raw]) if fila_raw is not None else None
+        if previos is None:
+            previos = angulos_a_dict(angulos[fila])
+            ev.guardar_angulos(previos, factor_umbral)
+        ev.completar(resultado, previos, angulos_raw)
+
+    return resultados
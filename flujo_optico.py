@@ -0,0 +1,108 @@
+"""
+Módulo de Flujo Óptico
+Inferencia solo en keyframes: entre uno y otro los keypoints se propagan con
+Lucas-Kanade disperso (cv2.calcOpticalFlowPyrLK). Se fuerza una inferencia nueva
+cuando el flujo pierde puntos, su error crece o la persona se mueve demasiado.
+"""
+import cv2
+import numpy as np
+
+from metricas import METRICAS_NULAS
+
+
+class PropagadorKeypoints:
+    """
+    Envuelve una función `inferir(frame) -> (kps, confs, cajas)` y la llama solo en keyframes.
+    - max_intervalo: frames como máximo entre dos inferencias
+    - error_max: error medio de LK (intensidad por píxel de la ventana) a partir del cual se re-infiere
+    - movimiento_max: desplazamiento mediano por frame, relativo al alto de la caja, que fuerza keyframe
+    - fraccion_minima: fracción de puntos confiables que debe seguir el flujo
+    - conf_minima: solo se propagan los keypoints con al menos esta confianza; los perdidos quedan en 0
+    """
+    def __init__(self, inferir, max_intervalo=5, error_max=12.0, movimiento_max=0.04, fraccion_minima=0.7,
+                 conf_minima=0.15, ventana=21, niveles=3, metricas=METRICAS_NULAS):
+        self.inferir = inferir
+        self.max_intervalo = max_intervalo
+        self.error_max = error_max
+        self.movimiento_max = movimiento_max
+        self.fraccion_minima = fraccion_minima
+        self.conf_minima = conf_minima
+        self.metricas = metricas
+        self.parametros_lk = dict(winSize=(ventana, ventana), maxLevel=niveles,
+                                  criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+        self.keyframes = 0
+        self.propagados = 0
+        self.limpiar()
+
+    def limpiar(self):
+        self._gris = None
+        self._ultimo = None
+        self._desde_keyframe = 0
+
+    def proporcion_inferencias(self):
+        total = self.keyframes + self.propagados
+        return self.keyframes / total if total else 1.0
+
+    def _keyframe(self, frame, gris):
+        kps, confs, cajas = self.inferir(frame)
+        self._gris = gris
+        self._ultimo = (kps, confs, cajas)
+        self._desde_keyframe = 0
+        self.keyframes += 1
+        return kps, confs, cajas
+
+    def _propagar(self, gris):
+        """Devuelve (kps, confs, cajas) propagados, o None si hay que volver a inferir"""
+        kps, confs, cajas = self._ultimo
+        if not len(kps):
+            # Escena vacía: nadie que seguir, se re-infiere al cumplirse el intervalo
+            return kps, confs, cajas
+
+        seguidos = confs >= self.conf_minima
+        if not seguidos.any():
+            return None
+        puntos = kps[seguidos].reshape(-1, 1, 2).astype(np.float32)
+        with self.metricas.etapa("flujo"):
+            nuevos, estado, error = cv2.calcOpticalFlowPyrLK(self._gris, gris, puntos, None, **self.parametros_lk)
+        estado = estado.reshape(-1).astype(bool)
+        if estado.mean() < self.fraccion_minima or float(error.reshape(-1)[estado].mean()) > self.error_max:
+            return None
+
+        desplazamiento = np.zeros(kps.shape, np.float32)
+        desplazamiento[seguidos] = (nuevos - puntos).reshape(-1, 2)
+        validos = np.zeros(seguidos.shape, bool)
+        validos[seguidos] = estado
+
+        nuevos_kps = kps.copy()
+        nuevos_confs = confs.copy()
+        nuevas_cajas = cajas.copy()
+        for i in range(len(kps)):
+            if not validos[i].any():
+                return None
+            d = np.median(desplazamiento[i][validos[i]], axis=0)
+            alto = max(float(cajas[i, 3] - cajas[i, 1]), 1.0)
+            if float(np.hypot(*d)) / alto > self.movimiento_max:
+                return None
+            nuevos_kps[i][validos[i]] += desplazamiento[i][validos[i]]
+            # Los que el flujo perdió no son confiables hasta el próximo keyframe
+            nuevos_confs[i][seguidos[i] & ~validos[i]] = 0.0
+            nuevas_cajas[i] += (d[0], d[1], d[0], d[1])
+        return nuevos_kps, nuevos_confs, nuevas_cajas
+
+    def procesar(self, frame, forzar=False):
+        """
+        Devuelve (kps, confs, cajas, es_keyframe) con el mismo formato que la inferencia.
+        Con `forzar` siempre infiere (p. ej. durante la calibración, que necesita puntos del modelo)
+        """
+        gris = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        if forzar or self._ultimo is None or self._desde_keyframe + 1 >= self.max_intervalo:
+            return self._keyframe(frame, gris) + (True,)
+
+        propagado = self._propagar(gris)
+        if propagado is None:
+            return self._keyframe(frame, gris) + (True,)
+        self._gris = gris
+        self._ultimo = propagado
+        self._desde_keyframe += 1
+        self.propagados += 1
+        return propagado + (False,)
@@ -0,0 +1,236 @@
+"""
+Módulo de Grabación de Sesiones
+Guarda los keypoints crudos de cada frame en un archivo binario de solo-agregado
+(cabecera fija + registros de 236 bytes, legible directo con np.memmap) para poder
+re-evaluar una sesión contra un patrón recalibrado sin volver a correr el modelo.
+
+Uso:
+    python poses.py --grabar sesion.kpr
+    python grabacion.py info sesion.kpr
+    python grabacion.py reevaluar sesiones/*.kpr --arma pistola --csv puntajes.csv
+"""
+import os
+import csv
+import struct
+import argparse
+import numpy as np
+
+from calculos import ANGULOS, PatronesCompilados, extraer_angulos_lote, evaluar_postura_lote
+
+MAGICO = b"DINDESKP"
+VERSION = 2
+TAM_CABECERA = 64
+NUM_KP = 17
+ORIENTACIONES = ("DESCONOCIDO", "PERFIL_DERECHO", "PERFIL_IZQUIERDO")
+CODIGO_ORIENTACION = {nombre: i for i, nombre in enumerate(ORIENTACIONES)}
+
+# Un registro por persona y frame. persona = -1 marca un frame sin nadie (conserva la línea de tiempo).
+# Las confianzas van en float32 como las entrega el modelo: en float16 un valor cerca de los umbrales
+# (0.3, 0.15) podía cruzarlo al redondear y la repetición elegía otra orientación u otro ángulo opcional
+DTYPE_REGISTRO = np.dtype([
+    ("t", "<f8"), ("frame", "<u4"), ("persona", "<i2"), ("orientacion", "u1"), ("reservado", "u1"),
+    ("kp", "<f4", (NUM_KP, 2)), ("conf", "<f4", (NUM_KP,)), ("caja", "<f4", (4,)),
+])
+
+
+def _cabecera():
+    datos = MAGICO + struct.pack("<HHH", VERSION, DTYPE_REGISTRO.itemsize, NUM_KP)
+    return datos + b"\0" * (TAM_CABECERA - len(datos))
+
+
+def _validar_cabecera(ruta):
+    with open(ruta, 'rb') as f:
+        datos = f.read(TAM_CABECERA)
+    if len(datos) < TAM_CABECERA or datos[:len(MAGICO)] != MAGICO:
+        raise ValueError(f"{ruta} no es una grabación de keypoints")
+    version, tam_registro, num_kp = struct.unpack_from("<HHH", datos, len(MAGICO))
+    if version != VERSION or tam_registro != DTYPE_REGISTRO.itemsize or num_kp != NUM_KP:
+        raise ValueError(f"{ruta}: versión {version} / registro {tam_registro} B no soportados")
+
+
+class GrabadorSesion:
+    """Acumula registros en un bloque en memoria y los agrega al archivo de a `tam_bloque`"""
+    def __init__(self, ruta, tam_bloque=256):
+        self.ruta = ruta
+        tam = os.path.getsize(ruta) if os.path.exists(ruta) else 0
+        if tam:
+            _validar_cabecera(ruta)
+            # Un corte a mitad de escritura deja un registro incompleto al final: se descarta
+            sobrante = (tam - TAM_CABECERA) % DTYPE_REGISTRO.itemsize
+            if sobrante:
+                with open(ruta, 'r+b') as f:
+                    f.truncate(tam - sobrante)
+        self._archivo = open(ruta, 'ab')
+        if not tam:
+            self._archivo.write(_cabecera())
+        self._bloque = np.zeros(tam_bloque, dtype=DTYPE_REGISTRO)
+        self._n = 0
+        # Al agregar a una grabación existente, la numeración de frames continúa
+        previos = leer_grabacion(ruta) if tam else ()
+        self.frame = int(previos["frame"][-1]) + 1 if len(previos) else 0
+
+    def _agregar(self, t, persona, orientacion, kp=None, conf=None, caja=None):
+        if self._n == len(self._bloque):
+            self.vaciar()
+        registro = self._bloque[self._n]
+        registro["t"] = t
+        registro["frame"] = self.frame
+        registro["persona"] = persona
+        registro["orientacion"] = CODIGO_ORIENTACION.get(orientacion, 0)
+        registro["kp"] = 0 if kp is None else kp
+        registro["conf"] = 0 if conf is None else conf
+        registro["caja"] = 0 if caja is None else caja
+        self._n += 1
+
+    def registrar(self, t, kps, confs, cajas, personas, orientaciones):
+        """Un frame: kps (N,17,2), confs (N,17), cajas (N,4), ids y orientaciones de cada persona"""
+        if not len(personas):
+            self._agregar(t, -1, "DESCONOCIDO")
+        for kp, conf, caja, persona, orientacion in zip(kps, confs, cajas, personas, orientaciones):
+            self._agregar(t, persona, orientacion, kp, conf, caja)
+        self.frame += 1
+
+    def vaciar(self):
+        if self._n:
+            self._archivo.write(self._bloque[:self._n].tobytes())
+            self._archivo.flush()
+            self._n = 0
+
+    def cerrar(self):
+        self.vaciar()
+        self._archivo.close()
+
+
+def leer_grabacion(ruta):
+    """Registros de la grabación como np.memmap de solo lectura (sin cargar el archivo en memoria)"""
+    _validar_cabecera(ruta)
+    n = (os.path.getsize(ruta) - TAM_CABECERA) // DTYPE_REGISTRO.itemsize
+    if not n:
+        return np.zeros(0, dtype=DTYPE_REGISTRO)
+    return np.memmap(ruta, dtype=DTYPE_REGISTRO, mode='r', offset=TAM_CABECERA, shape=(n,))
+
+
+class ReproductorSesion:
+    """Fuente que reemplaza al modelo: entrega (t, kps, confs, cajas) de cada frame grabado"""
+    def __init__(self, ruta):
+        self.registros = leer_grabacion(ruta)
+        cortes = np.flatnonzero(np.diff(self.registros["frame"].astype(np.int64))) + 1
+        self._inicios = np.concatenate(([0], cortes)) if len(self.registros) else np.zeros(0, np.int64)
+        self._fines = np.append(self._inicios[1:], len(self.registros))
+
+    def __len__(self):
+        return len(self._inicios)
+
+    def __iter__(self):
+        for inicio, fin in zip(self._inicios, self._fines):
+            bloque = self.registros[inicio:fin]
+            bloque = bloque[bloque["persona"] >= 0]
+            yield (float(self.registros["t"][inicio]), np.array(bloque["kp"]),
+                   np.array(bloque["conf"]), np.array(bloque["caja"]))
+
+
+def reproducir(motor, ruta):
+    """Pasa la grabación por la lógica de análisis del motor (suavizado, orientación, score) sin modelo"""
+    for t, kps, confs, cajas in ReproductorSesion(ruta):
+        yield motor.analizar_deteccion(kps, confs, cajas, t)
+
+
+def _promedio_movil(valores, grupos, ventana):
+    """Promedio de las últimas `ventana` filas de cada grupo (filas ya ordenadas por grupo y tiempo)"""
+    n = len(valores)
+    acumulado = np.cumsum(valores.astype(np.float64), axis=0)
+    acumulado = np.concatenate([np.zeros((1,) + valores.shape[1:]), acumulado])
+    indices = np.arange(n)
+    inicio_grupo = np.searchsorted(grupos, grupos, side="left")
+    desde = np.maximum(indices + 1 - ventana, inicio_grupo)
+    cantidad = (indices + 1 - desde).reshape((-1,) + (1,) * (valores.ndim - 1))
+    return (acumulado[indices + 1] - acumulado[desde]) / cantidad
+
+
+def reevaluar(registros, patrones, ventana=5):
+    """
+    Re-puntúa una grabación contra `patrones` ({orientacion: patron}) sin el modelo:
+    promedio móvil por persona (como el suavizado "promedio"), orientación grabada y
+    ángulos en lote. Devuelve un array estructurado con frame, persona, orientación,
+    ángulos y score (NaN donde no hay patrón calibrado).
+    """
+    registros = registros[registros["persona"] >= 0]
+    orden = np.lexsort((registros["frame"], registros["persona"]))
+    registros = registros[orden]
+    personas = registros["persona"].astype(np.int64)
+
+    kp = _promedio_movil(registros["kp"], personas, ventana).astype(np.float32)
+    conf = _promedio_movil(registros["conf"], personas, ventana).astype(np.float32)
+    orientaciones = np.asarray(ORIENTACIONES, dtype=object)[registros["orientacion"]]
+    angulos = extraer_angulos_lote(kp, conf, orientaciones)
+
+    salida = np.zeros(len(registros), dtype=[("frame", "<u4"), ("persona", "<i2"), ("orientacion", "u1")]
+                      + [(key, "<f8") for key in ANGULOS] + [("score", "<f8")])
+    salida["frame"] = registros["frame"]
+    salida["persona"] = registros["persona"]
+    salida["orientacion"] = registros["orientacion"]
+    for key in ANGULOS:
+        salida[key] = angulos[key]
+    salida["score"] = np.nan
+    # Cada fila contra los dos perfiles en una sola llamada; se queda con el de su orientación
+    compilados = PatronesCompilados([patrones.get(perfil, {}) for perfil in ORIENTACIONES[1:]], ORIENTACIONES[1:])
+    scores, _ = evaluar_postura_lote(angulos, compilados)
+    for columna, perfil in enumerate(compilados.nombres):
+        if not compilados.calibrados[columna]: continue
+        filas = registros["orientacion"] == CODIGO_ORIENTACION[perfil]
+        salida["score"][filas] = scores[filas, columna]
+    return salida
+
+
+def _info(ruta):
+    registros = leer_grabacion(ruta)
+    if not len(registros):
+        print(f"{ruta}: vacía")
+        return
+    personas = np.unique(registros["persona"][registros["persona"] >= 0])
+    duracion = float(registros["t"][-1] - registros["t"][0])
+    print(f"{ruta}: {int(registros['frame'][-1]) + 1} frames, {len(registros)} registros, "
+          f"{len(personas)} personas, {duracion:.1f} s")
+
+
+if __name__ == "__main__":
+    from almacenamiento import ARCHIVO_CONFIG, crear_almacen
+
+    parser = argparse.ArgumentParser(description="Herramientas de grabaciones de keypoints")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    info = sub.add_parser("info", help="Resumen de una o más grabaciones")
+    info.add_argument("grabaciones", nargs="+")
+    reeval = sub.add_parser("reevaluar", help="Re-puntúa grabaciones contra los patrones actuales de un arma")
+    reeval.add_argument("grabaciones", nargs="+")
+    reeval.add_argument("--arma", required=True)
+    reeval.add_argument("--almacen", default=ARCHIVO_CONFIG, help="Archivo de patrones (.json o .db)")
+    reeval.add_argument("--ventana", type=int, default=5, help="Ventana del suavizado (frames)")
+    reeval.add_argument("--csv", default=None, help="Escribe el score de cada frame y persona en este CSV")
+    args = parser.parse_args()
+
+    if args.comando == "info":
+        for ruta in args.grabaciones:
+            _info(ruta)
+    else:
+        almacen = crear_almacen(args.almacen)
+        patrones = almacen.cargar_arma(args.arma)
+        almacen.cerrar()
+        if patrones is None:
+            parser.error(f"El arma '{args.arma}' no existe en {args.almacen}")
+
+        escritor = None
+        if args.csv:
+            archivo_csv = open(args.csv, 'w', newline='', encoding='utf-8')
+            escritor = csv.writer(archivo_csv)
+            escritor.writerow(["grabacion", "frame", "persona", "orientacion"] + ANGULOS + ["score"])
+        for ruta in args.grabaciones:
+            salida = reevaluar(leer_grabacion(ruta), patrones, args.ventana)
+            evaluados = salida["score"][~np.isnan(salida["score"])]
+            media = f"{evaluados.mean():.1f}%" if len(evaluados) else "-"
+            print(f"{ruta}: {len(salida)} registros, {len(evaluados)} evaluados, score medio {media}")
+            if escritor is not None:
+                for fila in salida:
+                    escritor.writerow([ruta, int(fila["frame"]), int(fila["persona"]), ORIENTACIONES[fila["orientacion"]]]
+                                      + ["" if np.isnan(fila[key]) else int(fila[key]) for key in ANGULOS + ["score"]])
+        if escritor is not None:
+            archivo_csv.close()
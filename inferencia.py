@@ -0,0 +1,283 @@
+"""
+Módulo de Inferencia
+Backends intercambiables para el modelo de pose, todos con la misma interfaz:
+- BackendUltralytics: el YOLO de ultralytics (.pt), igual que hasta ahora
+- BackendONNX: ONNX Runtime en CPU (.onnx), sin cargar torch
+Los modelos se cargan de forma perezosa (o calentándolos en segundo plano mientras
+se muestra el menú) y devuelven keypoints/confianzas/cajas directamente en NumPy.
+
+Uso (exportar el modelo a ONNX una sola vez):
+    python inferencia.py exportar yolo26n-pose.pt --tam 640
+"""
+import abc
+import argparse
+import threading
+import cv2
+import numpy as np
+
+from metricas import METRICAS_NULAS
+
+NUM_KP = 17
+COLOR_RELLENO = (114, 114, 114)
+
+
+def multiplo_32(tam):
+    return -(-int(tam) // 32) * 32
+
+
+def sin_personas():
+    return np.zeros((0, NUM_KP, 2), np.float32), np.zeros((0, NUM_KP), np.float32), np.zeros((0, 4), np.float32)
+
+
+class BackendInferencia(abc.ABC):
+    """
+    Interfaz común. `inferir(frame)` devuelve keypoints (N,17,2), confianzas (N,17) y
+    cajas xyxy (N,4) en float32, en coordenadas del frame y ordenadas por confianza.
+    """
+    def __init__(self, modelo_path, tam_entrada=640, hilos=None, conf_minima=0.25):
+        self.modelo_path = modelo_path
+        self.tam_entrada = tam_entrada
+        self.hilos = hilos
+        self.conf_minima = conf_minima
+        self.modelo = None
+        self._lock = threading.Lock()
+        self._hilo_calentamiento = None
+        self._listo = False
+
+    @abc.abstractmethod
+    def _cargar(self):
+        """Carga y devuelve el modelo"""
+
+    @abc.abstractmethod
+    def _inferir(self, frame, metricas, tam_entrada=None):
+        """(kps, confs, cajas) de un frame con el modelo ya cargado"""
+
+    def cargar(self):
+        # El lock hace que la primera inferencia espere al calentamiento en vez de cargar dos veces
+        with self._lock:
+            if self.modelo is None:
+                self.modelo = self._cargar()
+        return self
+
+    def calentar(self, iteraciones=2, forma=(480, 640, 3)):
+        """Carga el modelo y lo ejecuta sobre frames vacíos para pagar la inicialización antes de usarlo"""
+        self.cargar()
+        frame = np.zeros(forma, np.uint8)
+        for _ in range(iteraciones):
+            self._inferir(frame, METRICAS_NULAS)
+
+    def calentar_en_segundo_plano(self, forma=(480, 640, 3)):
+        """Arranca el calentamiento en un hilo (p. ej. mientras el menú está en pantalla)"""
+        if self._hilo_calentamiento is None and not self._listo:
+            def calentar():
+                try:
+                    self.calentar(forma=forma)
+                except Exception as e:
+                    print(f"[ERROR] calentar modelo: {e}")
+            self._hilo_calentamiento = threading.Thread(target=calentar, name="calentamiento", daemon=True)
+            self._hilo_calentamiento.start()
+        return self._hilo_calentamiento
+
+    def esperar(self):
+        """Espera a que termine el calentamiento (si se lanzó) y deja el modelo cargado"""
+        if self._hilo_calentamiento is not None:
+            self._hilo_calentamiento.join()
+        self.cargar()
+        self._listo = True
+
+    def inferir(self, frame, metricas=METRICAS_NULAS, tam_entrada=None):
+        """`tam_entrada` permite usar otro tamaño en esta llamada (p. ej. más chico para un recorte)"""
+        if not self._listo:
+            self.esperar()
+        return self._inferir(frame, metricas, tam_entrada)
+
+    def acepta_tamano_variable(self):
+        """True si `tam_entrada` por llamada cambia de verdad el tamaño que ve el modelo"""
+        return True
+
+    def _inferir_lote(self, frames, metricas, tam_entrada=None):
+        return [self._inferir(frame, metricas, tam_entrada) for frame in frames]
+
+    def inferir_lote(self, frames, metricas=METRICAS_NULAS, tam_entrada=None):
+        """Varios frames en una sola llamada al modelo (si el backend lo permite). Una tupla por frame"""
+        if not self._listo:
+            self.esperar()
+        if not frames:
+            return []
+        return self._inferir_lote(frames, metricas, tam_entrada)
+
+
+class BackendUltralytics(BackendInferencia):
+    def _cargar(self):
+        # Importación perezosa: ultralytics arrastra torch y tarda varios segundos
+        from ultralytics import YOLO
+        if self.hilos:
+            try:
+                import torch
+                torch.set_num_threads(self.hilos)
+            except ImportError:
+                pass
+        return YOLO(self.modelo_path)
+
+    @staticmethod
+    def _a_numpy(resultado):
+        puntos = resultado.keypoints
+        if puntos is None or len(puntos.xy) == 0:
+            return sin_personas()
+        return puntos.xy.cpu().numpy(), puntos.conf.cpu().numpy(), resultado.boxes.xyxy.cpu().numpy()
+
+    def _inferir(self, frame, metricas, tam_entrada=None):
+        return self._inferir_lote([frame], metricas, tam_entrada)[0]
+
+    def _inferir_lote(self, frames, metricas, tam_entrada=None):
+        # Usamos el modelo normal (sin track) para NO pedir la libreria 'lap'
+        with metricas.etapa("inferencia"):
+            resultados = self.modelo(list(frames), imgsz=tam_entrada or self.tam_entrada, conf=self.conf_minima,
+                                     verbose=False)
+        with metricas.etapa("transferencia"):
+            return [self._a_numpy(resultado) for resultado in resultados]
+
+
+class BackendONNX(BackendInferencia):
+    """
+    ONNX Runtime en CPU. Acepta las dos salidas que exporta ultralytics para pose:
+    - end2end (yolo26): (1, max_det, 6 + 51) = x1, y1, x2, y2, score, clase, keypoints
+    - clásica (yolov8/11): (1, 56, anclas) = cx, cy, w, h, score, keypoints -> requiere NMS
+    """
+    def __init__(self, modelo_path, tam_entrada=640, hilos=None, conf_minima=0.25, umbral_nms=0.7):
+        super().__init__(modelo_path, tam_entrada, hilos, conf_minima)
+        self.umbral_nms = umbral_nms
+        self._dinamico = True
+        self._lote_dinamico = True
+        self._lienzos = {}
+
+    def _cargar(self):
+        import onnxruntime as ort
+        opciones = ort.SessionOptions()
+        opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opciones.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if self.hilos:
+            opciones.intra_op_num_threads = self.hilos
+            opciones.inter_op_num_threads = 1
+        sesion = ort.InferenceSession(self.modelo_path, sess_options=opciones, providers=["CPUExecutionProvider"])
+        entrada = sesion.get_inputs()[0]
+        self._nombre_entrada = entrada.name
+        self._lote_dinamico = not isinstance(entrada.shape[0], int)
+        alto, ancho = entrada.shape[2:4]
+        # Un modelo exportado sin dynamic=True tiene el tamaño de entrada fijo
+        if isinstance(alto, int) and isinstance(ancho, int):
+            if (alto, ancho) != (self.tam_entrada, self.tam_entrada):
+                print(f"[AVISO] {self.modelo_path} se exportó con entrada {ancho}x{alto}; se ignora tam_entrada={self.tam_entrada}")
+            self._forma_entrada = (alto, ancho)
+            self._dinamico = False
+        else:
+            self._forma_entrada = (multiplo_32(self.tam_entrada),) * 2
+        return sesion
+
+    def _letterbox(self, frame, forma):
+        """Redimensiona manteniendo la proporción y rellena con gris. Devuelve (blob, escala, dx, dy)"""
+        alto, ancho = forma
+        h, w = frame.shape[:2]
+        escala = min(alto / h, ancho / w)
+        nuevo_w, nuevo_h = int(round(w * escala)), int(round(h * escala))
+        dx, dy = (ancho - nuevo_w) // 2, (alto - nuevo_h) // 2
+        # Un lienzo por tamaño de entrada: el modo recorte alterna entre dos tamaños
+        lienzo = self._lienzos.get(forma)
+        if lienzo is None:
+            lienzo = self._lienzos[forma] = np.empty((alto, ancho, 3), np.uint8)
+        lienzo[:] = COLOR_RELLENO
+        lienzo[dy:dy + nuevo_h, dx:dx + nuevo_w] = cv2.resize(frame, (nuevo_w, nuevo_h), interpolation=cv2.INTER_LINEAR)
+        blob = cv2.dnn.blobFromImage(lienzo, 1.0 / 255.0, swapRB=True)
+        return blob, escala, dx, dy
+
+    def _decodificar(self, salida):
+        """Devuelve (cajas xyxy, scores, keypoints (N,17,3)) en coordenadas de la entrada del modelo"""
+        salida = salida[0]
+        if salida.shape[0] < salida.shape[1]:
+            salida = salida.T
+        if salida.shape[1] == 6 + NUM_KP * 3:
+            salida = salida[salida[:, 4] > self.conf_minima]
+            return salida[:, :4], salida[:, 4], salida[:, 6:].reshape(-1, NUM_KP, 3)
+
+        salida = salida[salida[:, 4] > self.conf_minima]
+        cx, cy, w, h = salida[:, 0], salida[:, 1], salida[:, 2], salida[:, 3]
+        cajas = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        indices = cv2.dnn.NMSBoxes(np.stack([cajas[:, 0], cajas[:, 1], w, h], axis=1).tolist(),
+                                   salida[:, 4].tolist(), self.conf_minima, self.umbral_nms)
+        indices = np.asarray(indices, np.int64).reshape(-1)
+        return cajas[indices], salida[indices, 4], salida[indices, 5:].reshape(-1, NUM_KP, 3)
+
+    def acepta_tamano_variable(self):
+        # La forma de la entrada solo se conoce al abrir la sesión
+        self.cargar()
+        return self._dinamico
+
+    def _forma(self, tam_entrada):
+        # Con entrada fija (exportado sin dynamic=True) el tamaño por llamada no se puede cambiar
+        if tam_entrada and self._dinamico:
+            return (multiplo_32(tam_entrada),) * 2
+        return self._forma_entrada
+
+    def _posprocesar(self, salida, forma_frame, escala, dx, dy):
+        cajas, scores, puntos = self._decodificar(salida)
+        if not len(scores):
+            return sin_personas()
+        orden = np.argsort(-scores, kind="stable")
+        cajas, puntos = cajas[orden], puntos[orden]
+        # De la entrada del modelo al frame original
+        h, w = forma_frame[:2]
+        xy = (puntos[..., :2] - (dx, dy)) / escala
+        xy[..., 0] = np.clip(xy[..., 0], 0, w)
+        xy[..., 1] = np.clip(xy[..., 1], 0, h)
+        cajas = (cajas - (dx, dy, dx, dy)) / escala
+        cajas[:, 0::2] = np.clip(cajas[:, 0::2], 0, w)
+        cajas[:, 1::2] = np.clip(cajas[:, 1::2], 0, h)
+        return xy.astype(np.float32), puntos[..., 2].astype(np.float32), cajas.astype(np.float32)
+
+    def _inferir(self, frame, metricas, tam_entrada=None):
+        with metricas.etapa("preproceso"):
+            blob, escala, dx, dy = self._letterbox(frame, self._forma(tam_entrada))
+        with metricas.etapa("inferencia"):
+            salida = self.modelo.run(None, {self._nombre_entrada: blob})[0]
+        with metricas.etapa("transferencia"):
+            return self._posprocesar(salida, frame.shape, escala, dx, dy)
+
+    def _inferir_lote(self, frames, metricas, tam_entrada=None):
+        # Un modelo exportado con batch fijo en 1 no admite lotes: se infiere frame por frame
+        if not self._lote_dinamico:
+            return super()._inferir_lote(frames, metricas, tam_entrada)
+        forma = self._forma(tam_entrada)
+        with metricas.etapa("preproceso"):
+            preparados = [self._letterbox(frame, forma) for frame in frames]
+        with metricas.etapa("inferencia"):
+            salida = self.modelo.run(None, {self._nombre_entrada: np.concatenate([p[0] for p in preparados])})[0]
+        with metricas.etapa("transferencia"):
+            return [self._posprocesar(salida[i:i + 1], frame.shape, escala, dx, dy)
+                    for i, (frame, (_, escala, dx, dy)) in enumerate(zip(frames, preparados))]
+
+
+def crear_backend(modelo_path, tam_entrada=640, hilos=None, conf_minima=0.25):
+    """Elige el backend por extensión: .onnx -> ONNX Runtime, cualquier otro -> ultralytics"""
+    if modelo_path.endswith(".onnx"):
+        return BackendONNX(modelo_path, tam_entrada, hilos, conf_minima)
+    return BackendUltralytics(modelo_path, tam_entrada, hilos, conf_minima)
+
+
+def exportar_onnx(modelo_path='yolo26n-pose.pt', tam_entrada=640, dinamico=False):
+    """Exporta el .pt a ONNX con ultralytics. Devuelve la ruta del .onnx generado"""
+    from ultralytics import YOLO
+    # Tamaño fijo por defecto: ONNX Runtime optimiza mejor el grafo con la forma conocida
+    return YOLO(modelo_path).export(format="onnx", imgsz=tam_entrada, dynamic=dinamico, simplify=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Herramientas del backend de inferencia")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    exportar = sub.add_parser("exportar", help="Exporta un modelo .pt a ONNX")
+    exportar.add_argument("modelo", nargs="?", default='yolo26n-pose.pt')
+    exportar.add_argument("--tam", type=int, default=640, help="Tamaño de entrada (múltiplo de 32)")
+    exportar.add_argument("--dinamico", action="store_true", help="Entrada de tamaño variable")
+    args = parser.parse_args()
+
+    if args.comando == "exportar":
+        print(f"Modelo exportado: {exportar_onnx(args.modelo, args.tam, args.dinamico)}")
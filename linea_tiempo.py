@@ -0,0 +1,235 @@
+"""
+Módulo de Línea de Tiempo de la Sesión
+Historial del score con memoria constante para sesiones de horas:
+- anillo con el score y el estado de cada articulación de los últimos frames
+- resúmenes por segundo y por minuto (media, mínimo, máximo, % del tiempo en tolerancia)
+  calculados de forma incremental, también en anillos de tamaño fijo
+- totales de la sesión (incluida la estabilidad: desvío de la media por segundo)
+- vaciado periódico de los resúmenes cerrados a un CSV
+"""
+import os
+import csv
+import time
+import numpy as np
+
+from calculos import ANGULOS, DENTRO, FUERA, colores_a_estados
+
+DTYPE_FRAME = np.dtype([("t", "<f8"), ("score", "<i2"), ("estados", "i1", (len(ANGULOS),))])
+DTYPE_RESUMEN = np.dtype([
+    ("inicio", "<f8"), ("frames", "<u4"), ("suma", "<f8"), ("minimo", "<i2"), ("maximo", "<i2"),
+    ("en_tolerancia", "<u4"), ("dentro", "<u4", (len(ANGULOS),)), ("visibles", "<u4", (len(ANGULOS),)),
+])
+COLUMNAS_CSV = (["escala", "inicio", "frames", "score_medio", "score_min", "score_max", "pct_en_tolerancia"]
+                + [f"pct_{key}" for key in ANGULOS])
+
+
+class AnilloRegistros:
+    """Array estructurado de capacidad fija; al llenarse pisa lo más viejo"""
+    def __init__(self, dtype, capacidad):
+        self.datos = np.zeros(capacidad, dtype=dtype)
+        self.total = 0
+
+    def __len__(self):
+        return min(self.total, len(self.datos))
+
+    def agregar(self):
+        """Devuelve el registro (vista 0-d) a completar"""
+        registro = self.datos[self.total % len(self.datos), ...]
+        self.total += 1
+        return registro
+
+    def ultimos(self, n=None):
+        """Los últimos `n` registros en orden cronológico (copia)"""
+        n = len(self) if n is None else min(n, len(self))
+        if not n:
+            return self.datos[:0].copy()
+        fin = self.total % len(self.datos)
+        indices = (np.arange(fin - n, fin)) % len(self.datos)
+        return self.datos[indices]
+
+
+def _resumen_vacio(inicio):
+    resumen = np.zeros((), dtype=DTYPE_RESUMEN)
+    resumen["inicio"] = inicio
+    resumen["minimo"] = 100
+    return resumen
+
+
+def _acumular(resumen, otro):
+    resumen["frames"] += otro["frames"]
+    resumen["suma"] += otro["suma"]
+    resumen["minimo"] = min(resumen["minimo"], otro["minimo"])
+    resumen["maximo"] = max(resumen["maximo"], otro["maximo"])
+    resumen["en_tolerancia"] += otro["en_tolerancia"]
+    resumen["dentro"] += otro["dentro"]
+    resumen["visibles"] += otro["visibles"]
+
+
+def _a_dict(resumenes):
+    """Resumen legible de un array de DTYPE_RESUMEN (sumándolos)"""
+    frames = int(resumenes["frames"].sum())
+    if not frames:
+        return {"frames": 0}
+    con_frames = resumenes[resumenes["frames"] > 0]
+    visibles = resumenes["visibles"].sum(axis=0)
+    dentro = resumenes["dentro"].sum(axis=0)
+    return {
+        "frames": frames,
+        "score_medio": round(float(resumenes["suma"].sum()) / frames, 1),
+        "score_min": int(con_frames["minimo"].min()),
+        "score_max": int(con_frames["maximo"].max()),
+        "pct_en_tolerancia": round(100.0 * int(resumenes["en_tolerancia"].sum()) / frames, 1),
+        "pct_articulaciones": {key: round(100.0 * int(d) / int(v), 1) if v else None
+                               for key, d, v in zip(ANGULOS, dentro, visibles)},
+    }
+
+
+class LineaTiempo:
+    """
+    - capacidad_frames: frames que se guardan uno por uno (por defecto ~5 min a 30 FPS)
+    - segundos / minutos: resúmenes que se conservan en memoria (1 h y 24 h)
+    - ruta: CSV donde se agregan los resúmenes cerrados cada `intervalo_vaciado` segundos
+    """
+    def __init__(self, capacidad_frames=9000, segundos=3600, minutos=1440, ruta=None, intervalo_vaciado=60.0):
+        self.frames = AnilloRegistros(DTYPE_FRAME, capacidad_frames)
+        self.segundos = AnilloRegistros(DTYPE_RESUMEN, segundos)
+        self.minutos = AnilloRegistros(DTYPE_RESUMEN, minutos)
+        self.ruta = ruta
+        self.intervalo_vaciado = intervalo_vaciado
+        self._segundo = None
+        self._minuto = None
+        self._sesion = None
+        # Estabilidad: media y desvío de los scores medios por segundo, en línea
+        self._medias_segundo = [0, 0.0, 0.0]
+        self._vaciados = {"segundo": 0, "minuto": 0}
+        self._ultimo_vaciado = time.monotonic()
+
+    def registrar(self, t, colores):
+        """Un frame evaluado: `colores` es el diccionario de evaluar_postura (con su score)"""
+        self.registrar_estados(t, colores.get("score", 0), colores_a_estados(colores))
+
+    def registrar_estados(self, t, score, estados):
+        estados = np.asarray(estados)
+        registro = self.frames.agregar()
+        registro["t"] = t
+        registro["score"] = score
+        registro["estados"] = estados
+
+        segundo = float(np.floor(t))
+        if self._segundo is None or segundo != self._segundo["inicio"]:
+            self._cerrar_segundo()
+            self._segundo = _resumen_vacio(segundo)
+            if self._sesion is None:
+                self._sesion = _resumen_vacio(segundo)
+        actual = self._segundo
+        actual["frames"] += 1
+        actual["suma"] += score
+        actual["minimo"] = min(actual["minimo"], score)
+        actual["maximo"] = max(actual["maximo"], score)
+        visibles = (estados == DENTRO) | (estados == FUERA)
+        actual["visibles"] += visibles
+        actual["dentro"] += estados == DENTRO
+        if visibles.any() and not (estados == FUERA).any():
+            actual["en_tolerancia"] += 1
+
+        # También se vacía antes de que el anillo de segundos pise algo sin guardar (repeticiones rápidas)
+        pendientes = self.segundos.total - self._vaciados["segundo"]
+        if self.ruta and (time.monotonic() - self._ultimo_vaciado >= self.intervalo_vaciado
+                          or pendientes >= len(self.segundos.datos) - 1):
+            self.vaciar()
+
+    def _cerrar_segundo(self):
+        if self._segundo is None: return
+        self.segundos.agregar()[...] = self._segundo
+        _acumular(self._sesion, self._segundo)
+        media = float(self._segundo["suma"]) / int(self._segundo["frames"])
+        self._medias_segundo[0] += 1
+        self._medias_segundo[1] += media
+        self._medias_segundo[2] += media * media
+
+        minuto = float(np.floor(self._segundo["inicio"] / 60.0) * 60.0)
+        if self._minuto is not None and self._minuto["inicio"] != minuto:
+            self.minutos.agregar()[...] = self._minuto
+            self._minuto = None
+        if self._minuto is None:
+            self._minuto = _resumen_vacio(minuto)
+        _acumular(self._minuto, self._segundo)
+        self._segundo = None
+
+    # --- Consultas ---
+
+    def ultimos_frames(self, n=300):
+        return self.frames.ultimos(n)
+
+    def _resumenes(self, anillo, abierto, desde=None, hasta=None):
+        resumenes = anillo.ultimos()
+        if abierto is not None:
+            resumenes = np.append(resumenes, abierto.copy()[None])
+        if desde is not None:
+            resumenes = resumenes[resumenes["inicio"] >= np.floor(desde)]
+        if hasta is not None:
+            resumenes = resumenes[resumenes["inicio"] < hasta]
+        return resumenes
+
+    def por_segundo(self, desde=None, hasta=None):
+        """Resúmenes por segundo (incluido el segundo en curso) entre `desde` y `hasta`"""
+        return self._resumenes(self.segundos, self._segundo, desde, hasta)
+
+    def por_minuto(self, desde=None, hasta=None):
+        """Resúmenes por minuto; el minuto en curso incluye lo ya cerrado de sus segundos"""
+        return self._resumenes(self.minutos, self._minuto, desde, hasta)
+
+    def resumen(self, desde=None, hasta=None):
+        """Totales de la sesión, o de un intervalo (con la granularidad de los resúmenes por segundo)"""
+        if desde is not None or hasta is not None:
+            return _a_dict(self.por_segundo(desde, hasta))
+        if self._sesion is None:
+            return {"frames": 0}
+        sesion = self._sesion.copy()
+        if self._segundo is not None:
+            _acumular(sesion, self._segundo)
+        resumen = _a_dict(sesion[None])
+        n, suma, suma_cuadrados = self._medias_segundo
+        if n > 1:
+            media = suma / n
+            # Estabilidad de la postura: cuánto varía la media de un segundo a otro
+            resumen["desvio_por_segundo"] = round(max(0.0, suma_cuadrados / n - media * media) ** 0.5, 2)
+        resumen["duracion_s"] = round(float(self.frames.ultimos(1)["t"][0]) - float(sesion["inicio"]), 1)
+        return resumen
+
+    # --- Persistencia ---
+
+    def _filas(self, escala, resumenes):
+        for resumen in resumenes:
+            frames = int(resumen["frames"])
+            if not frames: continue
+            yield ([escala, round(float(resumen["inicio"]), 3), frames, round(float(resumen["suma"]) / frames, 2),
+                    int(resumen["minimo"]), int(resumen["maximo"]),
+                    round(100.0 * int(resumen["en_tolerancia"]) / frames, 1)]
+                   + ["" if not v else round(100.0 * int(d) / int(v), 1)
+                      for d, v in zip(resumen["dentro"], resumen["visibles"])])
+
+    def vaciar(self):
+        """Agrega al CSV los resúmenes cerrados desde el último vaciado"""
+        self._ultimo_vaciado = time.monotonic()
+        if not self.ruta: return
+        try:
+            nuevo = not os.path.exists(self.ruta)
+            with open(self.ruta, 'a', newline='', encoding='utf-8') as f:
+                escritor = csv.writer(f)
+                if nuevo:
+                    escritor.writerow(COLUMNAS_CSV)
+                for escala, anillo in (("segundo", self.segundos), ("minuto", self.minutos)):
+                    pendientes = anillo.total - self._vaciados[escala]
+                    escritor.writerows(self._filas(escala, anillo.ultimos(pendientes)))
+                    self._vaciados[escala] = anillo.total
+        except IOError as e:
+            print(f"[ERROR] vaciar línea de tiempo: {e}")
+
+    def cerrar(self):
+        """Cierra el segundo y el minuto en curso y vacía todo"""
+        self._cerrar_segundo()
+        if self._minuto is not None:
+            self.minutos.agregar()[...] = self._minuto
+            self._minuto = None
+        self.vaciar()
@@ -0,0 +1,180 @@
+"""
+Módulo de Métricas de Rendimiento
+Cronómetros por etapa con histogramas rodantes, FPS, frames descartados y
+exportación periódica a JSON o texto Prometheus. Con MetricasNulas (el valor por
+defecto) el costo es prácticamente cero.
+"""
+import os
+import json
+import time
+import socket
+import contextlib
+import numpy as np
+
+from pipeline import ContadorFPS
+
+# Límites superiores (ms) de los buckets acumulados para Prometheus
+BUCKETS_MS = (1, 2, 5, 10, 20, 33, 50, 100, 200, 500, 1000)
+
+
+class HistogramaRodante:
+    """Últimas `capacidad` latencias (para percentiles) + buckets acumulados desde el inicio"""
+    def __init__(self, capacidad=300):
+        self.valores = np.zeros(capacidad, dtype=np.float64)
+        self.pos = 0
+        self.n = 0
+        self.conteos = [0] * (len(BUCKETS_MS) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def registrar(self, ms):
+        self.valores[self.pos] = ms
+        self.pos = (self.pos + 1) % len(self.valores)
+        self.n = min(self.n + 1, len(self.valores))
+        self.suma += ms
+        self.total += 1
+        for i, limite in enumerate(BUCKETS_MS):
+            if ms <= limite:
+                self.conteos[i] += 1
+                return
+        self.conteos[-1] += 1
+
+    def resumen(self):
+        if not self.n:
+            return {"n": 0}
+        ventana = self.valores[:self.n]
+        p50, p95, p99 = np.percentile(ventana, (50, 95, 99))
+        return {
+            "n": self.total, "media_ms": round(float(ventana.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(ventana.max()), 3),
+        }
+
+
+class _Cronometro:
+    __slots__ = ("metricas", "etapa", "inicio")
+
+    def __init__(self, metricas, etapa):
+        self.metricas = metricas
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.metricas.registrar(self.etapa, (time.perf_counter() - self.inicio) * 1000.0)
+        if tipo is not None:
+            self.metricas.registrar_error(self.etapa)
+        return False
+
+
+class Metricas:
+    """
+    Uso:
+        with metricas.etapa("inferencia"):
+            ...
+        metricas.marcar_frame()   # FPS + exportación periódica
+    El archivo de exportación se elige por extensión: .prom (Prometheus) o JSON.
+    """
+    activa = True
+
+    def __init__(self, ruta_exportacion=None, intervalo_exportacion=10.0, capacidad=300, estacion=None):
+        self.ruta_exportacion = ruta_exportacion
+        self.intervalo_exportacion = intervalo_exportacion
+        self.capacidad = capacidad
+        self.estacion = estacion or socket.gethostname()
+        self.etapas = {}
+        self.fps = ContadorFPS(ventana=60)
+        self.descartados = 0
+        self.errores = {}
+        self.inicio = time.time()
+        self._ultima_exportacion = time.monotonic()
+
+    def etapa(self, nombre):
+        return _Cronometro(self, nombre)
+
+    def registrar(self, etapa, ms):
+        histograma = self.etapas.get(etapa)
+        if histograma is None:
+            histograma = self.etapas[etapa] = HistogramaRodante(self.capacidad)
+        histograma.registrar(ms)
+
+    def registrar_error(self, etapa):
+        self.errores[etapa] = self.errores.get(etapa, 0) + 1
+
+    def marcar_descartado(self, n=1):
+        self.descartados += n
+
+    def marcar_frame(self):
+        self.fps.marcar()
+        if self.ruta_exportacion and time.monotonic() - self._ultima_exportacion >= self.intervalo_exportacion:
+            self.exportar()
+
+    def resumen(self):
+        return {
+            "estacion": self.estacion,
+            "tiempo": round(time.time(), 3),
+            "uptime_s": round(time.time() - self.inicio, 1),
+            "fps": round(self.fps.obtener_fps(), 2),
+            "frames": self.fps.total,
+            "descartados": self.descartados,
+            "errores": dict(self.errores),
+            "etapas": {nombre: h.resumen() for nombre, h in list(self.etapas.items())},
+        }
+
+    def texto_prometheus(self):
+        etiqueta = f'estacion="{self.estacion}"'
+        lineas = [
+            "# TYPE dindes_fps gauge", f"dindes_fps{{{etiqueta}}} {self.fps.obtener_fps():.3f}",
+            "# TYPE dindes_frames_total counter", f"dindes_frames_total{{{etiqueta}}} {self.fps.total}",
+            "# TYPE dindes_frames_descartados_total counter",
+            f"dindes_frames_descartados_total{{{etiqueta}}} {self.descartados}",
+            "# TYPE dindes_errores_total counter",
+        ]
+        for etapa, n in self.errores.items():
+            lineas.append(f'dindes_errores_total{{{etiqueta},etapa="{etapa}"}} {n}')
+        lineas.append("# TYPE dindes_etapa_ms histogram")
+        for etapa, h in list(self.etapas.items()):
+            base = f'{etiqueta},etapa="{etapa}"'
+            acumulado = 0
+            for limite, conteo in zip(BUCKETS_MS, h.conteos):
+                acumulado += conteo
+                lineas.append(f'dindes_etapa_ms_bucket{{{base},le="{limite}"}} {acumulado}')
+            lineas.append(f'dindes_etapa_ms_bucket{{{base},le="+Inf"}} {h.total}')
+            lineas.append(f"dindes_etapa_ms_sum{{{base}}} {h.suma:.3f}")
+            lineas.append(f"dindes_etapa_ms_count{{{base}}} {h.total}")
+        return "\n".join(lineas) + "\n"
+
+    def exportar(self, ruta=None):
+        """Escribe el archivo de forma atómica (temporal + os.replace) para que nunca se lea a medias"""
+        ruta = ruta or self.ruta_exportacion
+        self._ultima_exportacion = time.monotonic()
+        if not ruta: return
+        if ruta.endswith(".prom"):
+            contenido = self.texto_prometheus()
+        else:
+            contenido = json.dumps(self.resumen(), indent=2, ensure_ascii=False)
+        temporal = f"{ruta}.tmp"
+        try:
+            with open(temporal, 'w', encoding='utf-8') as f:
+                f.write(contenido)
+            os.replace(temporal, ruta)
+        except OSError as e:
+            print(f"[ERROR] exportar metricas: {e}")
+
+
+class MetricasNulas:
+    """Misma interfaz que Metricas sin medir nada: es lo que se usa con las métricas desactivadas"""
+    activa = False
+    _NULO = contextlib.nullcontext()
+
+    def etapa(self, nombre): return self._NULO
+    def registrar(self, etapa, ms): pass
+    def registrar_error(self, etapa): pass
+    def marcar_descartado(self, n=1): pass
+    def marcar_frame(self): pass
+    def resumen(self): return {}
+    def exportar(self, ruta=None): pass
+
+
+METRICAS_NULAS = MetricasNulas()
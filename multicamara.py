@@ -0,0 +1,297 @@
+"""
+Motor Multicámara
+Varias fuentes (cámaras o videos) en un solo proceso: en cada paso se toma un frame de
+cada una y se infieren todos en una sola llamada al modelo. Las cámaras en vivo se leen
+en hilos propios que solo conservan el frame más nuevo; los videos avanzan de a un frame
+por paso, sin saltear ninguno. Cada fuente tiene
+su propio contexto (suavizado, orientación, calibración) y el resultado se muestra en
+mosaico o se escribe a un video sin ventana.
+
+Uso:
+    python multicamara.py 0 1 --modelo yolo26n-pose.onnx
+    python multicamara.py frente.mp4 lateral.mp4 --sin-ventana --arma pistola --salida mosaico.mp4
+"""
+import math
+import time
+import queue
+import argparse
+import threading
+import cv2
+import numpy as np
+
+from almacenamiento import ARCHIVO_CONFIG, crear_almacen
+from calculos import SuavizadorTemporal
+from inferencia import crear_backend, sin_personas
+from metricas import Metricas, METRICAS_NULAS
+from pipeline import poner_ultimo
+from poses import MotorBiometrico
+import ui
+
+
+def _abrir_fuente(fuente):
+    """'0', '1'... son cámaras; cualquier otra cosa, un archivo o URL"""
+    return cv2.VideoCapture(int(fuente) if str(fuente).isdigit() else fuente)
+
+
+def _en_vivo(fuente):
+    """Cámaras locales y streams (rtsp://, http://): producen frames a su ritmo, no esperan al lote"""
+    return str(fuente).isdigit() or "://" in str(fuente)
+
+
+class CapturaUltimo:
+    """
+    Lee una cámara en su propio hilo y conserva solo el frame más nuevo: si el lote es más
+    lento que la cámara se descartan los viejos en vez de acumular latencia en el buffer.
+    """
+    def __init__(self, cap, nombre, metricas=METRICAS_NULAS):
+        self.cap = cap
+        self.metricas = metricas
+        self.cola = queue.Queue(maxsize=1)
+        self.descartados = 0
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle_captura, name=f"captura {nombre}", daemon=True)
+        self._hilo.start()
+
+    def _bucle_captura(self):
+        while not self._detener.is_set() and self.cap.isOpened():
+            exito, frame = self.cap.read()
+            if not exito: break
+            descartados = poner_ultimo(self.cola, frame)
+            if descartados:
+                self.descartados += descartados
+                self.metricas.marcar_descartado(descartados)
+        # Fin de la fuente: leer() entrega lo que quede y después None
+        self._detener.set()
+
+    def leer(self, timeout=0.1):
+        """Frame más nuevo que todavía no se entregó (espera al próximo); None cuando la cámara terminó"""
+        while True:
+            try:
+                return self.cola.get(timeout=timeout)
+            except queue.Empty:
+                if self._detener.is_set():
+                    return None
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo.is_alive():
+            self._hilo.join(timeout=1.0)
+
+
+class MotorMulticamara:
+    """
+    Un backend para todas las fuentes y un MotorBiometrico sin modelo ni cámara por fuente,
+    que recibe sus detecciones por analizar_deteccion. El recorte y los keyframes con flujo
+    óptico son por fuente y no se combinan con el lote: aquí el modelo ve todos los frames.
+    """
+    def __init__(self, fuentes, modelo_path='yolo26n-pose.pt', almacen=None, multipersona=False,
+                 modo_suavizado="promedio", mostrar=True, metricas=None, tiempo_calibracion=5,
+                 calibracion_robusta=False, tam_entrada=640, hilos=None, tam_mosaico=(640, 480)):
+        self.metricas = metricas or METRICAS_NULAS
+        self.modelo = crear_backend(modelo_path, tam_entrada, hilos)
+        self.almacen = almacen or crear_almacen(ARCHIVO_CONFIG)
+        self.nombres = [str(f) for f in fuentes]
+        self.caps = [_abrir_fuente(f) for f in fuentes]
+        self.contextos = [
+            MotorBiometrico(modelo_path=None, fuente=None, mostrar=False, multipersona=multipersona,
+                            modo_suavizado=modo_suavizado, metricas=self.metricas, almacen=self.almacen,
+                            tiempo_calibracion=tiempo_calibracion, calibracion_robusta=calibracion_robusta)
+            for _ in fuentes]
+        self.activas = [cap.isOpened() for cap in self.caps]
+        for nombre, activa in zip(self.nombres, self.activas):
+            if not activa: print(f"[ERROR] no se pudo abrir la fuente {nombre}")
+        # None para los videos: se leen en el paso, sincronizados con el resto
+        self.capturas = [CapturaUltimo(cap, nombre, self.metricas) if activa and _en_vivo(nombre) else None
+                         for cap, nombre, activa in zip(self.caps, self.nombres, self.activas)]
+
+        # Mosaico: una celda por fuente, el buffer se reutiliza entre pasos
+        self.tam_mosaico = tam_mosaico
+        self.columnas = math.ceil(math.sqrt(len(fuentes)))
+        filas = math.ceil(len(fuentes) / self.columnas)
+        ancho, alto = tam_mosaico
+        self.mosaico = np.zeros((filas * alto, self.columnas * ancho, 3), np.uint8)
+        self._estados = ["EVALUANDO"] * len(fuentes)
+        self._formas = [None] * len(fuentes)
+
+        self.mostrar = mostrar
+        self.nombre_ventana = 'DINDES - Multicamara'
+        if mostrar:
+            ui.crear_ventana(self.nombre_ventana, self.callback_click)
+
+    def seleccionar_arma(self, arma=None):
+        """El arma es la misma para todas las fuentes; sin `arma` se elige en el menú"""
+        self.modelo.calentar_en_segundo_plano()
+        if arma is None:
+            arma = ui.mostrar_menu_armas(self.nombre_ventana, self.almacen.listar_armas())
+            if arma is None: return False
+            cv2.setMouseCallback(self.nombre_ventana, self.callback_click)
+        if arma not in self.almacen.listar_armas():
+            self.contextos[0].gestor.crear_arma(arma)
+            print(f"Nueva arma creada: {arma}")
+        for contexto in self.contextos:
+            contexto.gestor.seleccionar_arma(arma)
+        print(f"Arma seleccionada: {arma} ({len(self.contextos)} fuentes)")
+        return True
+
+    def callback_click(self, evento, x, y, flags, param):
+        """El clic se pasa al contexto de la celda, en coordenadas de su frame original"""
+        ancho, alto = self.tam_mosaico
+        i = (y // alto) * self.columnas + x // ancho
+        if i >= len(self.contextos) or not self.activas[i]: return
+        forma = self._formas[i]
+        if forma is None: return
+        escala_x, escala_y = forma[1] / ancho, forma[0] / alto
+        self.contextos[i].callback_click(evento, int((x % ancho) * escala_x), int((y % alto) * escala_y), flags, param)
+
+    def fps_fuentes(self):
+        """FPS con que se graba el mosaico (un paso por frame de cada fuente): el de la primera que lo informe"""
+        for cap, activa in zip(self.caps, self.activas):
+            fps = cap.get(cv2.CAP_PROP_FPS) if activa else 0
+            if fps and fps > 0:
+                return fps
+        return 30.0
+
+    def leer(self):
+        """
+        Un frame por fuente (None si terminó): el más nuevo de cada cámara y el siguiente de cada video.
+        En los videos, grab() en todos antes de decodificar: menos desfase entre ellos
+        """
+        for i, cap in enumerate(self.caps):
+            if self.activas[i] and self.capturas[i] is None and not cap.grab():
+                self.activas[i] = False
+        frames = []
+        for i, cap in enumerate(self.caps):
+            frame = None
+            if self.activas[i]:
+                if self.capturas[i] is not None:
+                    frame = self.capturas[i].leer()
+                else:
+                    exito, frame = cap.retrieve()
+                    frame = frame if exito else None
+                self.activas[i] = frame is not None
+            frames.append(frame)
+        return frames
+
+    def _sincronizar_patrones(self):
+        """Al terminar una calibración en una fuente, las demás releen los patrones del arma"""
+        for i, contexto in enumerate(self.contextos):
+            estado = contexto.gestor.obtener_estado()
+            if self._estados[i] == "CONTEO" and estado != "CONTEO":
+                for otro in self.contextos:
+                    if otro is not contexto and otro.gestor.obtener_estado() != "CONTEO":
+                        otro.gestor.seleccionar_arma(otro.gestor.obtener_arma_actual())
+            self._estados[i] = estado
+
+    def analizar(self, frames):
+        """Una sola inferencia para todos los frames presentes; cada detección va a su contexto"""
+        indices = [i for i, frame in enumerate(frames) if frame is not None]
+        try:
+            detecciones = self.modelo.inferir_lote([frames[i] for i in indices], self.metricas)
+        except Exception as e:
+            print(f"[ERROR] inferir lote: {e}")
+            self.metricas.registrar_error("inferir")
+            detecciones = [sin_personas() for _ in indices]
+        resultados = [None] * len(frames)
+        for i, (kps, confs, cajas) in zip(indices, detecciones):
+            resultados[i] = self.contextos[i].analizar_deteccion(kps, confs, cajas)
+        self._sincronizar_patrones()
+        return resultados
+
+    def paso(self):
+        """Lee, infiere y dibuja un paso. Devuelve el mosaico, o None cuando no queda ninguna fuente"""
+        frames = self.leer()
+        if not any(self.activas):
+            return None
+        resultados = self.analizar(frames)
+        ancho, alto = self.tam_mosaico
+        for i, (frame, resultado) in enumerate(zip(frames, resultados)):
+            if frame is None: continue
+            contexto = self.contextos[i]
+            self._formas[i] = frame.shape
+            ui_frame = contexto.capa_hud.preparar(frame)
+            contexto._dibujar_frame(ui_frame, resultado)
+            fila, columna = divmod(i, self.columnas)
+            celda = self.mosaico[fila * alto:(fila + 1) * alto, columna * ancho:(columna + 1) * ancho]
+            if ui_frame.shape[:2] == (alto, ancho):
+                celda[:] = ui_frame
+            else:
+                celda[:] = cv2.resize(ui_frame, (ancho, alto), interpolation=cv2.INTER_AREA)
+            cv2.putText(celda, self.nombres[i], (10, alto - 12), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        return self.mosaico
+
+    def ejecutar(self, arma=None, salida=None):
+        if not self.seleccionar_arma(arma):
+            print("No se seleccionó arma. Cerrando sistema.")
+            self.cerrar()
+            return
+
+        escritor = None
+        if salida:
+            alto, ancho = self.mosaico.shape[:2]
+            escritor = cv2.VideoWriter(salida, cv2.VideoWriter_fourcc(*"mp4v"), self.fps_fuentes(), (ancho, alto))
+        pasos, inicio = 0, time.perf_counter()
+        try:
+            while True:
+                mosaico = self.paso()
+                if mosaico is None: break
+                pasos += 1
+                if escritor is not None:
+                    escritor.write(mosaico)
+                if self.mostrar:
+                    cv2.imshow(self.nombre_ventana, mosaico)
+                    if cv2.waitKey(1) & 0xFF == ord('q'): break
+        finally:
+            if escritor is not None:
+                escritor.release()
+            self.metricas.exportar()
+        duracion = time.perf_counter() - inicio
+        print(f"{pasos} pasos de {len(self.caps)} fuentes en {duracion:.1f} s "
+              f"({pasos / duracion if duracion else 0:.1f} pasos/s)")
+        self.cerrar()
+
+    def cerrar(self):
+        for captura in self.capturas:
+            if captura is not None:
+                captura.detener()
+        for cap in self.caps:
+            cap.release()
+        descartados = sum(c.descartados for c in self.capturas if c is not None)
+        if descartados:
+            print(f"Frames de cámara descartados por estar viejos: {descartados}")
+        for contexto in self.contextos:
+            if contexto.grabador is not None:
+                contexto.grabador.cerrar()
+        if self.mostrar:
+            cv2.destroyAllWindows()
+        print("Sistema cerrado correctamente.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DINDES - Motor Biometrico IA con varias cámaras")
+    parser.add_argument("fuentes", nargs="+", help="Índices de cámara (0, 1...) o archivos de video")
+    parser.add_argument("--modelo", default='yolo26n-pose.pt', help=".pt (ultralytics) o .onnx (ONNX Runtime en CPU)")
+    parser.add_argument("--tam-entrada", type=int, default=640, help="Lado de la imagen que ve el modelo")
+    parser.add_argument("--hilos", type=int, default=None, help="Hilos de CPU para la inferencia")
+    parser.add_argument("--almacen", default=ARCHIVO_CONFIG, help="Archivo de patrones (.json o .db)")
+    parser.add_argument("--arma", default=None, help="Arma a evaluar (obligatoria con --sin-ventana)")
+    parser.add_argument("--multipersona", action="store_true", help="Evalúa a todas las personas de cada fuente")
+    parser.add_argument("--suavizado", choices=SuavizadorTemporal.MODOS, default="promedio")
+    parser.add_argument("--tiempo-calibracion", type=int, default=5, help="Segundos de calibración")
+    parser.add_argument("--calibracion-robusta", action="store_true")
+    parser.add_argument("--celda", type=int, nargs=2, default=(640, 480), metavar=("ANCHO", "ALTO"),
+                        help="Tamaño de cada fuente en el mosaico")
+    parser.add_argument("--sin-ventana", action="store_true", help="Sin ventana (servidores, pruebas)")
+    parser.add_argument("--salida", default=None, metavar="VIDEO", help="Escribe el mosaico a un video")
+    parser.add_argument("--metricas", default=None, metavar="ARCHIVO", help="Exporta métricas a ARCHIVO (.json o .prom)")
+    args = parser.parse_args()
+    if args.sin_ventana and args.arma is None:
+        parser.error("--sin-ventana necesita --arma")
+
+    motor = MotorMulticamara(args.fuentes, modelo_path=args.modelo, almacen=crear_almacen(args.almacen),
+                             multipersona=args.multipersona, modo_suavizado=args.suavizado,
+                             mostrar=not args.sin_ventana,
+                             metricas=Metricas(ruta_exportacion=args.metricas) if args.metricas else None,
+                             tiempo_calibracion=args.tiempo_calibracion,
+                             calibracion_robusta=args.calibracion_robusta, tam_entrada=args.tam_entrada,
+                             hilos=args.hilos, tam_mosaico=tuple(args.celda))
+    motor.ejecutar(arma=args.arma, salida=args.salida)
@@ -0,0 +1,260 @@
+"""
+Módulo de Pipeline Multiproceso
+Captura e inferencia en procesos separados para usar todos los núcleos (sin GIL compartido):
+- el proceso de captura escribe cada frame directo en un anillo de shared_memory
+- N procesos trabajadores leen el frame por índice, corren el modelo y dejan keypoints,
+  confianzas y cajas en un anillo de resultados con el mismo índice
+- el proceso principal toma el resultado más nuevo (nunca vuelve atrás; si el render se
+  atrasa, saltea los intermedios), evalúa (suavizado, orientación, calibración y score)
+  y dibuja. Por las colas solo viajan índices, nunca imágenes.
+"""
+import os
+import time
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from inferencia import NUM_KP, crear_backend, sin_personas
+from pipeline import ContadorFPS
+
+
+def dtype_resultado(max_personas):
+    return np.dtype([("n", "<i4"), ("kp", "<f4", (max_personas, NUM_KP, 2)),
+                     ("conf", "<f4", (max_personas, NUM_KP)), ("caja", "<f4", (max_personas, 4))])
+
+
+class AnilloCompartido:
+    """Array NumPy sobre un bloque de shared_memory. Sin `nombre` lo crea (y lo libera al cerrar)"""
+    def __init__(self, forma, dtype, nombre=None):
+        dtype = np.dtype(dtype)
+        self.dueno = nombre is None
+        tam = int(np.prod(forma)) * dtype.itemsize
+        self.shm = shared_memory.SharedMemory(name=nombre, create=self.dueno, size=tam if self.dueno else 0)
+        self.datos = np.ndarray(forma, dtype, buffer=self.shm.buf)
+
+    @property
+    def nombre(self):
+        return self.shm.name
+
+    def cerrar(self):
+        self.datos = None
+        self.shm.close()
+        if self.dueno:
+            self.shm.unlink()
+
+
+def _abrir_fuente(fuente):
+    return cv2.VideoCapture(int(fuente) if str(fuente).isdigit() else fuente)
+
+
+def forma_fuente(fuente):
+    """Forma (alto, ancho, 3) de los frames de la fuente, leyendo uno"""
+    cap = _abrir_fuente(fuente)
+    exito, frame = cap.read()
+    cap.release()
+    if not exito:
+        raise RuntimeError(f"no se pudo leer la fuente {fuente}")
+    return frame.shape
+
+
+def _tomar_ranura(libres, listos):
+    """Una ranura libre; si no hay, la del frame listo más viejo (se descarta). None si están todas ocupadas"""
+    try:
+        return libres.get_nowait(), False
+    except queue.Empty:
+        pass
+    try:
+        ranura, _, _ = listos.get_nowait()
+        return ranura, True
+    except queue.Empty:
+        return None, False
+
+
+def _bucle_captura(fuente, nombre_frames, forma_frames, libres, listos, fin, descartados):
+    frames = AnilloCompartido(forma_frames, np.uint8, nombre_frames)
+    cap = _abrir_fuente(fuente)
+    secuencia = 0
+    try:
+        while not fin.is_set() and cap.isOpened():
+            ranura, robada = _tomar_ranura(libres, listos)
+            if ranura is None:
+                # Todo ocupado: se consume el frame de la cámara sin decodificarlo
+                if not cap.grab(): break
+                descartados.value += 1
+                continue
+            if robada:
+                descartados.value += 1
+            destino = frames.datos[ranura]
+            exito, frame = cap.read(destino)
+            if not exito:
+                libres.put(ranura)
+                break
+            if frame is not None and not np.shares_memory(frame, destino):
+                # La fuente cambió de tamaño: no queda otra que copiar
+                destino[:] = cv2.resize(frame, (destino.shape[1], destino.shape[0]))
+            listos.put((ranura, secuencia, time.time()))
+            secuencia += 1
+    finally:
+        cap.release()
+        frames.cerrar()
+        fin.set()
+
+
+def _bucle_trabajador(modelo_path, tam_entrada, hilos, nombre_frames, forma_frames, nombre_resultados,
+                      max_personas, listos, hechos, fin):
+    cv2.setNumThreads(hilos or 1)
+    frames = AnilloCompartido(forma_frames, np.uint8, nombre_frames)
+    resultados = AnilloCompartido((forma_frames[0],), dtype_resultado(max_personas), nombre_resultados)
+    backend = crear_backend(modelo_path, tam_entrada, hilos)
+    try:
+        backend.calentar(forma=forma_frames[1:])
+        while True:
+            try:
+                ranura, secuencia, t = listos.get(timeout=0.1)
+            except queue.Empty:
+                if fin.is_set(): break
+                continue
+            try:
+                kps, confs, cajas = backend.inferir(frames.datos[ranura])
+            except Exception as e:
+                print(f"[ERROR] inferir (trabajador {os.getpid()}): {e}")
+                kps, confs, cajas = sin_personas()
+            n = min(len(kps), max_personas)
+            resultado = resultados.datos[ranura]
+            resultado["n"] = n
+            resultado["kp"][:n] = kps[:n]
+            resultado["conf"][:n] = confs[:n]
+            resultado["caja"][:n] = cajas[:n]
+            hechos.put((ranura, secuencia, t))
+    finally:
+        frames.cerrar()
+        resultados.cerrar()
+        # Aviso de fin para el proceso principal
+        hechos.put(None)
+
+
+class PipelineMultiproceso:
+    """
+    Un proceso de captura y `trabajadores` procesos de inferencia, cada uno con su modelo.
+    - ranuras: frames en el anillo (los que están en inferencia + los que esperan + el que se muestra)
+    - hilos: hilos de CPU por trabajador (por defecto se reparten los núcleos)
+    - max_personas: personas por frame que entran en el anillo de resultados
+    """
+    def __init__(self, fuente, modelo_path, trabajadores=2, tam_entrada=640, hilos=None, ranuras=None,
+                 max_personas=8, metricas=None):
+        self.fuente = fuente
+        self.modelo_path = modelo_path
+        self.trabajadores = trabajadores
+        self.tam_entrada = tam_entrada
+        self.hilos = hilos or max(1, (os.cpu_count() or 1) // trabajadores)
+        self.ranuras = ranuras or trabajadores + 3
+        self.max_personas = max_personas
+        self.metricas = metricas
+        self.fps = {"inferencia": ContadorFPS(), "render": ContadorFPS()}
+        self.frames = None
+        self.resultados = None
+        self._procesos = []
+        self._actual = None
+        self._ultima_secuencia = -1
+        self._terminados = 0
+
+    def iniciar(self):
+        ctx = mp.get_context("spawn")
+        forma = (self.ranuras,) + forma_fuente(self.fuente)
+        self.frames = AnilloCompartido(forma, np.uint8)
+        self.resultados = AnilloCompartido((self.ranuras,), dtype_resultado(self.max_personas))
+        self.libres = ctx.Queue()
+        self.listos = ctx.Queue()
+        self.hechos = ctx.Queue()
+        self.fin = ctx.Event()
+        self.descartados = ctx.Value("l", 0)
+        for ranura in range(self.ranuras):
+            self.libres.put(ranura)
+
+        self._procesos = [ctx.Process(
+            target=_bucle_trabajador, name=f"inferencia-{i}", daemon=True,
+            args=(self.modelo_path, self.tam_entrada, self.hilos, self.frames.nombre, forma, self.resultados.nombre,
+                  self.max_personas, self.listos, self.hechos, self.fin)) for i in range(self.trabajadores)]
+        self._procesos.append(ctx.Process(
+            target=_bucle_captura, name="captura", daemon=True,
+            args=(self.fuente, self.frames.nombre, forma, self.libres, self.listos, self.fin, self.descartados)))
+        for proceso in self._procesos:
+            proceso.start()
+
+    def _liberar(self, ranura):
+        self.libres.put(ranura)
+
+    def _descartar(self, ranura):
+        self._liberar(ranura)
+        self.fps["inferencia"].descartados += 1
+        if self.metricas is not None:
+            self.metricas.marcar_descartado()
+
+    def _elegir(self, hecho, mejor):
+        """El más nuevo entre `hecho` y `mejor`; la ranura del otro se libera"""
+        if hecho is None:
+            self._terminados += 1
+            return mejor
+        self.fps["inferencia"].marcar()
+        ranura, secuencia, _ = hecho
+        if secuencia < self._ultima_secuencia or (mejor is not None and secuencia < mejor[1]):
+            self._descartar(ranura)
+            return mejor
+        if mejor is not None:
+            self._descartar(mejor[0])
+        return hecho
+
+    def siguiente(self, timeout=0.1):
+        """
+        Devuelve (frame, t, kps, confs, cajas) del resultado más nuevo, o None cuando todo terminó.
+        Si hay varios listos (el render va más lento que la inferencia) se queda con el de mayor
+        secuencia y descarta el resto, igual que los que llegan más viejos que el último mostrado.
+        El frame es una vista del anillo: vale hasta la próxima llamada.
+        """
+        mejor = None
+        while mejor is None:
+            if self._terminados == self.trabajadores:
+                return None
+            try:
+                hecho = self.hechos.get(timeout=timeout)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self._procesos):
+                    return None
+                continue
+            mejor = self._elegir(hecho, mejor)
+        while True:
+            try:
+                mejor = self._elegir(self.hechos.get_nowait(), mejor)
+            except queue.Empty:
+                break
+
+        ranura, secuencia, t = mejor
+        if self._actual is not None:
+            self._liberar(self._actual)
+        self._actual = ranura
+        self._ultima_secuencia = secuencia
+        resultado = self.resultados.datos[ranura]
+        n = int(resultado["n"])
+        return (self.frames.datos[ranura], t, np.array(resultado["kp"][:n]), np.array(resultado["conf"][:n]),
+                np.array(resultado["caja"][:n]))
+
+    def marcar_render(self):
+        self.fps["render"].marcar()
+
+    def resumen_fps(self):
+        return {etapa: contador.obtener_fps() for etapa, contador in self.fps.items()}
+
+    def detener(self):
+        if not self._procesos: return
+        self.fin.set()
+        for proceso in self._procesos:
+            proceso.join(timeout=5.0)
+            if proceso.is_alive():
+                proceso.terminate()
+        self._procesos = []
+        print(f"Frames descartados en la captura: {self.descartados.value}")
+        self.frames.cerrar()
+        self.resultados.cerrar()
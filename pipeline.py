@@ -0,0 +1,119 @@
+"""
+Módulo de Pipeline Concurrente
+Separa captura, inferencia y renderizado en etapas con colas acotadas para que
+la pantalla siga el ritmo de la cámara aunque la inferencia sea más lenta
+"""
+import time
+import queue
+import threading
+from collections import deque
+
+
+class ContadorFPS:
+    """Mide los cuadros por segundo de una etapa sobre una ventana deslizante"""
+    def __init__(self, ventana=30):
+        self.tiempos = deque(maxlen=ventana)
+        self.total = 0
+        self.descartados = 0
+
+    def marcar(self):
+        self.tiempos.append(time.perf_counter())
+        self.total += 1
+
+    def obtener_fps(self):
+        if len(self.tiempos) < 2:
+            return 0.0
+        dt = self.tiempos[-1] - self.tiempos[0]
+        return (len(self.tiempos) - 1) / dt if dt > 0 else 0.0
+
+
+def poner_ultimo(cola, elemento):
+    """Inserta en una cola acotada descartando lo más viejo si está llena. Devuelve cuántos se descartaron"""
+    descartados = 0
+    while True:
+        try:
+            cola.put_nowait(elemento)
+            return descartados
+        except queue.Full:
+            try:
+                cola.get_nowait()
+                descartados += 1
+            except queue.Empty:
+                pass
+
+
+class PipelineBiometrico:
+    """
+    Captura -> inferencia -> render en hilos separados.
+    - La captura solo conserva el frame más nuevo (los viejos se descartan).
+    - El hilo de inferencia ejecuta `analizar(frame)` (modelo + calculos).
+    - El render (hilo principal) dibuja cada frame con el último resultado conocido.
+    """
+    def __init__(self, cap, analizar, tam_cola_render=2, metricas=None):
+        self.cap = cap
+        self.metricas = metricas
+        self.analizar = analizar
+        self.cola_inferencia = queue.Queue(maxsize=1)
+        self.cola_render = queue.Queue(maxsize=tam_cola_render)
+        self.cola_resultados = queue.Queue(maxsize=1)
+        self.fps = {"captura": ContadorFPS(), "inferencia": ContadorFPS(), "render": ContadorFPS()}
+        self.ultimo_resultado = None
+        self._detener = threading.Event()
+        self._hilos = [
+            threading.Thread(target=self._bucle_captura, name="captura", daemon=True),
+            threading.Thread(target=self._bucle_inferencia, name="inferencia", daemon=True),
+        ]
+
+    def iniciar(self):
+        for hilo in self._hilos:
+            hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        for hilo in self._hilos:
+            if hilo.is_alive():
+                hilo.join(timeout=1.0)
+
+    def _bucle_captura(self):
+        while not self._detener.is_set() and self.cap.isOpened():
+            exito, frame = self.cap.read()
+            if not exito: break
+            self.fps["captura"].marcar()
+            descartados = poner_ultimo(self.cola_inferencia, frame)
+            self.fps["inferencia"].descartados += descartados
+            self.fps["render"].descartados += poner_ultimo(self.cola_render, frame)
+            if descartados and self.metricas is not None:
+                self.metricas.marcar_descartado(descartados)
+        # Fin de la fuente: el render vacía lo que quede y termina
+        self._detener.set()
+
+    def _bucle_inferencia(self):
+        while not self._detener.is_set():
+            try:
+                frame = self.cola_inferencia.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            resultado = self.analizar(frame)
+            self.fps["inferencia"].marcar()
+            poner_ultimo(self.cola_resultados, resultado)
+
+    def siguiente(self, timeout=0.1):
+        """Devuelve (frame, ultimo_resultado) para mostrar; (None, None) cuando la captura terminó"""
+        while True:
+            try:
+                frame = self.cola_render.get(timeout=timeout)
+                break
+            except queue.Empty:
+                if self._detener.is_set():
+                    return None, None
+        try:
+            self.ultimo_resultado = self.cola_resultados.get_nowait()
+        except queue.Empty:
+            pass
+        return frame, self.ultimo_resultado
+
+    def marcar_render(self):
+        self.fps["render"].marcar()
+
+    def resumen_fps(self):
+        return {etapa: contador.obtener_fps() for etapa, contador in self.fps.items()}
@@ -2,27 +2,115 @@
 SISTEMA OMNIDIRECCIONAL DE EVALUACIÓN TÁCTICA - DINDES
 Motor Biométrico IA para detección y evaluación de posturas
 """
+import time
+import queue
+import argparse
 import cv2
-from ultralytics import YOLO
 
 # Importar módulos personalizados
+from almacenamiento import ARCHIVO_CONFIG, crear_almacen
 from calibracion import GestorCalbracion
-from calculos import detectar_orientacion, extraer_angulos, evaluar_postura, SuavizadorTemporal
+from calculos import SuavizadorTemporal
+from control_resolucion import ControladorResolucion
+from evaluador import EvaluadorPostura, analizar_lote, crear_contadores, resultado_vacio
+from flujo_optico import PropagadorKeypoints
+from grabacion import GrabadorSesion
+from inferencia import crear_backend, sin_personas
+from linea_tiempo import LineaTiempo
+from metricas import Metricas, METRICAS_NULAS
+from multiproceso import PipelineMultiproceso
+from pipeline import PipelineBiometrico
+from roi import RecortePersona
+from seguimiento import RastreadorPersonas
 import ui
 
+# Multi-persona: líneas de tiempo por pista que se conservan (las que menos frames tienen se descartan primero)
+MAX_LINEAS_PERSONAS = 64
+
+def inferir_personas(backend, frame, metricas=METRICAS_NULAS, tam_entrada=None):
+    """Devuelve keypoints (N,17,2), confianzas (N,17) y cajas xyxy (N,4) de todas las personas"""
+    return backend.inferir(frame, metricas, tam_entrada)
+
 class MotorBiometrico:
-    def __init__(self, modelo_path='yolo26n-pose.pt'):
-        self.modelo = YOLO(modelo_path)
-        self.cap = cv2.VideoCapture(0)
-        self.gestor = GestorCalbracion() # Tolerancia manual eliminada, usa std
-        self.suavizador = SuavizadorTemporal(ventana=5)
+    def __init__(self, modelo_path='yolo26n-pose.pt', multipersona=False, modo_suavizado="promedio",
+                 fuente=0, mostrar=True, metricas=None, overlay_metricas=False, almacen=None,
+                 tiempo_calibracion=5, calibracion_robusta=False, tam_entrada=640, hilos=None,
+                 intervalo_keyframe=1, tam_recorte=None, grabacion=None, fps_objetivo=None, tam_minimo=320,
+                 registro_resolucion=None, linea_tiempo=None, orientacion_estable=False, umbral_reuso=0.0,
+                 tirador=None):
+        # modelo_path=None / fuente=None permiten usar el motor sin modelo o sin cámara (benchmarks, repeticiones)
+        self.metricas = metricas or METRICAS_NULAS
+        self.overlay_metricas = overlay_metricas and self.metricas.activa
+        self._resumen_metricas = ({}, 0.0)
+        # El backend no carga nada aquí: se calienta en segundo plano mientras se elige el arma
+        self.modelo = crear_backend(modelo_path, tam_entrada, hilos) if modelo_path else None
+        self.fuente = fuente
+        self.cap = cv2.VideoCapture(fuente) if fuente is not None else None
+        self.gestor = GestorCalbracion(almacen, estadisticas_robustas=calibracion_robusta, tirador=tirador) # Tolerancia manual eliminada, usa std
+        self.gestor.tiempo_calibracion = tiempo_calibracion
+        self.evaluador = EvaluadorPostura(self.gestor, ventana=5, modo_suavizado=modo_suavizado, metricas=self.metricas,
+                                          orientacion_estable=orientacion_estable, umbral_reuso=umbral_reuso)
+        # Trabajo reutilizado: en multi-persona lo suman los evaluadores de todas las pistas
+        self.contadores = crear_contadores() if multipersona else self.evaluador.contadores
         self.orientacion_actual = "DESCONOCIDO"
+        # Clics de la UI: los aplica quien analiza, antes del frame siguiente (en modo pipeline es otro hilo)
+        self._peticiones = queue.SimpleQueue()
         self.nombre_ventana = 'DINDES - Motor Biometrico IA'
+        self.capa_hud = ui.CapaHUD()
+
+        # Control de resolución: el tamaño de entrada se adapta al presupuesto de tiempo por inferencia
+        self.controlador = None
+        if fps_objetivo and tam_minimo > tam_entrada:
+            raise ValueError(f"tam_minimo ({tam_minimo}) es mayor que tam_entrada ({tam_entrada})")
+        if fps_objetivo and self._tamano_variable("--fps-objetivo"):
+            tamanos = list(range(tam_minimo, tam_entrada, 64)) + [tam_entrada]
+            self.controlador = ControladorResolucion(1000.0 / fps_objetivo, tamanos, registro=registro_resolucion)
+
+        # Historial del score de la sesión con memoria acotada (resúmenes por segundo y minuto).
+        # En multi-persona es el del tirador principal; cada pista lleva además la suya, solo en memoria
+        self.linea_tiempo = LineaTiempo(ruta=linea_tiempo)
+        self.lineas_personas = {}
+
+        # Grabación de keypoints crudos para re-evaluar la sesión después sin el modelo
+        self.grabador = GrabadorSesion(grabacion) if grabacion else None
 
-        ui.crear_ventana(self.nombre_ventana, self.callback_click)
+        # Recorte: tras una detección confiable el modelo solo ve la zona de la persona, a menor tamaño
+        self.recorte = None
+        if tam_recorte and self._tamano_variable("--recorte"):
+            self.recorte = RecortePersona(
+                lambda frame, tam: self.inferir_backend(frame, tam), tam_recorte=tam_recorte)
+
+        # Keyframes: el modelo corre cada `intervalo_keyframe` frames (o antes si el flujo falla)
+        self.propagador = None
+        if intervalo_keyframe > 1:
+            self.propagador = PropagadorKeypoints(lambda frame: self.inferir_modelo(frame),
+                                                  max_intervalo=intervalo_keyframe, metricas=self.metricas)
+
+        # Modo multi-persona: cada tirador con su propio ID, suavizador, orientación y score
+        self.rastreador = None
+        self.id_principal = None
+        if multipersona:
+            self.rastreador = RastreadorPersonas(
+                lambda: EvaluadorPostura(self.gestor, ventana=5, calibrar=False, modo_suavizado=modo_suavizado,
+                                         metricas=self.metricas, orientacion_estable=orientacion_estable,
+                                         umbral_reuso=umbral_reuso, contadores=self.contadores))
+
+        self.mostrar = mostrar
+        if mostrar:
+            ui.crear_ventana(self.nombre_ventana, self.callback_click)
         print("Iniciando Sistema Omnidireccional de Evaluación Táctica...")
 
-    def seleccionar_arma(self):
+    def _tamano_variable(self, opcion):
+        """Un .onnx exportado sin --dinamico ignora el tamaño pedido: la opción no tendría efecto"""
+        if self.modelo is None or self.modelo.acepta_tamano_variable():
+            return True
+        print(f"[AVISO] {self.modelo.modelo_path} tiene la entrada fija: se desactiva {opcion} "
+              f"(exportar con 'python inferencia.py exportar --dinamico')")
+        return False
+
+    def seleccionar_arma(self, calentar=True):
+        if self.modelo is not None and calentar:
+            self.modelo.calentar_en_segundo_plano()
         lista_armas = self.gestor.obtener_lista_armas()
         arma = ui.mostrar_menu_armas(self.nombre_ventana, lista_armas)
 
@@ -43,85 +131,350 @@ class MotorBiometrico:
             if 20 <= x <= 200 and 20 <= y <= 70:
                 if self.orientacion_actual != "DESCONOCIDO" and self.gestor.obtener_estado() == "EVALUANDO":
                     # Pasamos la orientación para saber a quién le recolectamos datos
-                    self.gestor.iniciar_calibracion(self.orientacion_actual)
+                    self._peticiones.put(self.orientacion_actual)
 
-    def procesar_frame(self, frame):
-        ui_frame = frame.copy()
+    def _aplicar_peticiones(self):
+        while True:
+            try:
+                orientacion = self._peticiones.get_nowait()
+            except queue.Empty:
+                return
+            if self.gestor.obtener_estado() == "EVALUANDO":
+                self.gestor.iniciar_calibracion(orientacion)
+
+    def inferir_backend(self, frame, tam_entrada=None):
+        if self.controlador is None:
+            return inferir_personas(self.modelo, frame, self.metricas, tam_entrada)
+        if tam_entrada is not None:
+            # Inferencias sobre el recorte: tamaño propio, no cuentan para el controlador
+            return inferir_personas(self.modelo, frame, self.metricas, tam_entrada)
+        inicio = time.perf_counter()
+        personas = inferir_personas(self.modelo, frame, self.metricas, self.controlador.tam_entrada)
+        self.controlador.registrar((time.perf_counter() - inicio) * 1000.0)
+        return personas
+
+    def inferir_modelo(self, frame):
+        if self.recorte is not None:
+            return self.recorte.procesar(frame)
+        return self.inferir_backend(frame)
+
+    def inferir(self, frame):
+        if self.propagador is None:
+            return self.inferir_modelo(frame)
+        # Durante la calibración cada muestra sale del modelo, nunca de puntos propagados
+        calibrando = self.gestor.obtener_estado() == "CONTEO"
+        return self.propagador.procesar(frame, forzar=calibrando)[:3]
+
+    def analizar_frame(self, frame):
+        """Inferencia + cálculos. Actualiza la calibración y devuelve lo necesario para dibujar el frame"""
+        # Antes de inferir: un clic de calibración ya fuerza keyframe en este frame
+        self._aplicar_peticiones()
         try:
-            # Usamos self.modelo normal para NO pedir la libreria 'lap'
-            resultados = self.modelo(frame, verbose=False)
-            
-            if len(resultados[0].keypoints.xy) == 0:
-                self.orientacion_actual = "DESCONOCIDO"
-                ui.dibujar_hud(ui_frame, self.orientacion_actual, self.gestor.obtener_todos_los_patrones(), self.gestor.obtener_arma_actual())
-                return ui_frame
-
-            # Puntos crudos de la IA
-            kp_raw = resultados[0].keypoints.xy[0].cpu().numpy()
-            conf_raw = resultados[0].keypoints.conf[0].cpu().numpy()
-
-            # Suavizado Temporal para estabilidad visual
-            self.suavizador.actualizar(kp_raw, conf_raw)
-            kp, conf = self.suavizador.obtener_suavizado()
-
-            self.orientacion_actual = detectar_orientacion(kp, conf)
-            ui.dibujar_hud(ui_frame, self.orientacion_actual, self.gestor.obtener_todos_los_patrones(), self.gestor.obtener_arma_actual())
-
-            if self.orientacion_actual != "DESCONOCIDO":
-                
-                # Para la calibración recolectamos puntos CRUDOS (para la desviación estandar real)
-                # Para la evaluación usamos puntos SUAVIZADOS (para UI fluida)
-                angulos = extraer_angulos(kp, self.orientacion_actual, conf)
-
-                if self.gestor.obtener_estado() == "CONTEO":
-                    if self.orientacion_actual == self.gestor.orientacion_calibrando:
-                        angulos_raw = extraer_angulos(kp_raw, self.orientacion_actual, conf_raw)
-                        self.gestor.agregar_muestra(angulos_raw)
-
-                    tiempo_restante = self.gestor.obtener_tiempo_restante_calibracion()
-                    ui.mostrar_mensaje_calibracion(ui_frame, self.orientacion_actual, tiempo_restante, len(self.gestor.muestras))
-
-                    if self.gestor.calibracion_completada():
-                        self.gestor.finalizar_calibracion()
-
-                elif self.gestor.obtener_estado() == "EVALUANDO":
-                    ui.dibujar_boton_nuevo_patron(ui_frame, self.gestor.esta_calibrado(self.orientacion_actual))
-
-                    if self.gestor.esta_calibrado(self.orientacion_actual):
-                        patron = self.gestor.obtener_patron(self.orientacion_actual)
-                        colores = evaluar_postura(angulos, patron)
-                        
-                        ui.dibujar_cuerpo(ui_frame, kp, self.orientacion_actual, colores)
-                        ui.dibujar_score(ui_frame, colores.get("score", 0))
-                    else:
-                        ui.mostrar_mensaje_prescalibracion(ui_frame)
+            kps, confs, cajas = self.inferir(frame)
+        except Exception as e:
+            print(f"[ERROR] inferir: {e}")
+            self.metricas.registrar_error("inferir")
+            kps, confs, cajas = sin_personas()
+        return self.analizar_deteccion(kps, confs, cajas)
 
+    def analizar_deteccion(self, kps, confs, cajas, t=None):
+        """Cálculos a partir de las personas detectadas (del modelo o de una grabación)"""
+        t = time.time() if t is None else t
+        self._aplicar_peticiones()
+        if self.controlador is not None:
+            self.evaluador.factor_umbral = self.controlador.factor_umbral
+        try:
+            if self.rastreador is not None:
+                resultado = self._analizar_personas(kps, confs, cajas, t)
+            elif len(kps) == 0:
+                resultado = self.evaluador.analizar(None, None, t)
+            else:
+                # Modo clásico: solo la primera persona que lista YOLO
+                resultado = self.evaluador.analizar(kps[0], confs[0], t)
+            if resultado["colores"] is not None:
+                self.linea_tiempo.registrar(t, resultado["colores"])
+            if self.grabador is not None:
+                self._grabar(t, kps, confs, cajas, resultado)
         except Exception as e:
             # Ahora vemos el error real si algo falla en vez de 'pass'
-            print(f"[ERROR] procesar_frame: {e}")
+            print(f"[ERROR] analizar_frame: {e}")
+            self.metricas.registrar_error("analizar")
+            resultado = resultado_vacio(self.gestor)
+
+        self.orientacion_actual = resultado["orientacion"]
+        return resultado
+
+    def _grabar(self, t, kps, confs, cajas, resultado):
+        if self.rastreador is None:
+            n = min(len(kps), 1)
+            self.grabador.registrar(t, kps[:n], confs[:n], cajas[:n], [0] * n, [resultado["orientacion"]] * n)
+            return
+        personas = resultado["personas"]
+        indices = [p["indice"] for p in personas]
+        self.grabador.registrar(t, kps[indices], confs[indices], cajas[indices], [p["id"] for p in personas],
+                                [p["resultado"]["orientacion"] for p in personas])
+
+    def _analizar_personas(self, kps, confs, cajas, t=None):
+        """Evalúa a todas las personas del frame, cada una con su pista y su evaluador"""
+        pares = self.rastreador.actualizar(cajas)
+        vistas = [pista for pista, _ in pares]
 
+        # La persona principal (la que calibra y ocupa el HUD) es la más grande del frame,
+        # salvo durante una calibración, donde se mantiene mientras siga a la vista
+        calibrando = self.gestor.obtener_estado() == "CONTEO"
+        if vistas and not (calibrando and any(p.id == self.id_principal for p in vistas)):
+            self.id_principal = max(vistas, key=lambda p: p.area()).id
+
+        for pista, _ in pares:
+            pista.evaluador.calibrar = pista.id == self.id_principal
+        evaluados = analizar_lote([p.evaluador for p, _ in pares], [kps[j] for _, j in pares],
+                                  [confs[j] for _, j in pares], t, metricas=self.metricas,
+                                  factor_umbral=self.evaluador.factor_umbral)
+
+        resultado = None
+        personas = []
+        for (pista, j), r in zip(pares, evaluados):
+            personas.append({"id": pista.id, "caja": pista.caja, "resultado": r, "indice": j})
+            if r["colores"] is not None:
+                self._linea_persona(pista.id).registrar(t, r["colores"])
+            if pista.evaluador.calibrar:
+                resultado = dict(r)
+
+        if resultado is None:
+            resultado = resultado_vacio(self.gestor)
+        resultado["personas"] = personas
+        resultado["id_principal"] = self.id_principal
+        return resultado
+
+    def _linea_persona(self, id_pista):
+        linea = self.lineas_personas.get(id_pista)
+        if linea is None:
+            if len(self.lineas_personas) >= MAX_LINEAS_PERSONAS:
+                # Pistas fugaces (falsas detecciones, cruces) son las que menos aportan al resumen
+                menor = min(self.lineas_personas, key=lambda i: self.lineas_personas[i].frames.total)
+                del self.lineas_personas[menor]
+            # El resumen de la sesión no depende del tamaño de los anillos: bastan unos pocos
+            linea = self.lineas_personas[id_pista] = LineaTiempo(capacidad_frames=300, segundos=600, minutos=60)
+        return linea
+
+    def dibujar_resultado(self, ui_frame, resultado):
+        for persona in resultado.get("personas", []):
+            r = persona["resultado"]
+            if persona["id"] != resultado["id_principal"] and r["colores"] is not None:
+                ui.dibujar_cuerpo(ui_frame, r["kp"], r["orientacion"], r["colores"])
+            score = r["colores"].get("score", 0) if r["colores"] is not None else None
+            ui.dibujar_etiqueta_persona(ui_frame, persona["caja"], persona["id"], score, persona["id"] == resultado["id_principal"])
+
+        orientacion = resultado["orientacion"]
+        self.capa_hud.hud(ui_frame, orientacion, self.gestor.obtener_todos_los_patrones(), self.gestor.obtener_arma_actual())
+        if orientacion == "DESCONOCIDO": return
+
+        if resultado["estado"] == "CONTEO":
+            self.capa_hud.mensaje_calibracion(ui_frame, orientacion, resultado["tiempo_restante"], resultado["num_muestras"])
+        elif resultado["estado"] == "EVALUANDO":
+            self.capa_hud.boton_nuevo_patron(ui_frame, resultado["calibrado"])
+            if resultado["colores"] is not None:
+                ui.dibujar_cuerpo(ui_frame, resultado["kp"], orientacion, resultado["colores"])
+                self.capa_hud.score(ui_frame, resultado["colores"].get("score", 0))
+            else:
+                self.capa_hud.mensaje_prescalibracion(ui_frame)
+
+    def _dibujar_frame(self, ui_frame, resultado):
+        with self.metricas.etapa("dibujo"):
+            try:
+                self.dibujar_resultado(ui_frame, resultado)
+            except Exception as e:
+                print(f"[ERROR] procesar_frame: {e}")
+                self.metricas.registrar_error("dibujo")
+        if self.overlay_metricas:
+            # Los percentiles se recalculan dos veces por segundo, no en cada frame
+            resumen, instante = self._resumen_metricas
+            if time.monotonic() - instante > 0.5:
+                resumen = self.metricas.resumen()
+                self._resumen_metricas = (resumen, time.monotonic())
+            ui.dibujar_metricas(ui_frame, resumen)
+        self.metricas.marcar_frame()
+
+    def procesar_frame(self, frame):
+        """Devuelve el frame dibujado. Es un buffer reutilizado: se pisa en la siguiente llamada"""
+        ui_frame = self.capa_hud.preparar(frame)
+        resultado = self.analizar_frame(frame)
+        self._dibujar_frame(ui_frame, resultado)
         return ui_frame
 
-    def ejecutar(self):
-        if not self.seleccionar_arma():
+    def ejecutar(self, pipeline=False, procesos=0):
+        # Con procesos el modelo se carga en cada trabajador, no en este proceso
+        if not self.seleccionar_arma(calentar=not procesos):
             print("No se seleccionó arma. Cerrando sistema.")
             self.cerrar()
             return
 
-        while self.cap.isOpened():
-            exito, frame = self.cap.read()
-            if not exito: break
-            frame_procesado = self.procesar_frame(frame)
-            cv2.imshow(self.nombre_ventana, frame_procesado)
-            if cv2.waitKey(1) & 0xFF == ord('q'): break
-            
+        if procesos:
+            self._ejecutar_multiproceso(procesos)
+        elif pipeline:
+            self._ejecutar_pipeline()
+        else:
+            while self.cap.isOpened():
+                exito, frame = self.cap.read()
+                if not exito: break
+                frame_procesado = self.procesar_frame(frame)
+                cv2.imshow(self.nombre_ventana, frame_procesado)
+                if cv2.waitKey(1) & 0xFF == ord('q'): break
+            self.metricas.exportar()
+
         self.cerrar()
 
+    def _ejecutar_pipeline(self):
+        """Captura e inferencia en hilos propios; aquí solo se dibuja el último resultado conocido"""
+        pipeline = PipelineBiometrico(self.cap, self.analizar_frame, metricas=self.metricas)
+        pipeline.iniciar()
+        try:
+            while True:
+                frame, resultado = pipeline.siguiente()
+                if frame is None: break
+                ui_frame = self.capa_hud.preparar(frame)
+                if resultado is not None:
+                    self._dibujar_frame(ui_frame, resultado)
+                ui.dibujar_fps(ui_frame, pipeline.resumen_fps())
+                cv2.imshow(self.nombre_ventana, ui_frame)
+                pipeline.marcar_render()
+                if cv2.waitKey(1) & 0xFF == ord('q'): break
+        finally:
+            pipeline.detener()
+            self.metricas.exportar()
+
+    def _ejecutar_multiproceso(self, procesos):
+        """Captura e inferencia en procesos propios; aquí se evalúa en orden y se dibuja"""
+        if self.modelo is None or self.fuente is None:
+            print("[ERROR] el modo multiproceso necesita un modelo y una fuente")
+            return
+        # La cámara la abre el proceso de captura
+        if self.cap is not None:
+            self.cap.release()
+        pipeline = PipelineMultiproceso(self.fuente, self.modelo.modelo_path, trabajadores=procesos,
+                                        tam_entrada=self.modelo.tam_entrada, hilos=self.modelo.hilos,
+                                        metricas=self.metricas)
+        pipeline.iniciar()
+        try:
+            while True:
+                siguiente = pipeline.siguiente()
+                if siguiente is None: break
+                frame, t, kps, confs, cajas = siguiente
+                ui_frame = self.capa_hud.preparar(frame)
+                self._dibujar_frame(ui_frame, self.analizar_deteccion(kps, confs, cajas, t))
+                ui.dibujar_fps(ui_frame, pipeline.resumen_fps())
+                cv2.imshow(self.nombre_ventana, ui_frame)
+                pipeline.marcar_render()
+                if cv2.waitKey(1) & 0xFF == ord('q'): break
+        finally:
+            pipeline.detener()
+            self.metricas.exportar()
+
     def cerrar(self):
-        self.cap.release()
-        cv2.destroyAllWindows()
+        if self.cap is not None:
+            self.cap.release()
+        if self.propagador is not None:
+            print(f"Inferencias del modelo: {self.propagador.keyframes} de "
+                  f"{self.propagador.keyframes + self.propagador.propagados} frames")
+        if self.grabador is not None:
+            self.grabador.cerrar()
+            print(f"Sesión grabada en {self.grabador.ruta} ({self.grabador.frame} frames)")
+        self.linea_tiempo.cerrar()
+        resumen = self.linea_tiempo.resumen()
+        if resumen["frames"]:
+            titulo = "Sesión (tirador principal)" if self.rastreador is not None else "Sesión"
+            print(f"{titulo}: {_texto_resumen(resumen)}")
+        for id_pista, linea in sorted(self.lineas_personas.items()):
+            resumen = linea.resumen()
+            if resumen["frames"]:
+                print(f"  Persona {id_pista}: {_texto_resumen(resumen)}")
+        contadores = self.contadores
+        if self.evaluador.umbral_reuso and contadores["frames"]:
+            print(f"Trabajo reutilizado en {contadores['frames']} frames: orientación {contadores['orientacion_reusada']}, "
+                  f"ángulos {contadores['angulos_reusados']}, score {contadores['puntaje_reusado']}")
+        if self.evaluador.seguidor is not None:
+            print(f"Frames con la orientación sostenida por el seguidor: {contadores['orientacion_filtrada']}")
+        if self.controlador is not None:
+            print(f"Resolución de inferencia final: {self.controlador.tam_entrada} "
+                  f"({self.controlador.cambios} cambios)")
+        if self.recorte is not None:
+            print(f"Inferencias sobre recorte: {self.recorte.recortados} de "
+                  f"{self.recorte.recortados + self.recorte.completos}")
+        # Sin ventana (repeticiones, servidores) OpenCV puede ser headless y no tener highgui
+        if self.mostrar:
+            cv2.destroyAllWindows()
         print("Sistema cerrado correctamente.")
 
+def _texto_resumen(resumen):
+    return (f"{resumen['frames']} frames evaluados, score medio {resumen['score_medio']}% "
+            f"(min {resumen['score_min']}), {resumen['pct_en_tolerancia']}% del tiempo en tolerancia")
+
 if __name__ == "__main__":
-    motor = MotorBiometrico(modelo_path='yolo26n-pose.pt')
-    motor.ejecutar()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="DINDES - Motor Biometrico IA")
+    parser.add_argument("--modelo", default='yolo26n-pose.pt', help=".pt (ultralytics) o .onnx (ONNX Runtime en CPU)")
+    parser.add_argument("--tam-entrada", type=int, default=640, help="Lado de la imagen que ve el modelo")
+    parser.add_argument("--hilos", type=int, default=None, help="Hilos de CPU para la inferencia")
+    parser.add_argument("--recorte", type=int, default=None, metavar="TAM",
+                        help="Infiere sobre el recorte de la persona con entrada TAM (p. ej. 320). "
+                             "Con .onnx requiere un modelo exportado con --dinamico")
+    parser.add_argument("--grabar", default=None, metavar="ARCHIVO",
+                        help="Graba los keypoints crudos de la sesión (.kpr) para re-evaluarla sin el modelo")
+    parser.add_argument("--linea-tiempo", default=None, metavar="CSV",
+                        help="Guarda los resúmenes del score por segundo y por minuto en este CSV "
+                             "(con --multipersona, los del tirador principal)")
+    parser.add_argument("--intervalo-keyframe", type=int, default=1,
+                        help="Corre el modelo cada N frames y propaga los keypoints con flujo óptico entre medio")
+    parser.add_argument("--fps-objetivo", type=float, default=None,
+                        help="Ajusta el tamaño de entrada (entre --tam-minimo y --tam-entrada) para sostener estos FPS de inferencia. "
+                             "Con .onnx requiere un modelo exportado con --dinamico")
+    parser.add_argument("--tam-minimo", type=int, default=320, help="Tamaño de entrada mínimo con --fps-objetivo")
+    parser.add_argument("--registro-resolucion", default=None, metavar="CSV",
+                        help="Registra cada cambio de resolución en este CSV")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Captura, inferencia y render en hilos separados (menos lag en CPU)")
+    parser.add_argument("--procesos", type=int, default=0, metavar="N",
+                        help="Captura e inferencia en procesos aparte, con N trabajadores (usa todos los núcleos). "
+                             "No se combina con --recorte, --intervalo-keyframe ni --fps-objetivo")
+    parser.add_argument("--multipersona", action="store_true",
+                        help="Evalúa a todas las personas del frame, cada una con su propio seguimiento")
+    parser.add_argument("--suavizado", choices=SuavizadorTemporal.MODOS, default="promedio",
+                        help="Filtro temporal de keypoints (one_euro: menos lag en movimientos rápidos)")
+    parser.add_argument("--metricas", default=None, metavar="ARCHIVO",
+                        help="Activa la instrumentación y exporta a ARCHIVO (.json o .prom) periódicamente")
+    parser.add_argument("--metricas-intervalo", type=float, default=10.0, help="Segundos entre exportaciones")
+    parser.add_argument("--overlay-metricas", action="store_true", help="Muestra tiempos por etapa en pantalla")
+    parser.add_argument("--orientacion-estable", action="store_true",
+                        help="Orientación con histéresis: no parpadea entre perfiles ni con un frame dudoso")
+    parser.add_argument("--umbral-reuso", type=float, default=0.0, metavar="PX",
+                        help="Si los keypoints se movieron menos de PX píxeles, reutiliza ángulos y score del frame anterior")
+    parser.add_argument("--almacen", default=ARCHIVO_CONFIG,
+                        help="Archivo de patrones: .json o .db (SQLite, importa armas_config.json la primera vez)")
+    parser.add_argument("--tirador", default=None,
+                        help="Calibra y evalúa con los patrones propios de este tirador (si no, los comunes del arma)")
+    parser.add_argument("--tiempo-calibracion", type=int, default=5, help="Segundos de calibración")
+    parser.add_argument("--calibracion-robusta", action="store_true",
+                        help="Guarda también mediana y MAD de cada ángulo en el patrón")
+    args = parser.parse_args()
+    if args.procesos:
+        # Los trabajadores corren el backend directo: recorte, keyframes y control de resolución viven en este proceso
+        for opcion, activa in (("--recorte", args.recorte), ("--intervalo-keyframe", args.intervalo_keyframe > 1),
+                               ("--fps-objetivo", args.fps_objetivo)):
+            if activa:
+                parser.error(f"--procesos no se combina con {opcion}")
+    if args.fps_objetivo and args.tam_minimo > args.tam_entrada:
+        parser.error("--tam-minimo no puede ser mayor que --tam-entrada")
+
+    metricas = None
+    if args.metricas or args.overlay_metricas:
+        metricas = Metricas(ruta_exportacion=args.metricas, intervalo_exportacion=args.metricas_intervalo)
+
+    motor = MotorBiometrico(modelo_path=args.modelo, multipersona=args.multipersona, modo_suavizado=args.suavizado,
+                            metricas=metricas, overlay_metricas=args.overlay_metricas,
+                            almacen=crear_almacen(args.almacen), tiempo_calibracion=args.tiempo_calibracion,
+                            calibracion_robusta=args.calibracion_robusta, tam_entrada=args.tam_entrada,
+                            hilos=args.hilos, intervalo_keyframe=args.intervalo_keyframe,
+                            tam_recorte=args.recorte, grabacion=args.grabar, fps_objetivo=args.fps_objetivo,
+                            tam_minimo=args.tam_minimo, registro_resolucion=args.registro_resolucion,
+                            linea_tiempo=args.linea_tiempo, orientacion_estable=args.orientacion_estable,
+                            umbral_reuso=args.umbral_reuso, tirador=args.tirador)
+    motor.ejecutar(pipeline=args.pipeline, procesos=args.procesos)
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""
+Módulo de Región de Interés (ROI)
+Después de una detección confiable, los frames siguientes se recortan a la caja
+de la(s) persona(s) más un margen de movimiento y se infieren a un tamaño más
+chico. Los keypoints se devuelven en coordenadas del frame completo, así que
+detectar_orientacion y sus umbrales en píxeles siguen funcionando igual.
+Si se pierde a la persona se vuelve a detectar sobre el frame completo.
+"""
+import numpy as np
+
+
+class RecortePersona:
+    """
+    Envuelve una función `inferir(frame, tam_entrada) -> (kps, confs, cajas)`.
+    - tam_recorte: tamaño de entrada del modelo para el recorte (None = el del backend)
+    - margen: fracción del lado mayor de la caja que se agrega alrededor (cubre el movimiento)
+    - conf_minima: confianza media de los keypoints para considerar confiable una detección
+    - refresco: cada cuántos frames se mira el frame completo (para ver a quien entra en escena)
+    - cobertura_maxima: si el recorte cubre más que esto del frame, no vale la pena recortar
+    """
+    def __init__(self, inferir, tam_recorte=320, margen=0.3, conf_minima=0.5, refresco=30,
+                 cobertura_maxima=0.6):
+        self.inferir = inferir
+        self.tam_recorte = tam_recorte
+        self.margen = margen
+        self.conf_minima = conf_minima
+        self.refresco = refresco
+        self.cobertura_maxima = cobertura_maxima
+        self.region = None
+        self._desde_completo = 0
+        self.recortados = 0
+        self.completos = 0
+
+    def limpiar(self):
+        self.region = None
+        self._desde_completo = 0
+
+    def _confiables(self, confs):
+        return confs.mean(axis=1) >= self.conf_minima if len(confs) else np.zeros(0, bool)
+
+    def _calcular_region(self, cajas, forma):
+        """Caja que contiene a todas las personas confiables más el margen, recortada al frame"""
+        alto, ancho = forma[:2]
+        x1, y1 = cajas[:, 0].min(), cajas[:, 1].min()
+        x2, y2 = cajas[:, 2].max(), cajas[:, 3].max()
+        extra = self.margen * max(x2 - x1, y2 - y1)
+        x1, y1 = max(0, int(x1 - extra)), max(0, int(y1 - extra))
+        x2, y2 = min(ancho, int(x2 + extra + 1)), min(alto, int(y2 + extra + 1))
+        if x2 <= x1 or y2 <= y1 or (x2 - x1) * (y2 - y1) > self.cobertura_maxima * alto * ancho:
+            return None
+        return x1, y1, x2, y2
+
+    def _completo(self, frame):
+        kps, confs, cajas = self.inferir(frame, None)
+        self.completos += 1
+        self._desde_completo = 0
+        confiables = self._confiables(confs)
+        self.region = self._calcular_region(cajas[confiables], frame.shape) if confiables.any() else None
+        return kps, confs, cajas
+
+    def procesar(self, frame):
+        """Devuelve (kps, confs, cajas) en coordenadas del frame completo"""
+        if self.region is None or self._desde_completo + 1 >= self.refresco:
+            return self._completo(frame)
+
+        x1, y1, x2, y2 = self.region
+        kps, confs, cajas = self.inferir(frame[y1:y2, x1:x2], self.tam_recorte)
+        confiables = self._confiables(confs)
+        if not confiables.any():
+            # Se perdió a la persona: este mismo frame se vuelve a mirar completo
+            return self._completo(frame)
+
+        kps = kps + np.array((x1, y1), kps.dtype)
+        cajas = cajas + np.array((x1, y1, x1, y1), cajas.dtype)
+        self.recortados += 1
+        self._desde_completo += 1
+        self.region = self._calcular_region(cajas[confiables], frame.shape)
+        return kps, confs, cajas
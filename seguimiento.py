@@ -0,0 +1,118 @@
+"""
+Módulo de Seguimiento Multi-Persona
+Asigna un ID estable a cada persona detectada (IoU + centroide) para que cada
+tirador conserve su propio suavizado, orientación y score entre frames
+"""
+import numpy as np
+
+
+def calcular_iou(cajas_a, cajas_b):
+    """Matriz IoU entre cajas (N,4) y (M,4) en formato xyxy"""
+    a = np.asarray(cajas_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(cajas_b, dtype=np.float64).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def _centros(cajas):
+    return np.stack([(cajas[:, 0] + cajas[:, 2]) / 2, (cajas[:, 1] + cajas[:, 3]) / 2], axis=1)
+
+
+class Pista:
+    """Una persona seguida: caja actual y su evaluador propio"""
+    def __init__(self, id_pista, caja, evaluador):
+        self.id = id_pista
+        self.caja = caja
+        self.evaluador = evaluador
+        self.perdidos = 0
+        self.edad = 0
+
+    def area(self):
+        return max(0.0, float(self.caja[2] - self.caja[0])) * max(0.0, float(self.caja[3] - self.caja[1]))
+
+
+class RastreadorPersonas:
+    """
+    Asociación greedy por IoU y, para lo que quede, por distancia de centroides.
+    Las pistas sin detección durante `max_perdidos` frames se eliminan, y nunca
+    hay más de `max_pistas` vivas, así la memoria queda acotada.
+    """
+    def __init__(self, crear_evaluador, umbral_iou=0.3, max_dist_relativa=0.5, max_perdidos=15, max_pistas=16):
+        self.crear_evaluador = crear_evaluador
+        self.umbral_iou = umbral_iou
+        self.max_dist_relativa = max_dist_relativa
+        self.max_perdidos = max_perdidos
+        self.max_pistas = max_pistas
+        self.pistas = []
+        self._siguiente_id = 1
+
+    def actualizar(self, cajas):
+        """Asocia las cajas del frame a pistas. Devuelve [(pista, indice_deteccion)]"""
+        cajas = np.asarray(cajas, dtype=np.float64).reshape(-1, 4)
+        asignadas = {}
+        libres_pistas = set(range(len(self.pistas)))
+        libres_det = set(range(len(cajas)))
+
+        if self.pistas and len(cajas):
+            cajas_pistas = np.array([p.caja for p in self.pistas], dtype=np.float64)
+
+            iou = calcular_iou(cajas_pistas, cajas)
+            for idx in np.argsort(-iou, axis=None):
+                i, j = divmod(int(idx), len(cajas))
+                if iou[i, j] < self.umbral_iou: break
+                if i in libres_pistas and j in libres_det:
+                    asignadas[j] = i; libres_pistas.discard(i); libres_det.discard(j)
+
+            if libres_pistas and libres_det:
+                centros_p = _centros(cajas_pistas)
+                centros_d = _centros(cajas)
+                dist = np.linalg.norm(centros_p[:, None, :] - centros_d[None, :, :], axis=2)
+                diagonal = np.hypot(cajas_pistas[:, 2] - cajas_pistas[:, 0], cajas_pistas[:, 3] - cajas_pistas[:, 1])
+                limite = diagonal[:, None] * self.max_dist_relativa
+                for idx in np.argsort(dist, axis=None):
+                    i, j = divmod(int(idx), len(cajas))
+                    if i in libres_pistas and j in libres_det and dist[i, j] <= limite[i, 0]:
+                        asignadas[j] = i; libres_pistas.discard(i); libres_det.discard(j)
+
+        for i, pista in enumerate(self.pistas):
+            if i in libres_pistas:
+                pista.perdidos += 1
+            else:
+                pista.perdidos = 0
+                pista.edad += 1
+        for j, i in asignadas.items():
+            self.pistas[i].caja = cajas[j]
+
+        nuevas = []
+        for j in sorted(libres_det):
+            pista = Pista(self._siguiente_id, cajas[j], self.crear_evaluador())
+            self._siguiente_id += 1
+            nuevas.append((pista, j))
+
+        pares = [(self.pistas[i], j) for j, i in asignadas.items()] + nuevas
+        self.pistas = [p for p in self.pistas if p.perdidos <= self.max_perdidos] + [p for p, _ in nuevas]
+        self._desalojar()
+        vivas = set(id(p) for p in self.pistas)
+        return [(p, j) for p, j in pares if id(p) in vivas]
+
+    def _desalojar(self):
+        if len(self.pistas) <= self.max_pistas: return
+        # Primero las que llevan más tiempo sin verse, luego las más jóvenes
+        self.pistas.sort(key=lambda p: (p.perdidos, -p.edad))
+        del self.pistas[self.max_pistas:]
+
+    def obtener_pista(self, id_pista):
+        for pista in self.pistas:
+            if pista.id == id_pista:
+                return pista
+        return None
+
+    def limpiar(self):
+        self.pistas = []
@@ -0,0 +1,414 @@
+"""
+Servidor de Evaluación
+Un solo proceso con el modelo atiende a varias estaciones por HTTP y WebSocket:
+los clientes mandan frames JPEG (o keypoints ya extraídos) y reciben orientación,
+ángulos, colores y score. Los frames de todas las estaciones se agrupan en lotes
+(con un tope de espera) para llamar al modelo una sola vez, y los patrones de cada
+arma se comparten entre las estaciones que la evalúan.
+
+Uso:
+    python servidor.py servir --modelo yolo26n-pose.onnx --almacen patrones.db --puerto 8765
+    python servidor.py cliente --video carril3.mp4 --estacion carril3 --arma pistola
+"""
+import time
+import asyncio
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from almacenamiento import ARCHIVO_CONFIG, crear_almacen
+from calibracion import GestorCalbracion
+from calculos import SuavizadorTemporal
+from evaluador import EvaluadorPostura
+from inferencia import crear_backend
+from metricas import Metricas, METRICAS_NULAS
+
+try:
+    from aiohttp import web, ClientSession, WSMsgType
+except ImportError:
+    web = None
+
+
+class AgrupadorLotes:
+    """
+    Junta los frames que llegan de distintas estaciones y los infiere en una sola llamada.
+    Un lote sale cuando llega a `tam_lote` frames o cuando el primero lleva `espera_max_ms`
+    esperando; mientras el modelo trabaja, los frames nuevos van armando el lote siguiente.
+    """
+    def __init__(self, backend, tam_lote=8, espera_max_ms=15.0, metricas=METRICAS_NULAS):
+        self.backend = backend
+        self.tam_lote = tam_lote
+        self.espera_max = espera_max_ms / 1000.0
+        self.metricas = metricas
+        # Un solo hilo para el modelo: los lotes se ejecutan de a uno
+        self._ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inferencia")
+        self._cola = None
+        self._tarea = None
+        self.lotes = 0
+        self.frames = 0
+
+    def iniciar(self):
+        self._cola = asyncio.Queue()
+        self._tarea = asyncio.get_running_loop().create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+        self._ejecutor.shutdown(wait=False)
+
+    async def inferir(self, frame):
+        futuro = asyncio.get_running_loop().create_future()
+        await self._cola.put((frame, futuro))
+        return await futuro
+
+    async def _juntar(self):
+        lote = [await self._cola.get()]
+        limite = asyncio.get_running_loop().time() + self.espera_max
+        while len(lote) < self.tam_lote:
+            restante = limite - asyncio.get_running_loop().time()
+            if restante <= 0: break
+            try:
+                lote.append(await asyncio.wait_for(self._cola.get(), restante))
+            except asyncio.TimeoutError:
+                break
+        return lote
+
+    async def _bucle(self):
+        bucle = asyncio.get_running_loop()
+        while True:
+            lote = await self._juntar()
+            try:
+                resultados = await bucle.run_in_executor(
+                    self._ejecutor, self.backend.inferir_lote, [frame for frame, _ in lote], self.metricas)
+            except Exception as e:
+                print(f"[ERROR] inferir lote: {e}")
+                self.metricas.registrar_error("inferencia")
+                for _, futuro in lote:
+                    if not futuro.done(): futuro.set_exception(e)
+                continue
+            self.lotes += 1
+            self.frames += len(lote)
+            for (_, futuro), resultado in zip(lote, resultados):
+                if not futuro.done(): futuro.set_result(resultado)
+
+
+class Estacion:
+    """
+    Estado de una estación (carril/cámara): su propio suavizado y orientación.
+    El lock hace que sus frames se evalúen de a uno y en el orden en que llegaron
+    """
+    def __init__(self, nombre, arma, gestor, modo_suavizado="promedio", metricas=METRICAS_NULAS):
+        self.nombre = nombre
+        self.arma = arma
+        self.evaluador = EvaluadorPostura(gestor, ventana=5, calibrar=False, modo_suavizado=modo_suavizado,
+                                          metricas=metricas)
+        self.lock = asyncio.Lock()
+        self.frames = 0
+        self.ultimo = time.time()
+
+
+def serializar(resultado):
+    """Resultado del evaluador a JSON (sin arrays de NumPy ni tuplas)"""
+    colores = resultado["colores"]
+    kp = resultado["kp"]
+    return {
+        "orientacion": resultado["orientacion"],
+        "estado": resultado["estado"],
+        "calibrado": resultado["calibrado"],
+        "angulos": resultado["angulos"],
+        "colores": {k: list(v) for k, v in colores.items() if k != "score"} if colores is not None else None,
+        "score": colores.get("score", 0) if colores is not None else None,
+        # En float64: redondear float32 deja ruido al pasarlo a JSON (123.4000015)
+        "kp": np.round(np.asarray(kp, np.float64), 1).tolist() if kp is not None else None,
+    }
+
+
+def leer_keypoints(datos):
+    """(kps (N,17,2), confs (N,17), t) de un mensaje JSON. ValueError si no tiene la forma esperada"""
+    if not isinstance(datos, dict):
+        raise ValueError("se esperaba un objeto JSON")
+    try:
+        kps = np.asarray(datos.get("kp", []), np.float32)
+        confs = np.asarray(datos["conf"], np.float32) if datos.get("conf") is not None else None
+        t = float(datos["t"]) if datos.get("t") is not None else None
+    except (TypeError, ValueError):
+        raise ValueError("'kp', 'conf' y 't' deben ser numéricos (listas de igual largo)")
+    if kps.size and (kps.ndim not in (2, 3) or kps.shape[-2:] != (17, 2)):
+        raise ValueError(f"'kp' debe ser 17x2 o Nx17x2, no {'x'.join(map(str, kps.shape))}")
+    kps = kps.reshape(-1, 17, 2)
+    if confs is None:
+        return kps, np.ones(kps.shape[:2], np.float32), t
+    if confs.size != len(kps) * 17 or (confs.size and (confs.ndim > 2 or confs.shape[-1] != 17)):
+        raise ValueError(f"'conf' debe tener 17 valores por persona ({len(kps)} personas)")
+    return kps, confs.reshape(-1, 17), t
+
+
+class ServidorEvaluacion:
+    """
+    - ttl_estacion: segundos sin frames tras los cuales se olvida el estado de una estación
+    """
+    def __init__(self, backend, almacen, tam_lote=8, espera_max_ms=15.0, modo_suavizado="promedio", metricas=None,
+                 ttl_estacion=300.0):
+        self.backend = backend
+        self.almacen = almacen
+        self.modo_suavizado = modo_suavizado
+        self.metricas = metricas or METRICAS_NULAS
+        self.agrupador = AgrupadorLotes(backend, tam_lote, espera_max_ms, self.metricas) if backend else None
+        # Un gestor por arma, compartido por todas las estaciones que la evalúan
+        self.gestores = {}
+        self.estaciones = {}
+        self.ttl_estacion = ttl_estacion
+        self._ultima_expiracion = time.time()
+        # Las conexiones WebSocket sin nombre de estación reciben uno propio
+        self._conexiones = itertools.count(1)
+
+    def obtener_gestor(self, arma):
+        if arma not in self.gestores:
+            gestor = GestorCalbracion(self.almacen)
+            gestor.seleccionar_arma(arma)
+            self.gestores[arma] = gestor
+        return self.gestores[arma]
+
+    def recargar(self, arma=None):
+        """Vuelve a leer los patrones del almacén (p. ej. después de que otra estación calibró, con SQLite)"""
+        for nombre, gestor in self.gestores.items():
+            if arma is None or nombre == arma:
+                gestor.seleccionar_arma(nombre)
+
+    def expirar_estaciones(self, ahora=None):
+        """Quita las estaciones que no mandan frames desde hace más de `ttl_estacion`"""
+        ahora = time.time() if ahora is None else ahora
+        self._ultima_expiracion = ahora
+        vencidas = [nombre for nombre, e in self.estaciones.items()
+                    if ahora - e.ultimo > self.ttl_estacion and not e.lock.locked()]
+        for nombre in vencidas:
+            del self.estaciones[nombre]
+        return len(vencidas)
+
+    def obtener_estacion(self, nombre, arma):
+        # Revisar las vencidas cada tanto, no en cada frame
+        if time.time() - self._ultima_expiracion > self.ttl_estacion / 10:
+            self.expirar_estaciones()
+        estacion = self.estaciones.get(nombre)
+        if estacion is None or estacion.arma != arma:
+            estacion = self.estaciones[nombre] = Estacion(nombre, arma, self.obtener_gestor(arma), self.modo_suavizado,
+                                                          self.metricas)
+        return estacion
+
+    def evaluar_keypoints(self, estacion, kps, confs, t=None):
+        """Como el modo clásico de MotorBiometrico: se evalúa la primera persona"""
+        estacion.frames += 1
+        estacion.ultimo = time.time()
+        t = estacion.ultimo if t is None else t
+        if len(kps) == 0:
+            resultado = estacion.evaluador.analizar(None, None, t)
+        else:
+            resultado = estacion.evaluador.analizar(kps[0], confs[0], t)
+        self.metricas.marcar_frame()
+        return serializar(resultado)
+
+    async def evaluar_frame(self, estacion, frame, t=None):
+        kps, confs, _ = await self.agrupador.inferir(frame)
+        return self.evaluar_keypoints(estacion, kps, confs, t)
+
+    async def evaluar_mensaje(self, estacion, datos=None, frame_jpeg=None):
+        """Un mensaje de cliente: JPEG (bytes) o JSON {"kp": (N,)17x2, "conf": (N,)17, "t": opcional}"""
+        async with estacion.lock:
+            return await self._evaluar_mensaje(estacion, datos, frame_jpeg)
+
+    async def _evaluar_mensaje(self, estacion, datos, frame_jpeg):
+        inicio = time.perf_counter()
+        if frame_jpeg is not None:
+            if self.agrupador is None:
+                return {"error": "servidor sin modelo: mandar keypoints"}
+            frame = await asyncio.get_running_loop().run_in_executor(
+                None, cv2.imdecode, np.frombuffer(frame_jpeg, np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                return {"error": "JPEG inválido"}
+            respuesta = await self.evaluar_frame(estacion, frame, datos.get("t") if datos else None)
+        else:
+            try:
+                kps, confs, t = leer_keypoints(datos)
+            except ValueError as e:
+                return {"error": str(e)}
+            respuesta = self.evaluar_keypoints(estacion, kps, confs, t)
+        respuesta["latencia_ms"] = round((time.perf_counter() - inicio) * 1000.0, 2)
+        return respuesta
+
+    # --- HTTP / WebSocket ---
+
+    def _estacion_de(self, peticion, nombre_por_defecto=None):
+        arma = peticion.query.get("arma")
+        if not arma or (arma not in self.gestores and arma not in self.almacen.listar_armas()):
+            raise web.HTTPBadRequest(text=f"arma desconocida: {arma}")
+        nombre = peticion.query.get("estacion") or nombre_por_defecto
+        if not nombre:
+            raise web.HTTPBadRequest(text="falta el parámetro 'estacion'")
+        return self.obtener_estacion(nombre, arma)
+
+    async def _http_evaluar(self, peticion):
+        # Por HTTP cada petición es independiente: el suavizado necesita saber de qué estación viene
+        estacion = self._estacion_de(peticion)
+        if peticion.content_type == "application/json":
+            try:
+                datos = await peticion.json()
+            except ValueError as e:
+                return web.json_response({"error": f"JSON inválido: {e}"}, status=400)
+            respuesta = await self.evaluar_mensaje(estacion, datos=datos)
+        else:
+            respuesta = await self.evaluar_mensaje(estacion, frame_jpeg=await peticion.read())
+        return web.json_response(respuesta, status=400 if "error" in respuesta else 200)
+
+    async def _websocket(self, peticion):
+        estacion = self._estacion_de(peticion, f"conexion-{next(self._conexiones)}")
+        ws = web.WebSocketResponse(max_msg_size=16 * 1024 * 1024)
+        await ws.prepare(peticion)
+        # Los mensajes de una conexión se responden en orden
+        async for mensaje in ws:
+            try:
+                if mensaje.type == WSMsgType.BINARY:
+                    respuesta = await self.evaluar_mensaje(estacion, frame_jpeg=mensaje.data)
+                elif mensaje.type == WSMsgType.TEXT:
+                    respuesta = await self.evaluar_mensaje(estacion, datos=mensaje.json())
+                else:
+                    continue
+            except Exception as e:
+                print(f"[ERROR] websocket {estacion.nombre}: {e}")
+                respuesta = {"error": str(e)}
+            await ws.send_json(respuesta)
+        return ws
+
+    async def _http_armas(self, peticion):
+        return web.json_response(self.almacen.listar_armas())
+
+    async def _http_recargar(self, peticion):
+        self.recargar(peticion.query.get("arma"))
+        return web.json_response({"recargadas": list(self.gestores)})
+
+    async def _http_estado(self, peticion):
+        agrupador = self.agrupador
+        return web.json_response({
+            "estaciones": {e.nombre: {"arma": e.arma, "frames": e.frames, "ultimo": round(e.ultimo, 3)}
+                           for e in self.estaciones.values()},
+            "lotes": agrupador.lotes if agrupador else 0,
+            "lote_medio": round(agrupador.frames / agrupador.lotes, 2) if agrupador and agrupador.lotes else None,
+            "metricas": self.metricas.resumen(),
+        })
+
+    def aplicacion(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/evaluar", self._http_evaluar)
+        app.router.add_get("/ws", self._websocket)
+        app.router.add_get("/armas", self._http_armas)
+        app.router.add_post("/recargar", self._http_recargar)
+        app.router.add_get("/estado", self._http_estado)
+
+        async def al_iniciar(app):
+            if self.agrupador is not None:
+                self.agrupador.iniciar()
+
+        async def al_cerrar(app):
+            if self.agrupador is not None:
+                await self.agrupador.detener()
+            self.metricas.exportar()
+        app.on_startup.append(al_iniciar)
+        app.on_cleanup.append(al_cerrar)
+        return app
+
+
+class ClienteEvaluacion:
+    """
+    Cliente de prueba por WebSocket (loopback):
+        async with ClienteEvaluacion("http://127.0.0.1:8765", "carril1", "pistola") as cliente:
+            resultado = await cliente.evaluar_frame(frame)
+    """
+    def __init__(self, url="http://127.0.0.1:8765", estacion=None, arma=None, calidad_jpeg=80):
+        self.url = url.rstrip("/")
+        self.estacion = estacion
+        self.arma = arma
+        self.calidad_jpeg = calidad_jpeg
+        self._sesion = None
+        self._ws = None
+
+    async def __aenter__(self):
+        self._sesion = ClientSession()
+        # Sin estación, el servidor le da a la conexión un estado propio
+        params = {"arma": self.arma}
+        if self.estacion:
+            params["estacion"] = self.estacion
+        self._ws = await self._sesion.ws_connect(f"{self.url}/ws", params=params, max_msg_size=16 * 1024 * 1024)
+        return self
+
+    async def __aexit__(self, *excepcion):
+        await self._ws.close()
+        await self._sesion.close()
+
+    async def evaluar_frame(self, frame):
+        exito, datos = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.calidad_jpeg])
+        await self._ws.send_bytes(datos.tobytes())
+        return await self._ws.receive_json()
+
+    async def evaluar_keypoints(self, kp, conf, t=None):
+        await self._ws.send_json({"kp": np.asarray(kp).tolist(), "conf": np.asarray(conf).tolist(), "t": t})
+        return await self._ws.receive_json()
+
+
+async def _cliente_video(args):
+    cap = cv2.VideoCapture(args.video if args.video else 0)
+    frames, inicio = 0, time.perf_counter()
+    async with ClienteEvaluacion(args.url, args.estacion, args.arma) as cliente:
+        while cap.isOpened():
+            exito, frame = cap.read()
+            if not exito: break
+            resultado = await cliente.evaluar_frame(frame)
+            frames += 1
+            print(f"{frames:5d} {resultado.get('orientacion')} score={resultado.get('score')} "
+                  f"{resultado.get('latencia_ms')} ms")
+    cap.release()
+    duracion = time.perf_counter() - inicio
+    print(f"{frames} frames en {duracion:.1f} s ({frames / duracion if duracion else 0:.1f} FPS)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de evaluación para varias estaciones")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    servir = sub.add_parser("servir", help="Levanta el servidor HTTP + WebSocket")
+    servir.add_argument("--modelo", default='yolo26n-pose.pt', help=".pt, .onnx o 'ninguno' (solo keypoints)")
+    servir.add_argument("--tam-entrada", type=int, default=640)
+    servir.add_argument("--hilos", type=int, default=None, help="Hilos de CPU para la inferencia")
+    servir.add_argument("--almacen", default=ARCHIVO_CONFIG, help="Archivo de patrones (.json o .db)")
+    servir.add_argument("--host", default="127.0.0.1", help="0.0.0.0 para aceptar estaciones de la red")
+    servir.add_argument("--puerto", type=int, default=8765)
+    servir.add_argument("--tam-lote", type=int, default=8, help="Frames como máximo por llamada al modelo")
+    servir.add_argument("--espera-lote-ms", type=float, default=15.0, help="Espera máxima para completar un lote")
+    servir.add_argument("--suavizado", choices=SuavizadorTemporal.MODOS, default="promedio")
+    servir.add_argument("--ttl-estacion", type=float, default=300.0,
+                        help="Segundos sin frames tras los cuales se olvida una estación")
+    servir.add_argument("--metricas", default=None, metavar="ARCHIVO", help="Exporta métricas a ARCHIVO (.json o .prom)")
+    cliente = sub.add_parser("cliente", help="Cliente de prueba: manda un video (o la cámara) al servidor")
+    cliente.add_argument("--url", default="http://127.0.0.1:8765")
+    cliente.add_argument("--video", default=None, help="Video a enviar (por defecto la cámara 0)")
+    cliente.add_argument("--estacion", default=None, help="Nombre de la estación (por defecto, uno por conexión)")
+    cliente.add_argument("--arma", required=True)
+    args = parser.parse_args()
+
+    if web is None:
+        print("[ERROR] el servidor necesita aiohttp (pip install aiohttp)")
+    elif args.comando == "servir":
+        backend = None
+        if args.modelo != "ninguno":
+            backend = crear_backend(args.modelo, args.tam_entrada, args.hilos)
+            backend.calentar_en_segundo_plano()
+        metricas = Metricas(ruta_exportacion=args.metricas) if args.metricas else None
+        servidor = ServidorEvaluacion(backend, crear_almacen(args.almacen), args.tam_lote, args.espera_lote_ms,
+                                      args.suavizado, metricas, args.ttl_estacion)
+        web.run_app(servidor.aplicacion(), host=args.host, port=args.puerto)
+    else:
+        asyncio.run(_cliente_video(args))
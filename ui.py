@@ -2,6 +2,7 @@
 Módulo de Interfaz de Usuario (UI)
 Contiene todas las funciones de visualización y renderizado de la pantalla
 """
+import bisect
 import cv2
 import numpy as np
 
@@ -20,88 +21,229 @@ def crear_ventana(nombre_ventana, callback):
     cv2.setMouseCallback(nombre_ventana, callback)
 
 
-def mostrar_menu_armas(nombre_ventana, lista_armas):
-    seleccion = [None]
-    input_texto = [""]
-    modo_input = [False]
-    scroll_offset = [0]
-    max_visibles = 5
+class IndicePrefijos:
+    """
+    Nombres ordenados sin distinguir mayúsculas: un prefijo es un rango contiguo que se
+    encuentra con bisect. Al agregar una letra se busca solo dentro del rango anterior.
+    """
+    def __init__(self, nombres):
+        pares = sorted((nombre.lower(), nombre) for nombre in nombres)
+        self.claves = [clave for clave, _ in pares]
+        self.nombres = [nombre for _, nombre in pares]
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def buscar(self, prefijo, lo=0, hi=None):
+        """Rango [inicio, fin) de los nombres que empiezan con `prefijo` dentro de [lo, hi)"""
+        hi = len(self.claves) if hi is None else hi
+        prefijo = prefijo.lower()
+        inicio = bisect.bisect_left(self.claves, prefijo, lo, hi)
+        fin = bisect.bisect_left(self.claves, prefijo + "\uffff", inicio, hi)
+        return inicio, fin
+
+
+class MenuArmas:
+    """
+    Menú de selección de arma dirigido por eventos: solo se redibuja después de un clic,
+    la rueda o una tecla. Escribir filtra la lista por prefijo y el scroll es virtual
+    (solo se dibujan las filas visibles del rango filtrado, aunque haya miles de armas).
+    """
+    ANCHO, ALTO = 640, 480
+    MAX_VISIBLES = 5
+    INICIO_Y = 155
+    ESPERA_MS = 50
+
+    def __init__(self, nombre_ventana, lista_armas, max_botones=256):
+        self.nombre_ventana = nombre_ventana
+        self.indice = IndicePrefijos(lista_armas or [])
+        self.seleccion = None
+        self.modo_input = False
+        self.input_texto = ""
+        self.filtro = ""
+        # Pila de rangos del filtro: borrar una letra es volver al rango anterior
+        self.rangos = [(0, len(self.indice))]
+        self.scroll = 0
+        self.sucio = True
+        self.max_botones = max_botones
+        self._botones = {}
+        self._fondos = {}
+        self._frame = np.zeros((self.ALTO, self.ANCHO, 3), np.uint8)
+
+    # --- Estado ---
+
+    @property
+    def rango(self):
+        return self.rangos[-1]
+
+    def _total_filtrado(self):
+        inicio, fin = self.rango
+        return fin - inicio
+
+    def visibles(self):
+        inicio, fin = self.rango
+        desde = inicio + self.scroll
+        return self.indice.nombres[desde:min(fin, desde + self.MAX_VISIBLES)]
+
+    def _desplazar(self, pasos):
+        maximo = max(0, self._total_filtrado() - self.MAX_VISIBLES)
+        scroll = min(maximo, max(0, self.scroll + pasos))
+        if scroll != self.scroll:
+            self.scroll = scroll
+            self.sucio = True
+
+    def agregar_letra(self, letra):
+        self.filtro += letra
+        self.rangos.append(self.indice.buscar(self.filtro, *self.rango))
+        self.scroll = 0
+        self.sucio = True
 
-    def click_menu(evento, x, y, flags, param):
+    def borrar_letra(self):
+        if not self.filtro: return
+        self.filtro = self.filtro[:-1]
+        self.rangos.pop()
+        self.scroll = 0
+        self.sucio = True
+
+    def limpiar_filtro(self):
+        self.filtro = ""
+        del self.rangos[1:]
+        self.scroll = 0
+        self.sucio = True
+
+    # --- Eventos ---
+
+    def click(self, evento, x, y, flags, param):
+        if evento == cv2.EVENT_MOUSEWHEEL:
+            if not self.modo_input:
+                self._desplazar(-1 if cv2.getMouseWheelDelta(flags) > 0 else 1)
+            return
         if evento != cv2.EVENT_LBUTTONDOWN: return
+        self.sucio = True
         if 170 <= x <= 470 and 80 <= y <= 130:
-            modo_input[0] = True; input_texto[0] = ""
+            self.modo_input = True; self.input_texto = ""
             return
-        if modo_input[0]:
+        if self.modo_input:
             if 170 <= x <= 470 and 160 <= y <= 200:
-                if input_texto[0].strip(): seleccion[0] = input_texto[0].strip()
+                if self.input_texto.strip(): self.seleccion = self.input_texto.strip()
             elif 170 <= x <= 470 and 210 <= y <= 250:
-                modo_input[0] = False; input_texto[0] = ""
+                self.modo_input = False; self.input_texto = ""
             return
-        if lista_armas and len(lista_armas) > max_visibles:
+        if self._total_filtrado() > self.MAX_VISIBLES:
             if 480 <= x <= 520 and 155 <= y <= 185:
-                scroll_offset[0] = max(0, scroll_offset[0] - 1); return
-            if 480 <= x <= 520 and 155 + max_visibles * 50 - 30 <= y <= 155 + max_visibles * 50:
-                scroll_offset[0] = min(len(lista_armas) - max_visibles, scroll_offset[0] + 1); return
-        if lista_armas:
-            inicio_y = 155
-            visible = lista_armas[scroll_offset[0]:scroll_offset[0] + max_visibles]
-            for i, arma in enumerate(visible):
-                y_top = inicio_y + i * 50
-                y_bot = y_top + 40
-                if 170 <= x <= 470 and y_top <= y <= y_bot:
-                    seleccion[0] = arma; return
-
-    cv2.setMouseCallback(nombre_ventana, click_menu)
-
-    while seleccion[0] is None:
-        frame = np.zeros((480, 640, 3), dtype=np.uint8)
-        cv2.putText(frame, "SELECCIONAR ARMA", (170, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 255), 2)
-        cv2.line(frame, (170, 50), (470, 50), (0, 255, 255), 2)
-
-        if modo_input[0]:
-            cv2.putText(frame, "NOMBRE DEL ARMA:", (170, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
-            cv2.rectangle(frame, (170, 120), (470, 150), (255, 255, 255), 1)
-            cv2.putText(frame, input_texto[0] + "|", (180, 143), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-            cv2.rectangle(frame, (170, 160), (470, 200), (0, 130, 0), -1)
-            cv2.putText(frame, "CONFIRMAR", (260, 187), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.rectangle(frame, (170, 210), (470, 250), (0, 0, 130), -1)
-            cv2.putText(frame, "CANCELAR", (265, 237), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        else:
-            cv2.rectangle(frame, (170, 80), (470, 130), (180, 100, 0), -1)
-            cv2.putText(frame, "+ NUEVA ARMA", (230, 113), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-            if lista_armas:
-                cv2.putText(frame, "ARMAS GUARDADAS:", (170, 148), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (150, 150, 150), 1)
-                inicio_y = 155
-                visible = lista_armas[scroll_offset[0]:scroll_offset[0] + max_visibles]
-                for i, arma in enumerate(visible):
-                    y_top = inicio_y + i * 50
-                    cv2.rectangle(frame, (170, y_top), (470, y_top + 40), (80, 80, 80), -1)
-                    cv2.rectangle(frame, (170, y_top), (470, y_top + 40), (0, 200, 200), 1)
-                    cv2.putText(frame, arma.upper(), (185, y_top + 27), cv2.FONT_HERSHEY_SIMPLEX, 0.65, (0, 255, 255), 2)
-                if len(lista_armas) > max_visibles:
-                    if scroll_offset[0] > 0:
-                        cv2.putText(frame, "^", (490, 180), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (200, 200, 200), 2)
-                    if scroll_offset[0] < len(lista_armas) - max_visibles:
-                        cv2.putText(frame, "v", (490, 155 + max_visibles * 50 - 10), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (200, 200, 200), 2)
-            else:
-                cv2.putText(frame, "No hay armas guardadas.", (175, 180), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (100, 100, 100), 1)
-                cv2.putText(frame, "Crea una nueva arma para comenzar.", (145, 210), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (100, 100, 100), 1)
+                self._desplazar(-1); return
+            if 480 <= x <= 520 and 155 + self.MAX_VISIBLES * 50 - 30 <= y <= 155 + self.MAX_VISIBLES * 50:
+                self._desplazar(1); return
+        for i, arma in enumerate(self.visibles()):
+            y_top = self.INICIO_Y + i * 50
+            if 170 <= x <= 470 and y_top <= y <= y_top + 40:
+                self.seleccion = arma; return
 
-        cv2.putText(frame, "Presiona 'Q' para salir", (210, 460), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (100, 100, 100), 1)
-        cv2.imshow(nombre_ventana, frame)
-        tecla = cv2.waitKey(30) & 0xFF
-
-        if tecla == ord('q'): return None
-        if modo_input[0]:
+    def tecla(self, tecla):
+        """Procesa una tecla. Devuelve False si hay que salir del menú"""
+        if tecla == 255: return True
+        # 'q' sale como siempre; con texto escrito es una letra más
+        if tecla == ord('q') and not (self.input_texto if self.modo_input else self.filtro): return False
+        if self.modo_input:
+            self.sucio = True
             if tecla == 13:
-                if input_texto[0].strip(): seleccion[0] = input_texto[0].strip()
+                if self.input_texto.strip(): self.seleccion = self.input_texto.strip()
             elif tecla == 27:
-                modo_input[0] = False; input_texto[0] = ""
-            elif tecla == 8: input_texto[0] = input_texto[0][:-1]
-            elif 32 <= tecla <= 126 and len(input_texto[0]) < 20:
-                input_texto[0] += chr(tecla)
-    return seleccion[0]
+                self.modo_input = False; self.input_texto = ""
+            elif tecla == 8: self.input_texto = self.input_texto[:-1]
+            elif 32 <= tecla <= 126 and len(self.input_texto) < 20:
+                self.input_texto += chr(tecla)
+            return True
+        if tecla == 13:
+            visibles = self.visibles()
+            if self.filtro and visibles: self.seleccion = visibles[0]
+        elif tecla == 27: self.limpiar_filtro()
+        elif tecla == 8: self.borrar_letra()
+        elif 32 <= tecla <= 126 and len(self.filtro) < 20: self.agregar_letra(chr(tecla))
+        return True
+
+    # --- Dibujo ---
+
+    def _fondo(self, clave):
+        """Partes fijas de cada pantalla, dibujadas una sola vez"""
+        if clave not in self._fondos:
+            fondo = np.zeros((self.ALTO, self.ANCHO, 3), dtype=np.uint8)
+            cv2.putText(fondo, "SELECCIONAR ARMA", (170, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 255), 2)
+            cv2.line(fondo, (170, 50), (470, 50), (0, 255, 255), 2)
+            if clave == "input":
+                cv2.putText(fondo, "NOMBRE DEL ARMA:", (170, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
+                cv2.rectangle(fondo, (170, 120), (470, 150), (255, 255, 255), 1)
+                cv2.rectangle(fondo, (170, 160), (470, 200), (0, 130, 0), -1)
+                cv2.putText(fondo, "CONFIRMAR", (260, 187), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+                cv2.rectangle(fondo, (170, 210), (470, 250), (0, 0, 130), -1)
+                cv2.putText(fondo, "CANCELAR", (265, 237), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            else:
+                cv2.rectangle(fondo, (170, 80), (470, 130), (180, 100, 0), -1)
+                cv2.putText(fondo, "+ NUEVA ARMA", (230, 113), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+                if clave == "vacio":
+                    cv2.putText(fondo, "No hay armas guardadas.", (175, 180), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (100, 100, 100), 1)
+                    cv2.putText(fondo, "Crea una nueva arma para comenzar.", (145, 210), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (100, 100, 100), 1)
+            if clave == "lista":
+                cv2.putText(fondo, "Escribe para buscar - 'Q' para salir", (160, 460), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (100, 100, 100), 1)
+            else:
+                cv2.putText(fondo, "Presiona 'Q' para salir", (210, 460), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (100, 100, 100), 1)
+            self._fondos[clave] = fondo
+        return self._fondos[clave]
+
+    def _boton(self, arma):
+        """Botón de un arma (301x41) pre-renderizado; caché acotada"""
+        boton = self._botones.get(arma)
+        if boton is None:
+            if len(self._botones) >= self.max_botones:
+                self._botones.pop(next(iter(self._botones)))
+            boton = np.zeros((41, 301, 3), np.uint8)
+            cv2.rectangle(boton, (0, 0), (300, 40), (80, 80, 80), -1)
+            cv2.rectangle(boton, (0, 0), (300, 40), (0, 200, 200), 1)
+            cv2.putText(boton, arma.upper(), (15, 27), cv2.FONT_HERSHEY_SIMPLEX, 0.65, (0, 255, 255), 2)
+            self._botones[arma] = boton
+        return boton
+
+    def dibujar(self):
+        frame = self._frame
+        if self.modo_input:
+            np.copyto(frame, self._fondo("input"))
+            cv2.putText(frame, self.input_texto + "|", (180, 143), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+            return frame
+        if not len(self.indice):
+            np.copyto(frame, self._fondo("vacio"))
+            return frame
+
+        np.copyto(frame, self._fondo("lista"))
+        total = self._total_filtrado()
+        if self.filtro:
+            cv2.putText(frame, f"BUSCAR: {self.filtro}|  ({total})", (170, 148), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+        else:
+            cv2.putText(frame, f"ARMAS GUARDADAS ({total}):", (170, 148), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (150, 150, 150), 1)
+        for i, arma in enumerate(self.visibles()):
+            y_top = self.INICIO_Y + i * 50
+            frame[y_top:y_top + 41, 170:471] = self._boton(arma)
+        if total > self.MAX_VISIBLES:
+            if self.scroll > 0:
+                cv2.putText(frame, "^", (490, 180), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (200, 200, 200), 2)
+            if self.scroll < total - self.MAX_VISIBLES:
+                cv2.putText(frame, "v", (490, 155 + self.MAX_VISIBLES * 50 - 10), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (200, 200, 200), 2)
+            cv2.putText(frame, f"{self.scroll + 1}-{min(total, self.scroll + self.MAX_VISIBLES)}",
+                        (482, 155 + self.MAX_VISIBLES * 50 + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (150, 150, 150), 1)
+        return frame
+
+    def ejecutar(self):
+        cv2.setMouseCallback(self.nombre_ventana, self.click)
+        while self.seleccion is None:
+            # Sin eventos no se dibuja nada: waitKey bloquea y la CPU queda para el calentamiento
+            if self.sucio:
+                cv2.imshow(self.nombre_ventana, self.dibujar())
+                self.sucio = False
+            if not self.tecla(cv2.waitKey(self.ESPERA_MS) & 0xFF): return None
+        return self.seleccion
+
+
+def mostrar_menu_armas(nombre_ventana, lista_armas):
+    return MenuArmas(nombre_ventana, lista_armas).ejecutar()
 
 def dibujar_hud(ui, orientacion_actual, patrones, arma_actual=None):
     cv2.rectangle(ui, (0, 0), (640, 80), (0, 0, 0), -1)
@@ -138,9 +280,12 @@ def dibujar_cuerpo(ui, kp, orientacion, colores):
         dom_h, dom_c, dom_m, dom_cad, dom_rod, dom_tob = H_I, C_I, M_I, CAD_I, ROD_I, TOB_I
         sop_h, sop_c, sop_m = H_D, C_D, M_D
 
+    # Segmentos agrupados por (color, grosor): una sola llamada a polylines por grupo
+    grupos = {}
     def linea(p1, p2, color, grosor=3):
-        cv2.line(ui, tuple(kp[p1][:2].astype(int)), tuple(kp[p2][:2].astype(int)), color, grosor)
+        grupos.setdefault((tuple(color), grosor), []).append(puntos[[p1, p2]])
 
+    puntos = kp[:, :2].astype(np.int32)
     # Brazo dominante
     col = colores.get("col_brazo", (200, 200, 200))
     linea(dom_h, dom_c, col); linea(dom_c, dom_m, col)
@@ -156,4 +301,98 @@ def dibujar_cuerpo(ui, kp, orientacion, colores):
     # Brazo Soporte
     if colores.get("col_brazo_soporte") is not None:
         col = colores["col_brazo_soporte"]
-        linea(sop_h, sop_c, col, 2); linea(sop_c, sop_m, col, 2)
\ No newline at end of file
+        linea(sop_h, sop_c, col, 2); linea(sop_c, sop_m, col, 2)
+
+    for (color, grosor), segmentos in grupos.items():
+        cv2.polylines(ui, segmentos, False, color, grosor)
+
+
+def dibujar_fps(ui, fps_etapas):
+    texto = " | ".join(f"{etapa[:3].upper()} {fps:.0f}" for etapa, fps in fps_etapas.items())
+    cv2.putText(ui, f"FPS {texto}", (10, 470), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (200, 200, 200), 1)
+
+def dibujar_etiqueta_persona(ui, caja, id_pista, score=None, principal=False):
+    x1, y1, x2, y2 = (int(v) for v in caja[:4])
+    color = (0, 255, 255) if principal else (200, 200, 200)
+    cv2.rectangle(ui, (x1, y1), (x2, y2), color, 1)
+    texto = f"#{id_pista}" if score is None else f"#{id_pista} {score}%"
+    cv2.putText(ui, texto, (x1, max(15, y1 - 8)), cv2.FONT_HERSHEY_SIMPLEX, 0.55, color, 2)
+
+def dibujar_metricas(ui, resumen):
+    if not resumen: return
+    x, y = ui.shape[1] - 230, 100
+    cv2.rectangle(ui, (x - 5, y - 18), (ui.shape[1], y + 22 * (len(resumen.get("etapas", {})) + 1) - 10), (0, 0, 0), -1)
+    cv2.putText(ui, f"FPS {resumen.get('fps', 0):.1f}  DESC {resumen.get('descartados', 0)}", (x, y),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 255), 1)
+    for i, (etapa, datos) in enumerate(resumen.get("etapas", {}).items(), start=1):
+        if not datos.get("n"): continue
+        cv2.putText(ui, f"{etapa[:12]:12s} {datos['p50_ms']:6.1f}/{datos['p99_ms']:6.1f} ms", (x, y + 22 * i),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+
+
+class CapaHUD:
+    """
+    Render con caché: los elementos que casi no cambian (barra superior, botón, mensajes,
+    score) se pre-renderizan como mosaicos imagen+máscara y solo se reconstruyen cuando
+    cambian sus datos. El frame de salida es un buffer reutilizado (sin frame.copy()).
+    """
+    def __init__(self, max_mosaicos=256):
+        self.max_mosaicos = max_mosaicos
+        self._mosaicos = {}
+        self._salida = None
+        self._lienzos = None
+
+    def preparar(self, frame):
+        """Copia el frame al buffer de salida reutilizado. El buffer se pisa en la próxima llamada"""
+        if self._salida is None or self._salida.shape != frame.shape or self._salida.dtype != frame.dtype:
+            self._salida = np.empty_like(frame)
+        np.copyto(self._salida, frame)
+        return self._salida
+
+    def _construir(self, forma, dibujar):
+        # Se dibuja sobre dos fondos distintos: lo que coincide es lo dibujado (incluido el negro opaco)
+        if self._lienzos is None or self._lienzos[0].shape != forma:
+            self._lienzos = (np.zeros(forma, np.uint8), np.ones(forma, np.uint8))
+        fondo_a, fondo_b = self._lienzos
+        fondo_a.fill(0); fondo_b.fill(1)
+        dibujar(fondo_a); dibujar(fondo_b)
+        mascara = np.all(fondo_a == fondo_b, axis=2)
+        filas, columnas = np.nonzero(mascara)
+        if not len(filas):
+            return None
+        y1, y2, x1, x2 = filas.min(), filas.max() + 1, columnas.min(), columnas.max() + 1
+        return x1, y1, fondo_a[y1:y2, x1:x2].copy(), mascara[y1:y2, x1:x2].astype(np.uint8)
+
+    def _componer(self, ui, clave, dibujar):
+        # Los mosaicos dependen del tamaño del frame (el HUD recorta contra el borde)
+        clave = (ui.shape,) + clave
+        mosaico = self._mosaicos.get(clave, False)
+        if mosaico is False:
+            if len(self._mosaicos) >= self.max_mosaicos:
+                self._mosaicos.clear()
+            mosaico = self._mosaicos[clave] = self._construir(ui.shape, dibujar)
+        if mosaico is None: return
+        x, y, imagen, mascara = mosaico
+        alto, ancho = mascara.shape
+        # cv2.copyTo escribe in-place sobre la vista del buffer
+        cv2.copyTo(imagen, mascara, ui[y:y + alto, x:x + ancho])
+
+    def hud(self, ui, orientacion_actual, patrones, arma_actual=None):
+        calibrado = bool(patrones.get(orientacion_actual, {}).get("calibrado"))
+        self._componer(ui, ("hud", orientacion_actual, calibrado, arma_actual),
+                       lambda lienzo: dibujar_hud(lienzo, orientacion_actual, patrones, arma_actual))
+
+    def boton_nuevo_patron(self, ui, calibrado):
+        self._componer(ui, ("boton", calibrado), lambda lienzo: dibujar_boton_nuevo_patron(lienzo, calibrado))
+
+    def mensaje_calibracion(self, ui, orientacion, tiempo_restante, num_muestras):
+        # El título cambia una vez por segundo (cacheado); el contador de muestras cambia cada frame
+        self._componer(ui, ("calibracion", orientacion, tiempo_restante), lambda lienzo: cv2.putText(
+            lienzo, f"CALIBRANDO {orientacion}: {tiempo_restante}s", (50, 250), cv2.FONT_HERSHEY_DUPLEX, 1.0, (0, 165, 255), 3))
+        cv2.putText(ui, f"Muestras capturadas: {num_muestras}", (50, 290), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+    def mensaje_prescalibracion(self, ui):
+        self._componer(ui, ("prescalibracion",), mostrar_mensaje_prescalibracion)
+
+    def score(self, ui, score):
+        self._componer(ui, ("score", score), lambda lienzo: dibujar_score(lienzo, score))